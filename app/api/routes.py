@@ -1,22 +1,75 @@
 from __future__ import annotations
 
 import json
+from collections.abc import AsyncIterator
 from pathlib import Path
+from typing import Literal
 from uuid import uuid4
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile, status
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile, status
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from app.core.config import get_settings
 from app.db.models import ImportError, ImportJob
 from app.db.session import get_db
-from app.schemas import ImportErrorItem, ImportJobResponse, ImportResult, PreviewResponse, TransformOptions
-from app.services.excel_reader import ExcelReadError, read_excel_bytes
-from app.services.excel_writer import dataframe_to_excel_bytes
-from app.services.import_service import import_dataframe_to_db
-from app.services.rules_engine import apply_business_rules
+from app.schemas import (
+    BatchImportResult,
+    CacheStats,
+    ImportAccepted,
+    ImportErrorItem,
+    ImportErrorPage,
+    ImportJobResponse,
+    ImportResult,
+    PreviewResponse,
+    TransformOptions,
+)
+from app.services.batch_import import import_uploads_batch
+from app.services.cpu_pool import run_cpu_bound
+from app.services.error_export import ERROR_EXPORT_COLUMNS, iter_error_blocks
+from app.services.excel_reader import ExcelReadError, SheetSelector, resolve_sheets
+from app.services.excel_writer import (
+    OUTPUT_FORMATS,
+    dataframe_to_parquet_bytes,
+    iter_bytes,
+    iter_csv_bytes,
+    iter_csv_records,
+    iter_xlsx_bytes,
+    iter_xlsx_records,
+    iter_xlsx_workbook,
+    parquet_available,
+)
+from app.services.import_jobs import ImportQueueFullError, ImportResumeError, enqueue_import, resume_import
+from app.services.import_service import (
+    create_batch_job,
+    import_batch_to_db,
+    import_dataframe_to_db,
+    import_excel_stream_to_db,
+)
+from app.services.metrics import OPENMETRICS_CONTENT_TYPE, PROMETHEUS_CONTENT_TYPE, StageTimer, render_metrics
+from app.services.pipeline import (
+    PreviewQueryError,
+    build_preview,
+    load_import_sheets,
+    load_import_workbook,
+    query_preview_frame,
+    transform_sheets,
+    transform_upload,
+)
+from app.services.preview_store import get_preview_store
+from app.services.profiling import admin_allowed, list_profiles, profile_path, run_in_threadpool
+from app.services.rules_engine import RuleEngineResult
+from app.services.uploads import (
+    ZIP_EXTENSION,
+    SpooledUpload,
+    close_uploads,
+    extract_zip_upload,
+    max_batch_upload_bytes,
+    spool_upload,
+)
+from app.services.workbook_cache import get_workbook_cache
 
 settings = get_settings()
 router = APIRouter(prefix=settings.api_prefix, tags=["api"])
@@ -31,131 +84,487 @@ def _parse_options(config_raw: str | None) -> TransformOptions:
         raise HTTPException(status_code=400, detail=f"Invalid config payload: {exc}") from exc
 
 
+def _parse_sheets(sheets_raw: str | None) -> SheetSelector | None:
+    """"all" หรือ JSON array ของชื่อ/ตำแหน่ง sheet (เริ่มที่ 0) เช่น ["สาขา 1", 2] ไม่ส่ง = sheet แรกแบบเดิม"""
+    if not sheets_raw:
+        return None
+    if sheets_raw.strip().lower() == "all":
+        return "all"
+    try:
+        value = json.loads(sheets_raw)
+    except ValueError:
+        value = None
+    if (
+        not isinstance(value, list)
+        or not value
+        or not all(isinstance(item, (str, int)) and not isinstance(item, bool) for item in value)
+    ):
+        raise HTTPException(
+            status_code=400, detail='Invalid sheets: use "all" or a JSON array of sheet names or indexes.'
+        )
+    return value
+
+
+async def _resolve_sheets(upload: SpooledUpload, selector: SheetSelector) -> list[str]:
+    try:
+        return await run_in_threadpool(resolve_sheets, upload.path, upload.filename, selector)
+    except ExcelReadError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def _sheet_issues(results: dict[str, RuleEngineResult]) -> list[str]:
+    return [f"{sheet}: {issue}" for sheet, result in results.items() for issue in result.issues]
+
+
 def _validate_file(file: UploadFile):
     ext = Path(file.filename or "").suffix.lower()
     if ext not in settings.allowed_extensions:
         raise HTTPException(status_code=400, detail=f"File extension {ext or 'unknown'} is not allowed.")
 
 
+async def _spooled_file(file: UploadFile = File(...)) -> AsyncIterator[SpooledUpload]:
+    """ตรวจนามสกุลแล้ว spool ไฟล์ลงดิสก์ (413 ถ้าเกิน MAX_UPLOAD_SIZE_MB) ลบ spool file เมื่อจบ request"""
+    _validate_file(file)
+    upload = await spool_upload(file)
+    try:
+        yield upload
+    finally:
+        upload.close()
+
+
+async def _spooled_batch(files: list[UploadFile] = File(...)) -> AsyncIterator[list[SpooledUpload]]:
+    """spool ทุกไฟล์ของ batch (.zip จะถูกแตกเฉพาะไฟล์ Excel ข้างใน) จำกัดจำนวนไฟล์ที่ MAX_BATCH_FILES
+    ลบทุก spool file เมื่อจบ request"""
+    uploads: list[SpooledUpload] = []
+    try:
+        for file in files:
+            if Path(file.filename or "").suffix.lower() != ZIP_EXTENSION:
+                _validate_file(file)
+                uploads.append(await spool_upload(file))
+                continue
+            archive = await spool_upload(file, batch=True)
+            try:
+                uploads.extend(
+                    await run_in_threadpool(
+                        extract_zip_upload, archive, settings.allowed_extensions, max_batch_upload_bytes()
+                    )
+                )
+            finally:
+                archive.close()
+        if not uploads:
+            raise HTTPException(status_code=400, detail="No Excel files found in the upload.")
+        if len(uploads) > settings.max_batch_files:
+            raise HTTPException(
+                status_code=400, detail=f"Too many files in batch. Max is {settings.max_batch_files} files."
+            )
+        yield uploads
+    finally:
+        close_uploads(uploads)
+
+
+def _database_unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=(
+            "Database connection failed while importing data. "
+            "Please verify SQL Server credentials and database access."
+        ),
+    )
+
+
+def _enqueue_import(
+    request: Request,
+    db: Session,
+    upload: SpooledUpload,
+    kind: str,
+    options: TransformOptions | None = None,
+    streaming: bool = False,
+    sheets: list[str] | None = None,
+) -> JSONResponse:
+    correlation_id = getattr(request.state, "correlation_id", str(uuid4()))
+    try:
+        job = enqueue_import(
+            db,
+            upload.path,
+            filename=upload.filename,
+            correlation_id=correlation_id,
+            kind=kind,
+            options=options,
+            streaming=streaming,
+            sheets=sheets,
+        )
+    except ImportQueueFullError as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc)) from exc
+    except SQLAlchemyError as exc:
+        db.rollback()
+        raise _database_unavailable() from exc
+    accepted = ImportAccepted(
+        job_id=job.id,
+        status=job.status,
+        filename=job.filename,
+        correlation_id=job.correlation_id,
+        child_job_ids=job.child_job_ids,
+    )
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=accepted.model_dump())
+
+
 @router.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    """Prometheus text format ถ้า Accept ขอ OpenMetrics จะมี exemplar correlation_id ของ request ล่าสุดในแต่ละ bucket"""
+    openmetrics = "application/openmetrics-text" in request.headers.get("accept", "")
+    return PlainTextResponse(
+        render_metrics(openmetrics),
+        media_type=OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE,
+    )
+
+
+@router.get("/admin/profiles", response_model=list[str])
+def list_request_profiles(request: Request):
+    """correlation id ของ request ที่มี profile เก็บไว้ (ใหม่สุดก่อน) ใช้ได้เมื่อเปิด PROFILING_ENABLED"""
+    if not admin_allowed(request.headers):
+        raise HTTPException(status_code=404, detail="Not found")
+    return list_profiles()
+
+
+@router.get("/admin/profiles/{correlation_id}")
+def get_request_profile(correlation_id: str, request: Request):
+    """collapsed stack ("frame;frame;... count") เปิดด้วย flamegraph.pl หรือ speedscope ได้"""
+    if not admin_allowed(request.headers):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = profile_path(correlation_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {correlation_id} not found.")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=path.name)
+
+
+def _stage_timer(request: Request) -> StageTimer:
+    return StageTimer(getattr(request.state, "correlation_id", None))
+
+
+@router.get("/cache/stats", response_model=CacheStats)
+def cache_stats():
+    return get_workbook_cache().stats()
+
+
 @router.post("/preview", response_model=PreviewResponse)
-async def preview(file: UploadFile = File(...), config: str | None = Form(default=None)):
-    _validate_file(file)
+async def preview(
+    request: Request,
+    upload: SpooledUpload = Depends(_spooled_file),
+    config: str | None = Form(default=None),
+):
     options = _parse_options(config)
-    content = await file.read()
     try:
-        df = read_excel_bytes(content, file.filename)
+        result = await transform_upload(upload.path, upload.filename, options, _stage_timer(request), upload.digest)
     except ExcelReadError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    token = get_preview_store().put(result) if not result.issues else None
+    return build_preview(result, token=token)
 
-    result = apply_business_rules(df, options)
-    preview_df = result.dataframe.head(200)
-    return PreviewResponse(
-        columns=[str(col) for col in preview_df.columns.tolist()],
-        rows=preview_df.where(preview_df.notna(), None).to_dict(orient="records"),
-        stats=result.stats,
-        issues=result.issues,
+
+@router.get("/preview/{token}", response_model=PreviewResponse)
+def preview_page(
+    token: str,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=200, ge=1),
+    sort_by: str | None = None,
+    descending: bool = False,
+    rule_applied: str | None = None,
+    is_duplicate_tank: bool | None = None,
+):
+    result = get_preview_store().get(token)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Preview token not found or expired. Please upload the file again.")
+    try:
+        frame = query_preview_frame(
+            result.dataframe,
+            rule_applied=rule_applied,
+            is_duplicate_tank=is_duplicate_tank,
+            sort_by=sort_by,
+            descending=descending,
+        )
+    except PreviewQueryError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return build_preview(
+        result,
+        token=token,
+        frame=frame,
+        offset=offset,
+        limit=min(limit, settings.preview_max_page_size),
     )
 
 
 @router.post("/transform")
-async def transform(file: UploadFile = File(...), config: str | None = Form(default=None)):
-    _validate_file(file)
+async def transform(
+    request: Request,
+    upload: SpooledUpload = Depends(_spooled_file),
+    config: str | None = Form(default=None),
+    output_format: Literal["xlsx", "csv", "parquet"] = Form(default="xlsx", alias="format"),
+    sheets: str | None = Form(default=None),
+):
     options = _parse_options(config)
-    content = await file.read()
+    selector = _parse_sheets(sheets)
+    if output_format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet output requires pyarrow or fastparquet.")
+    if selector is not None:
+        return await _transform_sheets(request, upload, options, selector, output_format)
     try:
-        df = read_excel_bytes(content, file.filename)
+        result = await transform_upload(upload.path, upload.filename, options, _stage_timer(request), upload.digest)
     except ExcelReadError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    result = apply_business_rules(df, options)
     if result.issues:
         return JSONResponse(status_code=422, content={"issues": result.issues})
-    data = dataframe_to_excel_bytes(result.dataframe)
-    headers = {"Content-Disposition": 'attachment; filename="finance-screening-output.xlsx"'}
-    return StreamingResponse(
-        iter([data]),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers=headers,
-    )
+    # xlsx/csv สร้างทีละ chunk ใน threadpool ระหว่างส่ง response ส่วน parquet ต้องเขียนทั้งไฟล์ก่อน
+    if output_format == "parquet":
+        body = iter_bytes(await run_cpu_bound(dataframe_to_parquet_bytes, result.dataframe))
+    elif output_format == "csv":
+        body = iter_csv_bytes(result.dataframe)
+    else:
+        body = iter_xlsx_bytes(result.dataframe)
+    media_type, extension = OUTPUT_FORMATS[output_format]
+    headers = {"Content-Disposition": f'attachment; filename="finance-screening-output.{extension}"'}
+    return StreamingResponse(body, media_type=media_type, headers=headers)
 
 
-@router.post("/transform-import", response_model=ImportResult)
+async def _transform_sheets(
+    request: Request,
+    upload: SpooledUpload,
+    options: TransformOptions,
+    selector: SheetSelector,
+    output_format: str,
+) -> Response:
+    """transform หลาย sheet ขนานกันแล้วรวมเป็น workbook เดียว หนึ่ง sheet ผลลัพธ์ต่อ sheet ที่เลือก
+    csv/parquet เก็บได้ตารางเดียวจึงรับเฉพาะกรณีเลือก sheet เดียว"""
+    names = await _resolve_sheets(upload, selector)
+    if output_format != "xlsx" and len(names) > 1:
+        raise HTTPException(status_code=400, detail="Multiple sheets can only be written as xlsx.")
+    timers = {name: _stage_timer(request) for name in names}
+    try:
+        results = await transform_sheets(upload.path, upload.filename, options, timers, upload.digest)
+    except ExcelReadError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    issues = _sheet_issues(results)
+    if issues:
+        return JSONResponse(status_code=422, content={"issues": issues})
+    if output_format == "parquet":
+        body = iter_bytes(await run_cpu_bound(dataframe_to_parquet_bytes, results[names[0]].dataframe))
+    elif output_format == "csv":
+        body = iter_csv_bytes(results[names[0]].dataframe)
+    else:
+        body = iter_xlsx_workbook({name: result.dataframe for name, result in results.items()})
+    media_type, extension = OUTPUT_FORMATS[output_format]
+    headers = {"Content-Disposition": f'attachment; filename="finance-screening-output.{extension}"'}
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+@router.post("/transform-import", response_model=ImportResult | BatchImportResult)
 async def transform_import(
     request: Request,
-    file: UploadFile = File(...),
+    upload: SpooledUpload = Depends(_spooled_file),
     config: str | None = Form(default=None),
+    async_mode: bool = Form(default=False),
+    sheets: str | None = Form(default=None),
     db: Session = Depends(get_db),
 ):
-    _validate_file(file)
     options = _parse_options(config)
-    content = await file.read()
+    selector = _parse_sheets(sheets)
+    names = await _resolve_sheets(upload, selector) if selector is not None else None
+    if async_mode:
+        return _enqueue_import(request, db, upload, kind="transform", options=options, sheets=names)
+    if names is not None:
+        return await _transform_import_sheets(request, db, upload, options, names)
+    timer = _stage_timer(request)
     try:
-        df = read_excel_bytes(content, file.filename)
+        result = await transform_upload(upload.path, upload.filename, options, timer, upload.digest)
     except ExcelReadError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    result = apply_business_rules(df, options)
     if result.issues:
         return JSONResponse(status_code=422, content={"issues": result.issues})
     correlation_id = getattr(request.state, "correlation_id", str(uuid4()))
     try:
-        return import_dataframe_to_db(
+        return await run_in_threadpool(
+            import_dataframe_to_db,
             db=db,
             frame=result.dataframe,
-            filename=file.filename or "finance-screening-output.xlsx",
+            filename=upload.filename,
             correlation_id=correlation_id,
+            timer=timer,
         )
     except SQLAlchemyError as exc:
         db.rollback()
-        raise HTTPException(
-            status_code=503,
-            detail=(
-                "Database connection failed while importing data. "
-                "Please verify SQL Server credentials and database access."
+        raise _database_unavailable() from exc
+
+
+async def _transform_import_sheets(
+    request: Request,
+    db: Session,
+    upload: SpooledUpload,
+    options: TransformOptions,
+    names: list[str],
+) -> BatchImportResult | JSONResponse:
+    """transform ทุก sheet ขนานกัน ถ้าไม่มี issue ค่อย import ทีละ sheet เป็น job ลูกของ job แม่ kind="batch" """
+    timers = {name: _stage_timer(request) for name in names}
+    try:
+        results = await transform_sheets(upload.path, upload.filename, options, timers, upload.digest)
+    except ExcelReadError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    issues = _sheet_issues(results)
+    if issues:
+        return JSONResponse(status_code=422, content={"issues": issues})
+    correlation_id = getattr(request.state, "correlation_id", str(uuid4()))
+
+    def run() -> BatchImportResult:
+        children = [(upload.filename, name) for name in names]
+        parent = create_batch_job(db, upload.filename, correlation_id, children, kind="transform")
+        return import_batch_to_db(
+            db,
+            parent,
+            lambda child: import_dataframe_to_db(
+                db=db,
+                frame=results[child.sheet_name].dataframe,
+                filename=upload.filename,
+                job=child,
+                timer=timers[child.sheet_name],
             ),
-        ) from exc
+        )
+
+    try:
+        return await run_in_threadpool(run)
+    except SQLAlchemyError as exc:
+        db.rollback()
+        raise _database_unavailable() from exc
+
+
+async def _upload_import_sheets(
+    request: Request,
+    db: Session,
+    upload: SpooledUpload,
+    names: list[str],
+    streaming: bool,
+) -> BatchImportResult:
+    """import ตรงหลาย sheet: อ่านทุก sheet ขนานกันบน cpu_pool แล้ว import ทีละ sheet เป็น job ลูก
+    แบบ streaming อ่านและ import ทีละ chunk ของแต่ละ sheet ตามลำดับ (หน่วยความจำตามขนาด chunk)"""
+    correlation_id = getattr(request.state, "correlation_id", str(uuid4()))
+    timers = {name: _stage_timer(request) for name in names}
+    frames = None
+    if not streaming:
+        try:
+            frames = await load_import_sheets(upload.path, upload.filename, timers, upload.digest)
+        except ExcelReadError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
 
+    def import_sheet(child: ImportJob) -> ImportResult:
+        if frames is None:
+            return import_excel_stream_to_db(
+                db=db,
+                source=upload.path,
+                filename=upload.filename,
+                job=child,
+                timer=timers[child.sheet_name],
+                sheet=child.sheet_name,
+            )
+        return import_dataframe_to_db(
+            db=db,
+            frame=frames[child.sheet_name],
+            filename=upload.filename,
+            job=child,
+            timer=timers[child.sheet_name],
+        )
 
-@router.post("/imports/upload", response_model=ImportResult, status_code=status.HTTP_201_CREATED)
+    def run() -> BatchImportResult:
+        children = [(upload.filename, name) for name in names]
+        parent = create_batch_job(db, upload.filename, correlation_id, children, kind="upload")
+        return import_batch_to_db(db, parent, import_sheet)
+
+    try:
+        return await run_in_threadpool(run)
+    except ExcelReadError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    except SQLAlchemyError as exc:
+        db.rollback()
+        raise _database_unavailable() from exc
+
+
+@router.post(
+    "/imports/upload",
+    response_model=ImportResult | BatchImportResult,
+    status_code=status.HTTP_201_CREATED,
+)
 async def upload_import(
     request: Request,
-    file: UploadFile = File(...),
+    upload: SpooledUpload = Depends(_spooled_file),
+    streaming: bool = Form(default=False),
+    async_mode: bool = Form(default=False),
+    sheets: str | None = Form(default=None),
     db: Session = Depends(get_db),
 ):
-    _validate_file(file)
-    raw_bytes = await file.read()
-    max_size = settings.max_upload_size_mb * 1024 * 1024
-    if len(raw_bytes) > max_size:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"File is too large. Max size is {settings.max_upload_size_mb} MB.",
-        )
+    selector = _parse_sheets(sheets)
+    names = await _resolve_sheets(upload, selector) if selector is not None else None
+    if async_mode:
+        return _enqueue_import(request, db, upload, kind="upload", streaming=streaming, sheets=names)
+    if names is not None:
+        return await _upload_import_sheets(request, db, upload, names, streaming)
+    correlation_id = getattr(request.state, "correlation_id", str(uuid4()))
+    timer = _stage_timer(request)
+    if streaming:
+        try:
+            return await run_in_threadpool(
+                import_excel_stream_to_db,
+                db=db,
+                source=upload.path,
+                filename=upload.filename,
+                correlation_id=correlation_id,
+                timer=timer,
+            )
+        except ExcelReadError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        except SQLAlchemyError as exc:
+            db.rollback()
+            raise _database_unavailable() from exc
     try:
-        frame = read_excel_bytes(raw_bytes, file.filename)
+        frame = await load_import_workbook(upload.path, upload.filename, timer, upload.digest)
     except ExcelReadError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
-    correlation_id = getattr(request.state, "correlation_id", str(uuid4()))
     try:
-        return import_dataframe_to_db(
+        return await run_in_threadpool(
+            import_dataframe_to_db,
             db=db,
             frame=frame,
-            filename=file.filename or "unknown.xlsx",
+            filename=upload.filename,
             correlation_id=correlation_id,
+            timer=timer,
         )
     except SQLAlchemyError as exc:
         db.rollback()
-        raise HTTPException(
-            status_code=503,
-            detail=(
-                "Database connection failed while importing data. "
-                "Please verify SQL Server credentials and database access."
-            ),
-        ) from exc
+        raise _database_unavailable() from exc
+
+
+@router.post("/imports/batch", response_model=BatchImportResult, status_code=status.HTTP_201_CREATED)
+async def batch_import(
+    request: Request,
+    uploads: list[SpooledUpload] = Depends(_spooled_batch),
+    transform: bool = Form(default=False),
+    config: str | None = Form(default=None),
+    db: Session = Depends(get_db),
+):
+    """import หลายไฟล์ (หรือ .zip) ใน request เดียว คืน job แม่ (batch id) กับผลของ job ลูกหนึ่ง job ต่อไฟล์
+    transform=true รัน rules ก่อน import (แบบ /transform-import) ส่วนค่าเริ่มต้น import ตรงแบบ /imports/upload"""
+    options = _parse_options(config) if transform else None
+    correlation_id = getattr(request.state, "correlation_id", str(uuid4()))
+    filename = uploads[0].filename if len(uploads) == 1 else f"{len(uploads)} files"
+    try:
+        return await import_uploads_batch(db, uploads, filename, correlation_id, options)
+    except SQLAlchemyError as exc:
+        db.rollback()
+        raise _database_unavailable() from exc
 
 
 @router.get("/imports/{job_id}", response_model=ImportJobResponse)
@@ -166,17 +575,79 @@ def get_import_job(job_id: int, db: Session = Depends(get_db)):
     return ImportJobResponse.model_validate(job)
 
 
-@router.get("/imports/{job_id}/errors", response_model=list[ImportErrorItem])
-def get_import_errors(job_id: int, db: Session = Depends(get_db)):
+@router.post("/imports/{job_id}/resume", response_model=ImportAccepted, status_code=status.HTTP_202_ACCEPTED)
+def resume_import_job(job_id: int, db: Session = Depends(get_db)):
+    """ทำ import ที่ล้มกลางทางต่อจาก checkpoint ด้วยไฟล์ที่เก็บไว้ (เฉพาะ job แบบ async_mode)"""
     job = db.get(ImportJob, job_id)
     if not job:
         raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
-    rows = db.query(ImportError).filter(ImportError.job_id == job_id).all()
-    return [
-        ImportErrorItem(
-            row_number=item.row_number,
-            column_name=item.column_name,
-            error_message=item.error_message,
-        )
-        for item in rows
-    ]
+    try:
+        job = resume_import(db, job)
+    except ImportResumeError as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc)) from exc
+    except ImportQueueFullError as exc:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(exc)) from exc
+    except SQLAlchemyError as exc:
+        db.rollback()
+        raise _database_unavailable() from exc
+    return ImportAccepted(
+        job_id=job.id,
+        status=job.status,
+        filename=job.filename,
+        correlation_id=job.correlation_id,
+    )
+
+
+@router.get("/imports/{job_id}/errors", response_model=ImportErrorPage)
+def get_import_errors(
+    job_id: int,
+    response: Response,
+    after: int | None = Query(default=None, ge=0),
+    limit: int = Query(default=1000, ge=1, le=10000),
+    db: Session = Depends(get_db),
+):
+    """keyset pagination บน (job_id, id): ส่ง after = next_cursor ของหน้าก่อนหน้าเพื่อดูหน้าถัดไป
+    index ของ job_id มี id (clustered key) อยู่แล้ว จึงไม่ต้องสร้าง index ใหม่"""
+    job = db.get(ImportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    stmt = select(ImportError.id, ImportError.row_number, ImportError.column_name, ImportError.error_message).where(
+        ImportError.job_id == job_id
+    )
+    if after is not None:
+        stmt = stmt.where(ImportError.id > after)
+    rows = db.execute(stmt.order_by(ImportError.id).limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return ImportErrorPage(
+        items=[
+            ImportErrorItem(
+                row_number=item.row_number,
+                column_name=item.column_name,
+                error_message=item.error_message,
+            )
+            for item in rows
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/imports/{job_id}/errors/export")
+def export_import_errors(
+    job_id: int,
+    output_format: Literal["csv", "xlsx"] = Query(default="csv", alias="format"),
+    db: Session = Depends(get_db),
+):
+    job = db.get(ImportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    if output_format == "xlsx":
+        body = iter_xlsx_records(ERROR_EXPORT_COLUMNS, iter_error_blocks(job_id))
+    else:
+        body = iter_csv_records(ERROR_EXPORT_COLUMNS, iter_error_blocks(job_id))
+    media_type, extension = OUTPUT_FORMATS[output_format]
+    headers = {"Content-Disposition": f'attachment; filename="import-{job_id}-errors.{extension}"'}
+    return StreamingResponse(body, media_type=media_type, headers=headers)
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from functools import lru_cache
 from pathlib import Path
+from typing import Literal
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -21,6 +22,36 @@ class Settings(BaseSettings):
     )
     max_upload_size_mb: int = 20
     allowed_extensions: list[str] = [".xlsx", ".xls"]
+    import_batch_size: int = 5000
+    import_chunk_rows: int = 10000
+    import_commit_rows: int = 10000
+    import_worker_count: int = 2
+    import_queue_limit: int = 20
+    import_buddhist_era: bool = True
+    max_batch_files: int = 100
+    max_batch_upload_size_mb: int = 500
+    import_batch_parallelism: int = 4
+    excel_reader_engine: Literal["auto", "calamine", "openpyxl", "openpyxl-stream", "xlrd"] = "auto"
+    excel_reader_calamine_max_mb: int = 200
+    dataframe_compact_dtypes: bool = False
+    dataframe_category_max_ratio: float = 0.5
+    import_error_response_limit: int = 100
+    import_error_example_rows: int = 5
+    cpu_pool_mode: Literal["process", "thread"] = "process"
+    cpu_pool_workers: int = 0
+    workbook_cache_max_entries: int = 32
+    workbook_cache_max_mb: int = 512
+    preview_ttl_seconds: int = 900
+    preview_max_tokens: int = 64
+    preview_max_page_size: int = 1000
+    profiling_enabled: bool = False
+    profiling_token: str | None = None
+    profiling_interval_ms: int = 5
+    profiling_max_files: int = 50
+    profiling_dir: str = str(Path(__file__).resolve().parents[2] / "storage" / "profiles")
+    upload_storage_dir: str = str(Path(__file__).resolve().parents[2] / "storage" / "uploads")
+    upload_retention_hours: int = 168
+    upload_spool_dir: str = str(Path(__file__).resolve().parents[2] / "storage" / "spool")
 
     model_config = SettingsConfigDict(
         env_file=str(ENV_FILE),
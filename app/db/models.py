@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import date, datetime
 from decimal import Decimal
 
-from sqlalchemy import Boolean, Date, DateTime, ForeignKey, Integer, Numeric, String, Text
+from sqlalchemy import Boolean, Date, DateTime, Float, ForeignKey, Integer, Numeric, String, Text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -39,6 +39,7 @@ class SalesRecord(Base):
     rule_applied: Mapped[str | None] = mapped_column(String(100), nullable=True)
     is_duplicate_tank: Mapped[bool | None] = mapped_column(Boolean, nullable=True)
     group_id: Mapped[str | None] = mapped_column(String(150), nullable=True, index=True)
+    row_fingerprint: Mapped[str | None] = mapped_column(String(64), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
@@ -55,6 +56,17 @@ class ImportJob(Base):
     total_rows: Mapped[int] = mapped_column(default=0)
     imported_rows: Mapped[int] = mapped_column(default=0)
     failed_rows: Mapped[int] = mapped_column(default=0)
+    processed_rows: Mapped[int | None] = mapped_column(default=0, nullable=True)
+    stage: Mapped[str | None] = mapped_column(String(30), nullable=True)
+    upload_path: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    # ข้อมูลสำหรับ resume: ชนิดงาน ตัวเลือก และจำนวนแถวของไฟล์ที่ commit แล้ว
+    kind: Mapped[str | None] = mapped_column(String(20), nullable=True)
+    streaming: Mapped[bool | None] = mapped_column(Boolean, default=False, nullable=True)
+    options_json: Mapped[str | None] = mapped_column(Text, nullable=True)
+    checkpoint_rows: Mapped[int | None] = mapped_column(default=0, nullable=True)
+    # ไฟล์หลาย sheet: job ต่อ sheet อยู่ใต้ job แม่ kind="batch" ซึ่งรวมตัวนับของทุก sheet
+    parent_job_id: Mapped[int | None] = mapped_column(ForeignKey("import_jobs.id"), nullable=True, index=True)
+    sheet_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
     message: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(
@@ -64,6 +76,14 @@ class ImportJob(Base):
     errors: Mapped[list["ImportError"]] = relationship(
         back_populates="job", cascade="all, delete-orphan"
     )
+    stages: Mapped[list["ImportJobStage"]] = relationship(
+        back_populates="job", cascade="all, delete-orphan", order_by="ImportJobStage.id"
+    )
+    children: Mapped[list["ImportJob"]] = relationship(order_by="ImportJob.id")
+
+    @property
+    def child_job_ids(self) -> list[int]:
+        return [child.id for child in self.children]
 
 
 class ImportError(Base):
@@ -77,3 +97,24 @@ class ImportError(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
     job: Mapped["ImportJob"] = relationship(back_populates="errors")
+
+
+class ImportJobStage(Base):
+    """เวลารวมและจำนวนแถวของแต่ละ stage ของ job (รวมทุก chunk และทุกครั้งที่ resume)"""
+
+    __tablename__ = "import_job_stages"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    job_id: Mapped[int] = mapped_column(ForeignKey("import_jobs.id"), index=True)
+    stage: Mapped[str] = mapped_column(String(30))
+    seconds: Mapped[float] = mapped_column(Float, default=0.0)
+    rows: Mapped[int] = mapped_column(default=0)
+    calls: Mapped[int] = mapped_column(default=0)
+
+    job: Mapped["ImportJob"] = relationship(back_populates="stages")
+
+    @property
+    def rows_per_second(self) -> float | None:
+        if not self.rows or self.seconds <= 0:
+            return None
+        return self.rows / self.seconds
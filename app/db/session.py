@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import MetaData, create_engine, inspect, text
 from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import Session, sessionmaker
 
@@ -33,6 +33,35 @@ def _ensure_sqlserver_database_exists(connection_string: str) -> None:
         admin_engine.dispose()
 
 
+def add_missing_columns(engine: Engine, metadata: MetaData) -> None:
+    """create_all ไม่แก้ตารางที่มีอยู่แล้ว จึงเพิ่มคอลัมน์ใหม่ (แบบ NULL ได้ พร้อม foreign key) ให้ฐานข้อมูลเดิม
+    แล้วสร้าง index ของตารางนั้นที่ยังไม่มี"""
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            added = False
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                references = "".join(
+                    f" REFERENCES {preparer.format_table(fk.column.table)} ({preparer.quote(fk.column.name)})"
+                    for fk in column.foreign_keys
+                )
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD {preparer.quote(column.name)} {column_type} NULL{references}"
+                )
+                added = True
+            if added:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+
+
 _engine: Engine | None = None
 _SessionLocal: sessionmaker[Session] | None = None
 
@@ -43,9 +72,16 @@ def get_engine() -> Engine:
     if _engine is None:
         settings = get_settings()
         _ensure_sqlserver_database_exists(settings.sqlserver_connection_string)
+        url = make_url(settings.sqlserver_connection_string)
+        # pyodbc ส่ง executemany เป็น array ครั้งเดียวแทนทีละแถว (ใช้กับ bulk insert ของ import)
+        engine_options: dict = {"fast_executemany": True} if url.drivername == "mssql+pyodbc" else {}
+        if url.get_backend_name() == "sqlite":
+            # SQLite (ใช้แทน SQL Server ตอน load test) เขียนได้ทีละ connection ให้รอ lock แทนการ error ทันที
+            engine_options["connect_args"] = {"timeout": 30}
         _engine = create_engine(
             settings.sqlserver_connection_string,
             pool_pre_ping=True,
+            **engine_options,
         )
         _SessionLocal = sessionmaker(
             bind=_engine,
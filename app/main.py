@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+import time
 from pathlib import Path
 from uuid import uuid4
 
@@ -12,26 +13,53 @@ from fastapi.staticfiles import StaticFiles
 from app.api.routes import router
 from app.core.config import get_settings
 from app.db.models import Base
-from app.db.session import get_engine
+from app.db.session import add_missing_columns, get_engine, get_session_factory
+from app.services.cpu_pool import shutdown_cpu_pool
+from app.services.import_jobs import shutdown_import_workers, sweep_stored_uploads
+from app.services.metrics import HTTP_REQUEST_SECONDS
+from app.services.profiling import RequestProfile, is_safe_profile_id, profiling_allowed
+from app.services.uploads import UploadSizeLimitMiddleware
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 app = FastAPI(title=settings.app_name)
 
+# เพิ่มก่อน middleware อื่นจึงอยู่ชั้นในสุด response 413 ยังได้ correlation id และถูกนับใน metrics
+app.add_middleware(UploadSizeLimitMiddleware, batch_paths=[f"{settings.api_prefix}/imports/batch"])
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
 @app.middleware("http")
 async def add_correlation_id(request: Request, call_next):
     request.state.correlation_id = request.headers.get("X-Correlation-ID", str(uuid4()))
-    response = await call_next(request)
+    started = time.perf_counter()
+    profile = None
+    if settings.profiling_enabled and profiling_allowed(request.headers):
+        if is_safe_profile_id(request.state.correlation_id):
+            profile = RequestProfile(request.state.correlation_id)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        if profile is not None:
+            profile.finish()
+        raise
+    if profile is not None:
+        response.body_iterator = profile.wrap_body(response.body_iterator)
     response.headers["X-Correlation-ID"] = request.state.correlation_id
+    # ใช้ path ของ route (เช่น /api/imports/{job_id}) เป็น label เพื่อไม่ให้จำนวน series โตตาม id
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        (request.method, getattr(route, "path", "unmatched"), str(response.status_code)),
+        time.perf_counter() - started,
+        request.state.correlation_id,
+    )
     return response
 
 
@@ -39,12 +67,28 @@ async def add_correlation_id(request: Request, call_next):
 def on_startup() -> None:
     """สร้างตารางเมื่อมี SQL Server พร้อม ไม่บล็อกการรันแอปถ้าเชื่อมต่อไม่ได้"""
     try:
-        Base.metadata.create_all(bind=get_engine())
+        engine = get_engine()
+        Base.metadata.create_all(bind=engine)
+        add_missing_columns(engine, Base.metadata)
     except Exception as e:
         logger.warning(
             "Could not connect to SQL Server at startup (Transform + Download still works): %s",
             e,
         )
+        return
+    try:
+        with get_session_factory()() as db:
+            removed = sweep_stored_uploads(db)
+        if removed:
+            logger.info("Removed %s stored uploads of finished or expired import jobs", removed)
+    except Exception:  # noqa: BLE001
+        logger.exception("Could not sweep stored uploads")
+
+
+@app.on_event("shutdown")
+def on_shutdown() -> None:
+    shutdown_import_workers()
+    shutdown_cpu_pool()
 
 
 app.include_router(router)
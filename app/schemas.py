@@ -38,6 +38,10 @@ class PreviewResponse(BaseModel):
     rows: list[dict]
     stats: TransformStats
     issues: list[str]
+    token: str | None = None
+    total_rows: int = 0
+    offset: int = 0
+    limit: int = 0
 
 
 class ImportErrorItem(BaseModel):
@@ -46,15 +50,71 @@ class ImportErrorItem(BaseModel):
     error_message: str
 
 
+class ImportErrorPage(BaseModel):
+    """error หนึ่งหน้า next_cursor = ค่า after ของหน้าถัดไป (None = หน้าสุดท้าย)"""
+
+    items: list[ImportErrorItem] = []
+    next_cursor: int | None = None
+
+
+class ImportErrorSummary(BaseModel):
+    column_name: str | None = None
+    count: int
+    example_rows: list[int] = []
+    example_message: str | None = None
+
+
 class ImportResult(BaseModel):
     job_id: int
     status: str
     filename: str
+    sheet_name: str | None = None
     total_rows: int
     imported_rows: int
+    inserted_rows: int = 0
+    updated_rows: int = 0
+    unchanged_rows: int = 0
+    # แถวที่ผ่านการตรวจแต่ business_key ซ้ำกับแถวหลังในไฟล์เดียวกัน (แถวหลังสุดถูกเขียนแทน)
+    # imported_rows = inserted_rows + updated_rows + unchanged_rows + duplicate_rows
+    # และ imported_rows + failed_rows = total_rows
+    duplicate_rows: int = 0
     failed_rows: int
     message: str | None = None
     errors: list[ImportErrorItem] = []
+    error_count: int = 0
+    errors_truncated: bool = False
+    error_summary: list[ImportErrorSummary] = []
+
+
+class BatchImportResult(BaseModel):
+    """ผลของ job แม่ (kind="batch") ตัวนับรวมของทุก job ลูกใน results"""
+
+    job_id: int
+    status: str
+    filename: str
+    total_rows: int
+    imported_rows: int
+    failed_rows: int
+    message: str | None = None
+    results: list[ImportResult] = []
+
+
+class ImportAccepted(BaseModel):
+    job_id: int
+    status: str
+    filename: str
+    correlation_id: str
+    child_job_ids: list[int] = []
+
+
+class ImportStageTiming(BaseModel):
+    stage: str
+    seconds: float
+    rows: int
+    calls: int
+    rows_per_second: float | None = None
+
+    model_config = {"from_attributes": True}
 
 
 class ImportJobResponse(BaseModel):
@@ -65,8 +125,28 @@ class ImportJobResponse(BaseModel):
     total_rows: int
     imported_rows: int
     failed_rows: int
+    processed_rows: int | None = None
+    checkpoint_rows: int | None = None
+    stage: str | None = None
+    kind: str | None = None
+    parent_job_id: int | None = None
+    sheet_name: str | None = None
+    child_job_ids: list[int] = []
     message: str | None = None
     created_at: datetime
     updated_at: datetime
+    stages: list[ImportStageTiming] = []
 
     model_config = {"from_attributes": True}
+
+
+class CacheStats(BaseModel):
+    entries: int
+    total_bytes: int
+    max_entries: int
+    max_bytes: int
+    frame_hits: int
+    frame_misses: int
+    rules_hits: int
+    rules_misses: int
+    evictions: int
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.db.models import ImportJob
+from app.schemas import BatchImportResult, ImportResult, TransformOptions
+from app.services.excel_reader import ExcelReadError
+from app.services.import_service import (
+    BatchEntry,
+    batch_result,
+    check_batch_frame,
+    create_batch_job,
+    failed_job_result,
+    import_batch_entries,
+    refresh_batch_job,
+    stop_batch_job,
+)
+from app.services.metrics import StageTimer
+from app.services.pipeline import load_import_workbook, transform_upload
+from app.services.profiling import run_in_threadpool
+from app.services.uploads import SpooledUpload
+
+
+class BatchFileError(Exception):
+    pass
+
+
+async def _load_frame(upload: SpooledUpload, options: TransformOptions | None, timer: StageTimer) -> pd.DataFrame:
+    if options is None:
+        return await load_import_workbook(upload.path, upload.filename, timer, upload.digest)
+    result = await transform_upload(upload.path, upload.filename, options, timer, upload.digest)
+    if result.issues:
+        raise BatchFileError("; ".join(result.issues))
+    return result.dataframe
+
+
+async def import_uploads_batch(
+    db: Session,
+    uploads: list[SpooledUpload],
+    filename: str,
+    correlation_id: str,
+    options: TransformOptions | None = None,
+) -> BatchImportResult:
+    """import หลายไฟล์ใน request เดียว: job แม่ kind="batch" กับ job ลูกหนึ่ง job ต่อไฟล์
+    อ่าน (และ transform ถ้าให้ options) ล่วงหน้าไม่เกิน IMPORT_BATCH_PARALLELISM ไฟล์บน cpu_pool
+    แล้วตรวจตามลำดับไฟล์ทันทีที่อ่านเสร็จ (ไม่ถือ DataFrame ต่อ) รวมเป็นกลุ่มละราว IMPORT_COMMIT_ROWS แถว
+    upsert และ commit ครั้งเดียวต่อกลุ่ม
+    หน่วยความจำจึงขึ้นกับ IMPORT_BATCH_PARALLELISM และ IMPORT_COMMIT_ROWS ไม่ใช่จำนวนไฟล์
+    ไฟล์ที่อ่านไม่ได้หรือมี issue เป็น failed เฉพาะ job ของไฟล์นั้น"""
+    settings = get_settings()
+    kind = "upload" if options is None else "transform"
+    children = [(upload.filename, None) for upload in uploads]
+    parent = await run_in_threadpool(create_batch_job, db, filename, correlation_id, children, kind)
+    waiting = iter(zip(parent.children, uploads))
+    reading: deque[tuple[ImportJob, StageTimer, asyncio.Future[pd.DataFrame]]] = deque()
+
+    def read_next() -> None:
+        item = next(waiting, None)
+        if item is not None:
+            job, upload = item
+            timer = StageTimer(correlation_id)
+            reading.append((job, timer, asyncio.ensure_future(_load_frame(upload, options, timer))))
+
+    for _ in range(max(settings.import_batch_parallelism, 1)):
+        read_next()
+    results: list[ImportResult] = []
+    group: list[BatchEntry] = []
+    group_rows = 0
+
+    async def flush() -> None:
+        nonlocal group, group_rows
+        if group:
+            results.extend(await run_in_threadpool(import_batch_entries, db, group))
+            group, group_rows = [], 0
+
+    try:
+        while reading:
+            # เอาออกจากคิวหลังอ่านเสร็จ ถ้าถูกยกเลิกระหว่างรอ task นี้ยังถูก cancel ด้านล่าง
+            job, timer, task = reading[0]
+            try:
+                frame = await task
+            except (ExcelReadError, BatchFileError) as exc:
+                reading.popleft()
+                read_next()
+                # flush ก่อนเพื่อให้ผลเรียงตามลำดับไฟล์
+                await flush()
+                results.append(await run_in_threadpool(failed_job_result, db, job, str(exc)))
+                continue
+            reading.popleft()
+            # future ที่เสร็จแล้วถือ DataFrame ไว้ ปล่อยทั้งคู่หลังส่งให้ตรวจ
+            del task
+            read_next()
+            checked = await run_in_threadpool(check_batch_frame, db, job, frame, timer)
+            del frame
+            if isinstance(checked, ImportResult):
+                await flush()
+                results.append(checked)
+                continue
+            group.append(checked)
+            group_rows += checked.total_rows
+            if group_rows >= settings.import_commit_rows:
+                await flush()
+        await flush()
+    except BaseException as exc:
+        for _, _, task in reading:
+            task.cancel()
+        await asyncio.gather(*(task for _, _, task in reading), return_exceptions=True)
+        await run_in_threadpool(stop_batch_job, db, parent, f"Batch stopped: {exc!r}")
+        raise
+
+    parent = await run_in_threadpool(refresh_batch_job, db, parent)
+    return batch_result(parent, results)
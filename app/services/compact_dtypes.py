@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import importlib.util
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+from app.core.config import get_settings
+
+
+def arrow_strings_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def compact_enabled() -> bool:
+    return get_settings().dataframe_compact_dtypes
+
+
+def _is_text_column(series: pd.Series) -> bool:
+    if isinstance(series.dtype, pd.StringDtype):
+        return True
+    # object ที่มีตัวเลขปน factorize จะรวม 1 กับ 1.0/True เป็นค่าเดียว จึงรับเฉพาะที่เป็นข้อความล้วน
+    return series.dtype == object and infer_dtype(series, skipna=True) in {"string", "empty"}
+
+
+def compact_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """ลดหน่วยความจำของคอลัมน์ข้อความ (แก้ frame ที่ส่งมาและคืนตัวเดิม) ค่าทุก cell ยังเหมือนเดิม:
+    - ค่าไม่ซ้ำไม่เกิน DATAFRAME_CATEGORY_MAX_RATIO ของจำนวนแถว (เช่น รายการ, rule_applied, ยกเลิก) เป็น category
+    - คอลัมน์ str ที่เหลือ (ชื่อลูกค้า, เลขตัวถัง) เก็บใน Arrow เมื่อติดตั้ง pyarrow (ความหมายของ NaN เหมือน str เดิม)
+    คอลัมน์ object ที่มีค่าหลายชนิดปนกัน (วันที่/ตัวเลข/ข้อความ) คงไว้ตามเดิม"""
+    if frame.empty:
+        return frame
+    max_ratio = get_settings().dataframe_category_max_ratio
+    arrow = arrow_strings_available()
+    for position in range(frame.shape[1]):
+        series = frame.iloc[:, position]
+        if not _is_text_column(series):
+            continue
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        if len(uniques) <= max_ratio * len(series):
+            categorical = pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype=object))
+            frame.isetitem(position, pd.Series(categorical, index=frame.index, name=series.name))
+        elif arrow and isinstance(series.dtype, pd.StringDtype) and series.dtype.storage != "pyarrow":
+            frame.isetitem(position, series.astype(pd.StringDtype("pyarrow", na_value=series.dtype.na_value)))
+    return frame
+
+
+def map_categories(series: pd.Series, func: Callable[[pd.Series], pd.Series]) -> pd.Series:
+    """ผลของ func(series) สำหรับคอลัมน์ category โดยเรียก func กับค่าไม่ซ้ำครั้งเดียวแล้วกระจายตาม codes
+    categories ถูกส่งเป็น object Series ต่อท้ายด้วย NaN หนึ่งตัวแทนค่าว่าง (code -1 จึงชี้ไปที่ตัวสุดท้าย)"""
+    categories = pd.Series([*series.cat.categories.tolist(), np.nan], dtype=object)
+    mapped = func(categories)
+    return pd.Series(mapped.to_numpy()[series.cat.codes.to_numpy()], index=series.index, dtype=mapped.dtype)
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, TypeVar
+
+from app.core.config import get_settings
+from app.services.profiling import run_for_request
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+
+
+def _worker_count() -> int:
+    return get_settings().cpu_pool_workers or os.cpu_count() or 1
+
+
+def _create_executor() -> Executor:
+    if get_settings().cpu_pool_mode == "process":
+        try:
+            # spawn ไม่ fork thread ของ uvicorn ติดไปด้วย
+            return ProcessPoolExecutor(
+                max_workers=_worker_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        except (OSError, NotImplementedError, ValueError) as exc:
+            logger.warning("Process pool unavailable, falling back to threads: %s", exc)
+    return ThreadPoolExecutor(max_workers=_worker_count(), thread_name_prefix="cpu-worker")
+
+
+def _get_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = _create_executor()
+        return _executor
+
+
+def _fallback_to_threads(broken: Executor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = ThreadPoolExecutor(max_workers=_worker_count(), thread_name_prefix="cpu-worker")
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_cpu_pool() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+
+
+def _run_in_context(context: contextvars.Context, call: Callable[[], T]) -> T:
+    # แบบเดียวกับ run_in_threadpool: thread เห็น contextvars ของ request และถูกนับใน profile ของ request
+    return context.run(run_for_request, call)
+
+
+def _submit(
+    loop: asyncio.AbstractEventLoop, executor: Executor, func: Callable[..., T], *args: Any
+) -> asyncio.Future[T]:
+    call = partial(func, *args)
+    if isinstance(executor, ThreadPoolExecutor):
+        call = partial(_run_in_context, contextvars.copy_context(), call)
+    return loop.run_in_executor(executor, call)
+
+
+async def run_cpu_bound(func: Callable[..., T], *args: Any) -> T:
+    """รันงาน CPU หนัก (parse/rules/เขียนไฟล์) นอก event loop บน process pool ถ้าใช้ไม่ได้จะใช้ thread pool แทน
+    func และ args ต้อง pickle ได้ (ฟังก์ชันระดับ module)"""
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    try:
+        return await _submit(loop, executor, func, *args)
+    except BrokenProcessPool:
+        logger.warning("Process pool is broken, falling back to threads")
+        _fallback_to_threads(executor)
+        return await _submit(loop, _get_executor(), func, *args)
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from collections.abc import Iterator
+
+from sqlalchemy import select
+
+from app.db.models import ImportError
+from app.db.session import get_session_factory
+
+ERROR_EXPORT_COLUMNS = ["row_number", "column_name", "error_message"]
+ERROR_EXPORT_BLOCK_ROWS = 2000
+
+
+def iter_error_blocks(job_id: int, block_rows: int = ERROR_EXPORT_BLOCK_ROWS) -> Iterator[list[tuple]]:
+    """อ่าน error ของ job เรียงตาม id ผ่าน server-side cursor (yield_per) ทีละ block_rows แถว
+    เปิด session ของตัวเองเพราะ generator ถูกอ่านระหว่างส่ง response หลัง session ของ request ปิดไปแล้ว"""
+    db = get_session_factory()()
+    try:
+        stmt = (
+            select(ImportError.row_number, ImportError.column_name, ImportError.error_message)
+            .where(ImportError.job_id == job_id)
+            .order_by(ImportError.id)
+            .execution_options(yield_per=block_rows)
+        )
+        for partition in db.execute(stmt).partitions():
+            yield [tuple(row) for row in partition]
+    finally:
+        db.close()
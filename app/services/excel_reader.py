@@ -1,20 +1,289 @@
 from __future__ import annotations
 
+import importlib.util
+import os
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
 from io import BytesIO
+from typing import Any, BinaryIO, Literal
 
+import numpy as np
 import pandas as pd
+from pandas.io.parsers import TextParser
+
+from app.core.config import get_settings
+from app.services.compact_dtypes import compact_enabled, compact_frame
 
 
 class ExcelReadError(Exception):
     pass
 
 
-def read_excel_bytes(content: bytes, filename: str | None = None) -> pd.DataFrame:
-    lower_name = (filename or "").lower()
-    engine = "xlrd" if lower_name.endswith(".xls") else "openpyxl"
+# รับชื่อคอลัมน์ทั้งหมดของ sheet (หลัง pandas เติม .1 ให้ชื่อซ้ำ) คืนตำแหน่งคอลัมน์ที่ต้องการอ่าน
+ColumnSelector = Callable[[list[Any]], list[int]]
+SOURCE_COLUMNS_ATTR = "source_columns"
+# bytes ในหน่วยความจำ หรือ path ของไฟล์บนดิสก์ (upload ที่ spool ไว้, ไฟล์ที่เก็บของ job)
+ExcelSource = bytes | str | os.PathLike
+# ชื่อ sheet หรือตำแหน่ง (เริ่มที่ 0) ส่วน SheetSelector คือค่าที่ผู้ใช้ส่งมา: "all" หรือรายการชื่อ/ตำแหน่ง
+SheetRef = str | int
+SheetSelector = Literal["all"] | list[SheetRef]
+ReaderFunc = Callable[[ExcelSource, ColumnSelector | None, SheetRef], pd.DataFrame]
+
+
+def _open_source(source: ExcelSource) -> BinaryIO | str:
+    """path ส่งให้ engine เปิดเอง (openpyxl อ่าน zip จากดิสก์ทีละส่วน, xlrd ใช้ mmap)
+    ไม่ต้องโหลดทั้งไฟล์เข้าหน่วยความจำ"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return BytesIO(source)
+    return os.fspath(source)
+
+
+def _source_size(source: ExcelSource) -> int:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    return os.path.getsize(source)
+
+
+def _read_with_pandas(engine: str) -> ReaderFunc:
+    def read(source: ExcelSource, select_columns: ColumnSelector | None, sheet: SheetRef) -> pd.DataFrame:
+        if select_columns is None:
+            return pd.read_excel(_open_source(source), sheet_name=sheet, engine=engine)
+        with pd.ExcelFile(_open_source(source), engine=engine) as workbook:
+            source_columns = list(workbook.parse(sheet, nrows=0).columns)
+            frame = workbook.parse(sheet, usecols=select_columns(source_columns))
+        frame.attrs[SOURCE_COLUMNS_ATTR] = source_columns
+        return frame
+
+    return read
+
+
+def _read_openpyxl_stream(
+    source: ExcelSource, select_columns: ColumnSelector | None, sheet: SheetRef
+) -> pd.DataFrame:
+    # แปลงค่าเฉพาะ cell ของคอลัมน์ที่เลือก (pandas usecols ยังแปลงทุก cell ก่อนค่อยตัดทิ้ง)
+    return next(_iter_openpyxl_frames(source, None, select_columns, sheet), pd.DataFrame())
+
+
+def calamine_available() -> bool:
+    return importlib.util.find_spec("python_calamine") is not None
+
+
+@dataclass(frozen=True)
+class ReaderBackend:
+    name: str
+    extensions: frozenset[str]
+    read: ReaderFunc
+    available: Callable[[], bool] = lambda: True
+
+
+# ทุก backend คืน DataFrame ชุดเดียวกัน (ชื่อคอลัมน์, dtype, ค่า และ attrs["source_columns"] เมื่อเลือกคอลัมน์)
+READER_BACKENDS: dict[str, ReaderBackend] = {
+    # python-calamine (Rust) เร็วกว่า openpyxl หลายเท่า แต่โหลดทั้ง sheet เข้าหน่วยความจำ
+    "calamine": ReaderBackend(
+        "calamine", frozenset({".xlsx", ".xls"}), _read_with_pandas("calamine"), calamine_available
+    ),
+    "openpyxl": ReaderBackend("openpyxl", frozenset({".xlsx"}), _read_with_pandas("openpyxl")),
+    "openpyxl-stream": ReaderBackend("openpyxl-stream", frozenset({".xlsx"}), _read_openpyxl_stream),
+    "xlrd": ReaderBackend("xlrd", frozenset({".xls"}), _read_with_pandas("xlrd")),
+}
+
+
+def _extension(filename: str | None) -> str:
+    return ".xls" if (filename or "").lower().endswith(".xls") else ".xlsx"
+
+
+def resolve_reader_engine(
+    source: ExcelSource,
+    filename: str | None = None,
+    select_columns: ColumnSelector | None = None,
+) -> str:
+    """เลือก backend ตาม EXCEL_READER_ENGINE ถ้าเป็น auto (หรือ engine ที่ตั้งอ่านนามสกุลนี้ไม่ได้/ไม่ได้ติดตั้ง):
+    ใช้ calamine เมื่อติดตั้งไว้และไฟล์ไม่เกิน EXCEL_READER_CALAMINE_MAX_MB ไม่อย่างนั้นใช้ engine เดิม
+    (xlrd สำหรับ .xls, openpyxl-stream เมื่อเลือกคอลัมน์ และ openpyxl เมื่ออ่านทุกคอลัมน์)"""
+    settings = get_settings()
+    extension = _extension(filename)
+    configured = READER_BACKENDS.get(settings.excel_reader_engine)
+    if configured is not None and extension in configured.extensions and configured.available():
+        return configured.name
+    if calamine_available() and _source_size(source) <= settings.excel_reader_calamine_max_mb * 1024 * 1024:
+        return "calamine"
+    if extension == ".xls":
+        return "xlrd"
+    return "openpyxl" if select_columns is None else "openpyxl-stream"
+
+
+def read_excel_bytes(
+    source: ExcelSource,
+    filename: str | None = None,
+    select_columns: ColumnSelector | None = None,
+    engine: str | None = None,
+    sheet: SheetRef = 0,
+) -> pd.DataFrame:
+    """อ่าน sheet เดียว (ค่าเริ่มต้น sheet แรก) ถ้าให้ select_columns จะดู header ก่อนแล้วอ่านเฉพาะคอลัมน์ที่เลือก
+    ชื่อคอลัมน์ทั้งหมดของไฟล์เก็บไว้ใน frame.attrs["source_columns"] (ใช้กับ mapping ตามตำแหน่ง)
+    engine ระบุ backend ใน READER_BACKENDS ตรง ๆ ได้ (ไม่ระบุ = resolve_reader_engine)
+    DATAFRAME_COMPACT_DTYPES=true จะแปลงคอลัมน์ข้อความเป็น category/Arrow ก่อนคืน (ดู compact_frame)"""
+    engine = engine or resolve_reader_engine(source, filename, select_columns)
     try:
-        return pd.read_excel(BytesIO(content), engine=engine)
+        frame = READER_BACKENDS[engine].read(source, select_columns, sheet)
     except Exception as exc:  # noqa: BLE001
         raise ExcelReadError(
             f"Cannot read excel file {filename or ''} with engine {engine}: {exc}"
         ) from exc
+    return compact_frame(frame) if compact_enabled() else frame
+
+
+def list_sheet_names(source: ExcelSource, filename: str | None = None) -> list[str]:
+    # openpyxl read-only/xlrd อ่านแค่ส่วนรายชื่อ sheet ไม่ parse ข้อมูล
+    engine = "xlrd" if _extension(filename) == ".xls" else "openpyxl"
+    try:
+        with pd.ExcelFile(_open_source(source), engine=engine) as workbook:
+            return [str(name) for name in workbook.sheet_names]
+    except Exception as exc:  # noqa: BLE001
+        raise ExcelReadError(f"Cannot read excel file {filename or ''} with engine {engine}: {exc}") from exc
+
+
+def resolve_sheets(source: ExcelSource, filename: str | None, selector: SheetSelector) -> list[str]:
+    """แปลง selector เป็นชื่อ sheet ตามลำดับที่ขอ (ตัดตัวซ้ำ) ชื่อหรือตำแหน่งที่ไม่มีในไฟล์เป็น ExcelReadError"""
+    names = list_sheet_names(source, filename)
+    if selector == "all":
+        return names
+    resolved: list[str] = []
+    for ref in selector:
+        if isinstance(ref, int):
+            if not 0 <= ref < len(names):
+                raise ExcelReadError(
+                    f"Sheet index {ref} is out of range, {filename or 'file'} has {len(names)} sheets."
+                )
+            name = names[ref]
+        elif ref in names:
+            name = ref
+        else:
+            raise ExcelReadError(f"Sheet {ref!r} not found in {filename or 'file'}.")
+        if name not in resolved:
+            resolved.append(name)
+    return resolved
+
+
+def _convert_cell(cell: Any) -> Any:
+    """แปลงค่า cell แบบเดียวกับ pandas (OpenpyxlReader._convert_cell)"""
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if cell.value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        if value == cell.value:
+            return value
+        return float(cell.value)
+    return cell.value
+
+
+def _rows_to_frame(
+    header: list[Any],
+    rows: list[list[Any]],
+    start: int,
+    columns: list[Any] | None = None,
+    source_columns: list[Any] | None = None,
+) -> pd.DataFrame:
+    width = len(header)
+    padded = [row[:width] + [""] * (width - len(row)) for row in rows]
+    frame = TextParser([header, *padded], header=0).read()
+    if columns is not None:
+        # ตั้งชื่อตามไฟล์เต็ม ชื่อซ้ำจะได้ .1/.2 ตรงกับการอ่านทุกคอลัมน์
+        frame.columns = columns
+        frame.attrs[SOURCE_COLUMNS_ATTR] = source_columns
+    frame.index = pd.RangeIndex(start, start + len(frame))
+    return frame
+
+
+def _trim_row(values: list[Any]) -> list[Any]:
+    while values and values[-1] == "":
+        values.pop()
+    return values
+
+
+def _is_blank_row(cells: tuple) -> bool:
+    return all(cell.value is None or cell.value == "" for cell in cells)
+
+
+def _iter_openpyxl_frames(
+    source: ExcelSource,
+    chunk_size: int | None,
+    select_columns: ColumnSelector | None = None,
+    sheet: SheetRef = 0,
+) -> Iterator[pd.DataFrame]:
+    """อ่าน sheet ด้วย openpyxl read-only แปลงค่า cell เฉพาะคอลัมน์ที่เลือก แล้วสร้าง DataFrame
+    ทีละ chunk_size แถว (None = ทั้ง sheet ใน frame เดียว)"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(_open_source(source), read_only=True, data_only=True, keep_links=False)
+    try:
+        worksheet = workbook[sheet] if isinstance(sheet, str) else workbook.worksheets[sheet]
+        worksheet.reset_dimensions()
+        rows = worksheet.rows
+        first = next(rows, None)
+        if first is None:
+            return
+        header = _trim_row([_convert_cell(cell) for cell in first])
+        positions = columns = source_columns = None
+        if select_columns is not None:
+            source_columns = list(TextParser([header], header=0).read().columns)
+            positions = select_columns(source_columns)
+            columns = [source_columns[idx] for idx in positions]
+            header = [header[idx] for idx in positions]
+        start = 0
+        buffer: list[list[Any]] = []
+        pending_blank: list[list[Any]] = []
+        for cells in rows:
+            if positions is None:
+                row = _trim_row([_convert_cell(cell) for cell in cells])
+                blank = not row
+            else:
+                width = len(cells)
+                row = _trim_row([_convert_cell(cells[idx]) if idx < width else "" for idx in positions])
+                # แถวว่างดูจากทุกคอลัมน์ แถวที่ว่างเฉพาะคอลัมน์ที่เลือกยังนับเป็นแถวข้อมูล
+                blank = not row and _is_blank_row(cells)
+            if blank:
+                # แถวว่างท้ายไฟล์ต้องตัดทิ้ง จึงพักไว้จนกว่าจะเจอแถวที่มีข้อมูล
+                pending_blank.append(row)
+                continue
+            buffer.extend(pending_blank)
+            pending_blank = []
+            buffer.append(row)
+            if chunk_size is not None and len(buffer) >= chunk_size:
+                yield _rows_to_frame(header, buffer[:chunk_size], start, columns, source_columns)
+                start += chunk_size
+                buffer = buffer[chunk_size:]
+        if buffer or start == 0:
+            yield _rows_to_frame(header, buffer, start, columns, source_columns)
+    finally:
+        workbook.close()
+
+
+def iter_excel_chunks(
+    source: ExcelSource,
+    filename: str | None = None,
+    chunk_size: int = 10000,
+    select_columns: ColumnSelector | None = None,
+    sheet: SheetRef = 0,
+) -> Iterator[pd.DataFrame]:
+    """อ่าน sheet (ค่าเริ่มต้น sheet แรก) ทีละ chunk_size แถว (.xlsx ใช้ openpyxl read-only)
+    index ของแต่ละ chunk ต่อเนื่องกันเหมือนอ่านทั้งไฟล์ด้วย read_excel_bytes ส่วน .xls ต้องโหลดทั้ง sheet แล้วค่อยแบ่ง"""
+    lower_name = (filename or "").lower()
+    if lower_name.endswith(".xls"):
+        frame = read_excel_bytes(source, filename, select_columns, sheet=sheet)
+        for start in range(0, len(frame), chunk_size):
+            yield frame.iloc[start : start + chunk_size]
+        return
+
+    try:
+        for frame in _iter_openpyxl_frames(source, chunk_size, select_columns, sheet):
+            if len(frame):
+                yield frame
+    except Exception as exc:  # noqa: BLE001
+        raise ExcelReadError(
+            f"Cannot read excel file {filename or ''} with engine openpyxl: {exc}"
+        ) from exc
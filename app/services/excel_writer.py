@@ -1,12 +1,323 @@
 from __future__ import annotations
 
+import csv
+import datetime as dt
+import importlib.util
+import io
+import math
+import re
+import zipfile
+from collections.abc import Iterable, Iterator, Sequence
+from decimal import Decimal
 from io import BytesIO
+from typing import Any
+from xml.sax.saxutils import escape, quoteattr
 
+import numpy as np
 import pandas as pd
 
+OUTPUT_FORMATS = {
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+STREAM_CHUNK_ROWS = 2000
+PARQUET_CHUNK_BYTES = 1024 * 1024
+
+# ตัวอักษรควบคุมที่ XML ไม่รับ (ชุดเดียวกับ openpyxl ILLEGAL_CHARACTERS_RE)
+_ILLEGAL_XML_CHARS = re.compile(r"[\000-\010]|[\013-\014]|[\016-\037]")
+_EXCEL_EPOCH = dt.datetime(1899, 12, 30)
+
+# style index ใน cellXfs: 1 = header แบบที่ pandas ใช้, 2 = วันที่, 3 = วันที่+เวลา
+_STYLE_HEADER = 1
+_STYLE_DATE = 2
+_STYLE_DATETIME = 3
+
+_CONTENT_TYPES_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+)
+_CONTENT_TYPES_SHEET = (
+    '<Override PartName="/xl/worksheets/sheet{number}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_CONTENT_TYPES_TAIL = (
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    "</Types>"
+)
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    "</Relationships>"
+)
+_WORKBOOK_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    "<sheets>"
+)
+_WORKBOOK_TAIL = "</sheets></workbook>"
+_WORKBOOK_RELS_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+)
+_WORKBOOK_RELS_SHEET = (
+    '<Relationship Id="rId{number}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet{number}.xml"/>'
+)
+_WORKBOOK_RELS_TAIL = (
+    '<Relationship Id="rId{number}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    "</Relationships>"
+)
+_STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="2">'
+    '<numFmt numFmtId="164" formatCode="YYYY-MM-DD"/>'
+    '<numFmt numFmtId="165" formatCode="YYYY-MM-DD HH:MM:SS"/>'
+    "</numFmts>"
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="2"><border><left/><right/><top/><bottom/><diagonal/></border>'
+    '<border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/>'
+    "<diagonal/></border></borders>"
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="4">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="1" xfId="0" applyFont="1" applyBorder="1" '
+    'applyAlignment="1"><alignment horizontal="center" vertical="top"/></xf>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    "</cellXfs>"
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    "</styleSheet>"
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = "</sheetData></worksheet>"
+# ชื่อ sheet ของ Excel: ยาวไม่เกิน 31 ตัวอักษร ห้ามมี []:*?/\ และห้ามซ้ำกัน (ไม่สนตัวพิมพ์เล็ก/ใหญ่)
+_SHEET_TITLE_MAX = 31
+_INVALID_SHEET_TITLE_CHARS = re.compile(r"[\[\]:*?/\\]")
+
 
 def dataframe_to_excel_bytes(df: pd.DataFrame) -> bytes:
     buffer = BytesIO()
     with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
         df.to_excel(writer, index=False)
     return buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """ปลายทางของ ZipFile ที่เก็บ bytes ไว้จนกว่า generator จะดึงออกไป (ไม่รองรับ seek/tell
+    zipfile จึงเขียน data descriptor ต่อท้ายแต่ละไฟล์แทนการย้อนกลับไปแก้ header)"""
+
+    def __init__(self) -> None:
+        self._parts: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _text_cell(ref: str, value: str, style: int = 0) -> str:
+    text = escape(_ILLEGAL_XML_CHARS.sub("", value))
+    style_attr = f' s="{style}"' if style else ""
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t{space}>{text}</t></is></c>'
+
+
+def _excel_serial(value: dt.datetime | dt.date) -> float:
+    if not isinstance(value, dt.datetime):
+        value = dt.datetime(value.year, value.month, value.day)
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None)
+    return (value - _EXCEL_EPOCH).total_seconds() / 86400
+
+
+def _cell_xml(ref: str, value) -> str:
+    """แปลงค่าหนึ่งเซลล์ให้ตรงกับที่ pandas.to_excel เขียน ค่าว่าง (None/NaN/NaT) ไม่สร้างเซลล์"""
+    if value is None or value is pd.NaT or value is pd.NA:
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, np.integer)):
+        return f'<c r="{ref}"><v>{int(value)}</v></c>'
+    if isinstance(value, (float, np.floating, Decimal)):
+        number = float(value)
+        if math.isnan(number):
+            return ""
+        if math.isinf(number):
+            return _text_cell(ref, "inf" if number > 0 else "-inf")
+        return f'<c r="{ref}"><v>{number!r}</v></c>'
+    if isinstance(value, dt.datetime):
+        return f'<c r="{ref}" s="{_STYLE_DATETIME}"><v>{_excel_serial(value)!r}</v></c>'
+    if isinstance(value, dt.date):
+        return f'<c r="{ref}" s="{_STYLE_DATE}"><v>{_excel_serial(value)!r}</v></c>'
+    return _text_cell(ref, str(value))
+
+
+def _frame_blocks(df: pd.DataFrame, chunk_rows: int) -> Iterator[Sequence[Sequence[Any]]]:
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start : start + chunk_rows].to_numpy(dtype=object)
+
+
+def _sheet_rows(columns: Sequence[str], blocks: Iterable[Sequence[Sequence[Any]]]) -> Iterator[str]:
+    letters = [_column_letter(idx) for idx in range(len(columns))]
+    header = "".join(
+        _text_cell(f"{letter}1", str(column), _STYLE_HEADER) for letter, column in zip(letters, columns)
+    )
+    yield f'<row r="1">{header}</row>'
+    row_number = 2
+    for block in blocks:
+        parts = []
+        for row in block:
+            cells = "".join(_cell_xml(f"{letter}{row_number}", value) for letter, value in zip(letters, row))
+            parts.append(f'<row r="{row_number}">{cells}</row>')
+            row_number += 1
+        yield "".join(parts)
+
+
+def _sheet_titles(names: Sequence[str]) -> list[str]:
+    titles: list[str] = []
+    used: set[str] = set()
+    for number, name in enumerate(names, start=1):
+        base = _INVALID_SHEET_TITLE_CHARS.sub("_", _ILLEGAL_XML_CHARS.sub("", name)).strip("'")[:_SHEET_TITLE_MAX]
+        title = base or f"Sheet{number}"
+        suffix = 1
+        while title.lower() in used:
+            suffix += 1
+            tag = f" ({suffix})"
+            title = f"{base[: _SHEET_TITLE_MAX - len(tag)]}{tag}"
+        used.add(title.lower())
+        titles.append(title)
+    return titles
+
+
+def _workbook_parts(titles: Sequence[str]) -> dict[str, str]:
+    numbers = range(1, len(titles) + 1)
+    sheets = "".join(
+        f'<sheet name={quoteattr(title)} sheetId="{number}" r:id="rId{number}"/>'
+        for number, title in zip(numbers, titles)
+    )
+    return {
+        "[Content_Types].xml": _CONTENT_TYPES_HEAD
+        + "".join(_CONTENT_TYPES_SHEET.format(number=number) for number in numbers)
+        + _CONTENT_TYPES_TAIL,
+        "_rels/.rels": _ROOT_RELS_XML,
+        "xl/workbook.xml": _WORKBOOK_HEAD + sheets + _WORKBOOK_TAIL,
+        "xl/_rels/workbook.xml.rels": _WORKBOOK_RELS_HEAD
+        + "".join(_WORKBOOK_RELS_SHEET.format(number=number) for number in numbers)
+        + _WORKBOOK_RELS_TAIL.format(number=len(titles) + 1),
+        "xl/styles.xml": _STYLES_XML,
+    }
+
+
+def iter_xlsx_sheets(
+    sheets: Sequence[tuple[str, Sequence[str], Iterable[Sequence[Sequence[Any]]]]],
+) -> Iterator[bytes]:
+    """เขียน xlsx แบบ streaming: สร้าง XML ของชีตทีละ block ของแถว บีบอัดแล้วส่งออกทันที
+    หน่วยความจำคงที่ตามขนาด block ไม่ต้องสร้างทั้ง workbook ไว้ก่อน (ใช้ inline string แทน shared strings)
+    sheets คือ (ชื่อ sheet, คอลัมน์, blocks) เรียงตามลำดับใน workbook ชื่อที่ Excel ไม่รับจะถูกแก้ให้ใช้ได้"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _workbook_parts(_sheet_titles([name for name, _, _ in sheets])).items():
+            archive.writestr(name, content)
+        yield sink.drain()
+        for number, (_, columns, blocks) in enumerate(sheets, start=1):
+            with archive.open(f"xl/worksheets/sheet{number}.xml", mode="w", force_zip64=True) as sheet:
+                sheet.write(_SHEET_HEAD.encode("utf-8"))
+                for block in _sheet_rows(columns, blocks):
+                    sheet.write(block.encode("utf-8"))
+                    data = sink.drain()
+                    if data:
+                        yield data
+                sheet.write(_SHEET_TAIL.encode("utf-8"))
+    yield sink.drain()
+
+
+def iter_xlsx_records(columns: Sequence[str], blocks: Iterable[Sequence[Sequence[Any]]]) -> Iterator[bytes]:
+    return iter_xlsx_sheets([("Sheet1", columns, blocks)])
+
+
+def iter_xlsx_bytes(df: pd.DataFrame, chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    return iter_xlsx_records([str(column) for column in df.columns], _frame_blocks(df, chunk_rows))
+
+
+def iter_xlsx_workbook(frames: dict[str, pd.DataFrame], chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """หนึ่ง sheet ต่อหนึ่ง DataFrame ตามลำดับของ dict (ผล transform ของไฟล์หลาย sheet)"""
+    return iter_xlsx_sheets(
+        [
+            (name, [str(column) for column in df.columns], _frame_blocks(df, chunk_rows))
+            for name, df in frames.items()
+        ]
+    )
+
+
+def iter_csv_records(columns: Sequence[str], blocks: Iterable[Sequence[Sequence[Any]]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    writer.writerow(columns)
+    yield buffer.getvalue().encode("utf-8-sig")
+    for block in blocks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(block)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_csv_bytes(df: pd.DataFrame, chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """CSV (UTF-8 มี BOM ให้ Excel เปิดภาษาไทยได้) ส่งออกทีละ chunk_rows แถว"""
+    yield df.iloc[:0].to_csv(index=False, lineterminator="\r\n").encode("utf-8-sig")
+    for start in range(0, len(df), chunk_rows):
+        block = df.iloc[start : start + chunk_rows].to_csv(index=False, header=False, lineterminator="\r\n")
+        yield block.encode("utf-8")
+
+
+def parquet_available() -> bool:
+    return any(importlib.util.find_spec(name) is not None for name in ("pyarrow", "fastparquet"))
+
+
+def dataframe_to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    buffer = BytesIO()
+    frame = df.copy()
+    # parquet ต้องการชื่อคอลัมน์เป็น string
+    frame.columns = [str(column) for column in frame.columns]
+    frame.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def iter_bytes(data: bytes, chunk_size: int = PARQUET_CHUNK_BYTES) -> Iterator[bytes]:
+    for start in range(0, len(data), chunk_size):
+        yield data[start : start + chunk_size]
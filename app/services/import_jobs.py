@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import logging
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import get_settings
+from app.db.models import ImportJob
+from app.db.session import get_session_factory
+from app.schemas import TransformOptions
+from app.services.excel_reader import read_excel_bytes
+from app.services.import_service import (
+    BATCH_JOB_KIND,
+    create_batch_job,
+    create_job,
+    import_column_positions,
+    import_dataframe_to_db,
+    import_excel_stream_to_db,
+    refresh_batch_job,
+    set_job_failed,
+    set_job_stage,
+)
+from app.services.metrics import StageTimer
+from app.services.rules_engine import apply_business_rules
+
+logger = logging.getLogger(__name__)
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_pending = 0
+_active_jobs: set[int] = set()
+RESUMABLE_STATUSES = {"failed", "running", "queued"}
+# ไฟล์ที่เพิ่งย้ายเข้า UPLOAD_STORAGE_DIR อาจยังไม่ถูกบันทึกลง job (enqueue_import ของ worker process อื่นยังไม่ commit)
+_SWEEP_GRACE_SECONDS = 3600
+
+
+class ImportQueueFullError(Exception):
+    pass
+
+
+class ImportResumeError(Exception):
+    pass
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_settings().import_worker_count,
+                thread_name_prefix="import-worker",
+            )
+        return _executor
+
+
+def shutdown_import_workers() -> None:
+    global _executor
+    # รอ worker นอก lock เพราะ job ที่กำลังจบต้องใช้ lock เดียวกันใน _release_slot
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def store_upload(job_id: int, filename: str, spooled: Path) -> Path:
+    """ย้าย spool file ของ upload มาเป็นไฟล์ของ job (rename ถ้าอยู่ filesystem เดียวกัน ไม่ต้องคัดลอก)"""
+    storage_dir = Path(get_settings().upload_storage_dir)
+    storage_dir.mkdir(parents=True, exist_ok=True)
+    path = storage_dir / f"{job_id}{Path(filename).suffix.lower()}"
+    shutil.move(spooled, path)
+    return path
+
+
+def _needed_upload_paths(db: Session, paths: list[str] | None = None) -> set[str]:
+    """upload_path ที่ job ซึ่งยัง resume ได้อ้างถึงอยู่ (job แม่ของ batch resume เองไม่ได้จึงไม่นับ)"""
+    stmt = select(ImportJob.upload_path).where(
+        ImportJob.upload_path.is_not(None),
+        ImportJob.status.in_(RESUMABLE_STATUSES),
+        or_(ImportJob.kind.is_(None), ImportJob.kind != BATCH_JOB_KIND),
+    )
+    if paths is not None:
+        stmt = stmt.where(ImportJob.upload_path.in_(paths))
+    return set(db.execute(stmt).scalars())
+
+
+def _remove_uploads(db: Session, paths: list[str]) -> None:
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
+    db.execute(update(ImportJob).where(ImportJob.upload_path.in_(paths)).values(upload_path=None))
+    db.commit()
+
+
+def _discard_upload(db: Session, job: ImportJob) -> None:
+    """ลบไฟล์ที่เก็บไว้เมื่อ job จบแล้ว (resume ไม่ได้) และไม่มี job อื่นที่ใช้ไฟล์เดียวกัน (sheet อื่นของ batch)
+    ต้องใช้ต่อ job ที่ล้มยังเก็บไฟล์ไว้ให้ resume จนกว่าจะหมดอายุตาม UPLOAD_RETENTION_HOURS"""
+    path = job.upload_path
+    if not path or job.status in RESUMABLE_STATUSES:
+        return
+    try:
+        if not _needed_upload_paths(db, [path]):
+            _remove_uploads(db, [path])
+    except Exception:  # noqa: BLE001
+        logger.exception("Cannot remove stored upload of job %s", job.id)
+        db.rollback()
+
+
+def sweep_stored_uploads(db: Session) -> int:
+    """เรียกตอน startup: ลบไฟล์ใน UPLOAD_STORAGE_DIR ที่ไม่มี job ที่ resume ได้อ้างถึง
+    หรือเก่ากว่า UPLOAD_RETENTION_HOURS (job ที่ล้มนานแล้วจะ resume ไม่ได้อีก) คืนจำนวนไฟล์ที่ลบ"""
+    settings = get_settings()
+    storage_dir = Path(settings.upload_storage_dir)
+    if not storage_dir.is_dir():
+        return 0
+    needed = _needed_upload_paths(db)
+    now = time.time()
+    expire_before = now - settings.upload_retention_hours * 3600
+    stale = []
+    for path in storage_dir.iterdir():
+        if not path.is_file():
+            continue
+        modified = path.stat().st_mtime
+        if modified < expire_before or (str(path) not in needed and modified < now - _SWEEP_GRACE_SECONDS):
+            stale.append(str(path))
+    if stale:
+        _remove_uploads(db, stale)
+    return len(stale)
+
+
+def _run_job(job_id: int) -> None:
+    db: Session = get_session_factory()()
+    try:
+        job = db.get(ImportJob, job_id)
+        if job is None or not job.upload_path:
+            logger.warning("Import job %s has no stored upload, skipping", job_id)
+            return
+        try:
+            _process_job(db, job)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Import job %s failed", job_id)
+            db.rollback()
+            # import_service บันทึกสถานะพร้อม checkpoint ไว้แล้ว ถ้ายังไม่ได้บันทึกค่อยตั้งเป็น failed
+            if job.status != "failed":
+                set_job_failed(db, job, f"Import failed: {exc}")
+        if job.parent_job_id is not None:
+            _refresh_parent(db, job.parent_job_id)
+        _discard_upload(db, job)
+    finally:
+        db.close()
+        _release_slot(job_id)
+
+
+def _refresh_parent(db: Session, parent_job_id: int) -> None:
+    try:
+        parent = db.get(ImportJob, parent_job_id)
+        if parent is not None:
+            refresh_batch_job(db, parent)
+    except Exception:  # noqa: BLE001
+        logger.exception("Cannot update batch job %s", parent_job_id)
+        db.rollback()
+
+
+def _process_job(db: Session, job: ImportJob) -> None:
+    source = job.upload_path
+    kind = job.kind or "upload"
+    # job ลูกของไฟล์หลาย sheet อ่านเฉพาะ sheet ของตัวเอง
+    sheet = job.sheet_name if job.sheet_name is not None else 0
+    timer = StageTimer(job.correlation_id)
+    if kind == "upload" and job.streaming:
+        import_excel_stream_to_db(db=db, source=source, filename=job.filename, job=job, timer=timer, sheet=sheet)
+        return
+
+    set_job_stage(db, job, "reading")
+    # rules ต้องเห็นทุกคอลัมน์ ส่วน import ตรงอ่านเฉพาะคอลัมน์ที่ใช้
+    select_columns = None if kind == "transform" else import_column_positions
+    with timer.stage("read") as run:
+        frame = read_excel_bytes(source, job.filename, select_columns, sheet=sheet)
+        run.rows = len(frame)
+    if kind == "transform":
+        set_job_stage(db, job, "transforming")
+        options = TransformOptions.model_validate_json(job.options_json) if job.options_json else TransformOptions()
+        with timer.stage("rules", len(frame)):
+            result = apply_business_rules(frame, options)
+        if result.issues:
+            set_job_failed(db, job, "; ".join(result.issues))
+            return
+        frame = result.dataframe
+    import_dataframe_to_db(db=db, frame=frame, filename=job.filename, job=job, timer=timer)
+
+
+def _reserve_slot(resume_job_id: int | None = None, count: int = 1) -> None:
+    global _pending
+    with _executor_lock:
+        if resume_job_id in _active_jobs:
+            raise ImportResumeError(f"Job {resume_job_id} is still being processed.")
+        if _pending + count > get_settings().import_queue_limit:
+            raise ImportQueueFullError("Import queue is full, please retry later.")
+        _pending += count
+        if resume_job_id is not None:
+            _active_jobs.add(resume_job_id)
+
+
+def _release_slot(job_id: int | None = None, count: int = 1) -> None:
+    global _pending
+    with _executor_lock:
+        _pending -= count
+        _active_jobs.discard(job_id)
+
+
+def _submit(job_id: int) -> None:
+    with _executor_lock:
+        _active_jobs.add(job_id)
+    _get_executor().submit(_run_job, job_id)
+
+
+def enqueue_import(
+    db: Session,
+    spooled: Path,
+    filename: str,
+    correlation_id: str,
+    kind: str,
+    options: TransformOptions | None = None,
+    streaming: bool = False,
+    sheets: list[str] | None = None,
+) -> ImportJob:
+    """เก็บไฟล์ (spooled) สร้าง job สถานะ queued แล้วส่งให้ worker pool ทำต่อ (kind = "upload" หรือ "transform")
+    ถ้าให้ sheets จะคืน job แม่ kind="batch" ส่วน job ลูกหนึ่ง job ต่อ sheet ใช้ไฟล์ที่เก็บร่วมกันและทำขนานกันใน pool
+    (แต่ละ job ลูกนับเป็นหนึ่งช่องของ IMPORT_QUEUE_LIMIT)"""
+    count = len(sheets) if sheets else 1
+    _reserve_slot(count=count)
+    submitted = 0
+    try:
+        if sheets:
+            children = [(filename, sheet) for sheet in sheets]
+            job = create_batch_job(db, filename, correlation_id, children, kind=kind, status="queued")
+            targets = list(job.children)
+        else:
+            job = create_job(db, filename=filename, correlation_id=correlation_id, status="queued", stage="queued")
+            job.kind = kind
+            targets = [job]
+        upload_path = str(store_upload(job.id, filename, spooled))
+        for target in [job, *targets]:
+            target.upload_path = upload_path
+        for target in targets:
+            target.streaming = streaming
+            target.options_json = options.model_dump_json() if options is not None else None
+        db.commit()
+        db.refresh(job)
+        for target in targets:
+            _submit(target.id)
+            submitted += 1
+    except BaseException:
+        _release_slot(count=count - submitted)
+        raise
+    return job
+
+
+def resume_import(db: Session, job: ImportJob) -> ImportJob:
+    """ส่ง job ที่ล้มหรือค้างกลับเข้าคิว ทำต่อจาก checkpoint_rows ด้วยไฟล์ที่เก็บไว้ตอน upload
+    job ที่ worker ของ process นี้กำลังทำอยู่ resume ไม่ได้"""
+    if job.kind == BATCH_JOB_KIND:
+        raise ImportResumeError(f"Job {job.id} is a batch, resume its jobs {job.child_job_ids} instead.")
+    if job.status not in RESUMABLE_STATUSES:
+        raise ImportResumeError(f"Job {job.id} is {job.status} and cannot be resumed.")
+    if not job.upload_path or not Path(job.upload_path).is_file():
+        raise ImportResumeError(f"Job {job.id} has no stored upload to resume from.")
+    _reserve_slot(job.id)
+    try:
+        job.status = "queued"
+        job.stage = "queued"
+        job.message = f"Resuming from row {job.checkpoint_rows or 0}"
+        db.commit()
+        db.refresh(job)
+        _submit(job.id)
+    except BaseException:
+        _release_slot(job.id)
+        raise
+    return job
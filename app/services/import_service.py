@@ -1,19 +1,38 @@
 from __future__ import annotations
 
+import hashlib
+import time
+from collections.abc import Callable, Iterator
 from dataclasses import dataclass
-from datetime import date
-from decimal import Decimal, InvalidOperation
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
 from typing import Any
 from uuid import uuid4
 
+import numpy as np
 import pandas as pd
-from sqlalchemy import select
+from sqlalchemy import Column, MetaData, Table, insert, select, text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from app.db.models import ImportError, ImportJob, SalesRecord
-from app.schemas import ImportErrorItem, ImportResult
+from app.core.config import get_settings
+from app.db.models import ImportError, ImportJob, ImportJobStage, SalesRecord
+from app.schemas import BatchImportResult, ImportErrorItem, ImportErrorSummary, ImportResult
+from app.services.compact_dtypes import map_categories
+from app.services.excel_reader import (
+    SOURCE_COLUMNS_ATTR,
+    ExcelReadError,
+    ExcelSource,
+    SheetRef,
+    iter_excel_chunks,
+)
+from app.services.metrics import StageTimer
+from app.services.value_parsers import factorize_values, parse_dates, parse_fixed_point
 
 REQUIRED_COLUMNS = ["business_key", "name", "amount", "record_date"]
+BATCH_JOB_KIND = "batch"
+_PENDING_JOB_STATUSES = {"queued", "running"}
 ALIASES: dict[str, list[str]] = {
     "business_key": ["business_key", "group_id", "เลขตัวถัง", "เลขที่ใบกำกับ"],
     "name": ["name", "ชื่อ-นามสกุล"],
@@ -41,6 +60,64 @@ ALIASES: dict[str, list[str]] = {
     "group_id": ["group_id"],
 }
 
+# (field, เป็นข้อความที่ต้อง clean หรือไม่, ตำแหน่งคอลัมน์ fallback ต่อท้าย ALIASES ตามลำดับ)
+IMPORT_FIELD_SPECS: list[tuple[str, bool, tuple[int, ...]]] = [
+    ("business_key", True, (7, 1)),
+    ("name", True, (2,)),
+    ("amount", True, (15, 6, 4)),
+    ("record_date", False, (0,)),
+    ("invoice_date", False, (0,)),
+    ("invoice_no", True, (1,)),
+    ("item_description", True, ()),
+    ("product_value", False, (4,)),
+    ("tax_value", False, ()),
+    ("total_value", False, (6,)),
+    ("vin_no", True, (7,)),
+    ("cancel_flag", True, ()),
+    ("cancel_product_value", False, ()),
+    ("cancel_tax_value", False, ()),
+    ("cancel_total_value", False, ()),
+    ("org_type_hq", True, ()),
+    ("org_type_branch_no", False, ()),
+    ("taxpayer_id", True, ()),
+    ("sale_price", False, (15,)),
+    ("com_fn", False, ()),
+    ("com_value", False, ()),
+    ("rule_applied", True, ()),
+    ("is_duplicate_tank", False, ()),
+    ("group_id", True, ()),
+]
+POSITIONAL_FALLBACK_INDEXES = tuple(sorted({idx for _, _, positions in IMPORT_FIELD_SPECS for idx in positions}))
+IMPORT_COLUMN_NAMES = {name for candidates in ALIASES.values() for name in candidates} | set(ALIASES)
+
+SALES_RECORD_FIELDS = [
+    "name",
+    "amount",
+    "record_date",
+    "invoice_date",
+    "invoice_no",
+    "item_description",
+    "product_value",
+    "tax_value",
+    "total_value",
+    "vin_no",
+    "cancel_flag",
+    "cancel_product_value",
+    "cancel_tax_value",
+    "cancel_total_value",
+    "org_type_hq",
+    "org_type_branch_no",
+    "taxpayer_id",
+    "sale_price",
+    "com_fn",
+    "com_value",
+    "rule_applied",
+    "is_duplicate_tank",
+    "group_id",
+]
+UPSERT_COLUMNS = ["business_key", *SALES_RECORD_FIELDS, "row_fingerprint"]
+KEY_LOOKUP_CHUNK_SIZE = 500
+
 
 @dataclass
 class ValidationErrorItem:
@@ -49,54 +126,61 @@ class ValidationErrorItem:
     error_message: str
 
 
-def _as_clean_string(value: Any) -> str:
-    if pd.isna(value):
-        return ""
-    text = str(value).strip()
-    if text.lower() in {"nan", "none"}:
-        return ""
-    return text
+@dataclass
+class _ColumnErrors:
+    count: int
+    example_rows: list[int]
+    example_message: str
 
 
-def _coalesce_columns(frame: pd.DataFrame, candidates: list[str]) -> pd.Series:
-    result = pd.Series([""] * len(frame), index=frame.index, dtype="object")
-    for col in candidates:
-        if col not in frame.columns:
-            continue
-        values = frame[col].map(_as_clean_string)
-        mask = (result == "") & (values != "")
-        result.loc[mask] = values.loc[mask]
-    return result
+class ErrorReport:
+    """สรุป error สำหรับ response: เก็บรายการแรกไม่เกิน limit รายการ และนับ/ยกตัวอย่างแถวแยกตามคอลัมน์
+    รายการเต็มอยู่ในตาราง import_errors"""
 
+    def __init__(self, limit: int, example_rows: int) -> None:
+        self.limit = limit
+        self.example_rows = example_rows
+        self.count = 0
+        self.items: list[ValidationErrorItem] = []
+        self.failed_rows: set[int] = set()
+        self._columns: dict[str | None, _ColumnErrors] = {}
 
-def _coalesce_raw_columns(frame: pd.DataFrame, candidates: list[str]) -> pd.Series:
-    result = pd.Series([None] * len(frame), index=frame.index, dtype="object")
-    for col in candidates:
-        if col not in frame.columns:
-            continue
-        values = frame[col]
-        mask = result.isna() & values.notna()
-        result.loc[mask] = values.loc[mask]
-    return result
+    def add(self, errors: list[ValidationErrorItem]) -> None:
+        self.count += len(errors)
+        self.items.extend(errors[: max(self.limit - len(self.items), 0)])
+        for item in errors:
+            self.failed_rows.add(item.row_number)
+            summary = self._columns.get(item.column_name)
+            if summary is None:
+                summary = self._columns[item.column_name] = _ColumnErrors(0, [], item.error_message)
+            summary.count += 1
+            if len(summary.example_rows) < self.example_rows:
+                summary.example_rows.append(item.row_number)
 
+    def summary(self) -> list[ImportErrorSummary]:
+        return [
+            ImportErrorSummary(
+                column_name=column_name,
+                count=summary.count,
+                example_rows=summary.example_rows,
+                example_message=summary.example_message,
+            )
+            for column_name, summary in sorted(self._columns.items(), key=lambda entry: -entry[1].count)
+        ]
 
-def _parse_optional_decimal(value: Any) -> Decimal | None:
-    text = _as_clean_string(value).replace(",", "")
-    if text == "":
-        return None
-    try:
-        return Decimal(text)
-    except (InvalidOperation, ValueError):
-        return None
 
+def _new_error_report() -> ErrorReport:
+    settings = get_settings()
+    return ErrorReport(settings.import_error_response_limit, settings.import_error_example_rows)
 
-def _parse_optional_date(value: Any) -> date | None:
+
+def _as_clean_string(value: Any) -> str:
     if pd.isna(value):
-        return None
-    text = _as_clean_string(value)
-    if text == "":
-        return None
-    return pd.to_datetime(value).date()
+        return ""
+    text = str(value).strip()
+    if text.lower() in {"nan", "none"}:
+        return ""
+    return text
 
 
 def _parse_optional_int(value: Any) -> int | None:
@@ -119,178 +203,525 @@ def _parse_optional_bool(value: Any) -> bool | None:
     return None
 
 
-def _map_to_import_format(frame: pd.DataFrame) -> pd.DataFrame:
-    columns = list(frame.columns)
-    date_col = columns[0] if len(columns) > 0 else ""
-    invoice_col = columns[1] if len(columns) > 1 else ""
-    name_col = columns[2] if len(columns) > 2 else ""
-    vin_col = columns[7] if len(columns) > 7 else ""
-    sale_price_col = columns[15] if len(columns) > 15 else ""
-    total_col = columns[6] if len(columns) > 6 else ""
-    gross_col = columns[4] if len(columns) > 4 else ""
+def import_column_positions(columns: list[Any]) -> list[int]:
+    """คอลัมน์ที่ import ใช้จริง (ตาม ALIASES และตำแหน่ง fallback) ให้ excel_reader อ่านเฉพาะคอลัมน์เหล่านี้"""
+    return [
+        idx
+        for idx, name in enumerate(columns)
+        if idx in POSITIONAL_FALLBACK_INDEXES or str(name).strip().lower() in IMPORT_COLUMN_NAMES
+    ]
+
+
+@dataclass(frozen=True)
+class MappingPlan:
+    """ผลการ resolve ALIASES + ตำแหน่ง fallback ของ header ชุดหนึ่ง: field -> คอลัมน์ต้นทางที่มีอยู่จริงตามลำดับ"""
+
+    fields: tuple[tuple[str, bool, tuple[str, ...]], ...]
+
+
+@lru_cache(maxsize=256)
+def compile_mapping_plan(columns: tuple[str, ...], source_columns: tuple[str, ...]) -> MappingPlan:
+    """cache ตาม signature ของ header ไฟล์ layout เดิมที่ upload ซ้ำจะได้ plan เดิมโดยไม่ต้อง resolve ใหม่"""
+    present = set(columns)
+    fields = []
+    for field, is_text, positions in IMPORT_FIELD_SPECS:
+        candidates = ALIASES[field] + [source_columns[idx] for idx in positions if idx < len(source_columns)]
+        # คอลัมน์เดียวกันที่ซ้ำใน candidates ไม่มีผลกับการ coalesce
+        sources = tuple(dict.fromkeys(col for col in candidates if col in present))
+        fields.append((field, is_text, sources))
+    return MappingPlan(tuple(fields))
 
+
+def _coalesce_text(sources: list[pd.Series], index: pd.Index) -> pd.Series:
+    if not sources:
+        return pd.Series([""] * len(index), index=index, dtype="object")
+    result = sources[0]
+    for values in sources[1:]:
+        result = result.where(result != "", values)
+    return result
+
+
+def _coalesce_raw(sources: list[pd.Series], index: pd.Index) -> pd.Series:
+    result = pd.Series([None] * len(index), index=index, dtype="object")
+    for values in sources:
+        mask = result.isna() & values.notna()
+        result.loc[mask] = values.loc[mask]
+    return result
+
+
+def apply_mapping_plan(frame: pd.DataFrame, plan: MappingPlan) -> pd.DataFrame:
     mapped = pd.DataFrame(index=frame.index)
-    mapped["business_key"] = _coalesce_columns(frame, ALIASES["business_key"] + [vin_col, invoice_col])
-    mapped["name"] = _coalesce_columns(frame, ALIASES["name"] + [name_col])
-    mapped["amount"] = _coalesce_columns(frame, ALIASES["amount"] + [sale_price_col, total_col, gross_col])
-    mapped["record_date"] = _coalesce_raw_columns(frame, ALIASES["record_date"] + [date_col])
-    mapped["invoice_date"] = _coalesce_raw_columns(frame, ALIASES["invoice_date"] + [date_col])
-    mapped["invoice_no"] = _coalesce_columns(frame, ALIASES["invoice_no"] + [invoice_col])
-    mapped["item_description"] = _coalesce_columns(frame, ALIASES["item_description"])
-    mapped["product_value"] = _coalesce_raw_columns(frame, ALIASES["product_value"] + [gross_col])
-    mapped["tax_value"] = _coalesce_raw_columns(frame, ALIASES["tax_value"])
-    mapped["total_value"] = _coalesce_raw_columns(frame, ALIASES["total_value"] + [total_col])
-    mapped["vin_no"] = _coalesce_columns(frame, ALIASES["vin_no"] + [vin_col])
-    mapped["cancel_flag"] = _coalesce_columns(frame, ALIASES["cancel_flag"])
-    mapped["cancel_product_value"] = _coalesce_raw_columns(frame, ALIASES["cancel_product_value"])
-    mapped["cancel_tax_value"] = _coalesce_raw_columns(frame, ALIASES["cancel_tax_value"])
-    mapped["cancel_total_value"] = _coalesce_raw_columns(frame, ALIASES["cancel_total_value"])
-    mapped["org_type_hq"] = _coalesce_columns(frame, ALIASES["org_type_hq"])
-    mapped["org_type_branch_no"] = _coalesce_raw_columns(frame, ALIASES["org_type_branch_no"])
-    mapped["taxpayer_id"] = _coalesce_columns(frame, ALIASES["taxpayer_id"])
-    mapped["sale_price"] = _coalesce_raw_columns(frame, ALIASES["sale_price"] + [sale_price_col])
-    mapped["com_fn"] = _coalesce_raw_columns(frame, ALIASES["com_fn"])
-    mapped["com_value"] = _coalesce_raw_columns(frame, ALIASES["com_value"])
-    mapped["rule_applied"] = _coalesce_columns(frame, ALIASES["rule_applied"])
-    mapped["is_duplicate_tank"] = _coalesce_raw_columns(frame, ALIASES["is_duplicate_tank"])
-    mapped["group_id"] = _coalesce_columns(frame, ALIASES["group_id"])
+    cleaned: dict[str, pd.Series] = {}
+    for field, is_text, sources in plan.fields:
+        if is_text:
+            for col in sources:
+                if col not in cleaned:
+                    cleaned[col] = _clean_string_series(frame[col])
+            mapped[field] = _coalesce_text([cleaned[col] for col in sources], frame.index)
+        else:
+            mapped[field] = _coalesce_raw([frame[col] for col in sources], frame.index)
     return mapped
 
 
 def prepare_import_dataframe(frame: pd.DataFrame) -> pd.DataFrame:
     normalized = frame.rename(columns={col: str(col).strip().lower() for col in frame.columns})
     if not set(REQUIRED_COLUMNS).issubset(normalized.columns):
-        normalized = _map_to_import_format(normalized)
+        # frame ที่อ่านแบบเลือกคอลัมน์ ต้องนับตำแหน่งจากคอลัมน์ทั้งหมดของไฟล์
+        source_columns = frame.attrs.get(SOURCE_COLUMNS_ATTR, frame.columns)
+        plan = compile_mapping_plan(
+            tuple(normalized.columns),
+            tuple(str(col).strip().lower() for col in source_columns),
+        )
+        normalized = apply_mapping_plan(normalized, plan)
     return normalized
 
 
+def _clean_string_series(series: pd.Series) -> pd.Series:
+    """เวอร์ชัน vectorized ของ _as_clean_string ทั้งคอลัมน์"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return map_categories(series, _clean_string_series)
+    na_mask = series.isna()
+    text = series.astype(object).where(~na_mask, "").astype(str).str.strip()
+    blank = na_mask | text.str.lower().isin(["nan", "none"])
+    return text.where(~blank, "").astype(object)
+
+
+def _map_unique(series: pd.Series, func: Callable[[Any], Any]) -> np.ndarray:
+    """เรียก func ครั้งเดียวต่อค่าที่ไม่ซ้ำกัน แล้วกระจายผลกลับตามตำแหน่ง"""
+    codes, uniques = factorize_values(series)
+    mapped = np.empty(len(uniques), dtype=object)
+    for pos, value in enumerate(uniques):
+        mapped[pos] = func(value)
+    return mapped[codes]
+
+
+def _optional_text(values: pd.Series) -> list[str | None]:
+    return [value or None for value in values.tolist()]
+
+
 def validate_and_transform_rows(
     frame: pd.DataFrame,
 ) -> tuple[list[dict[str, Any]], list[ValidationErrorItem]]:
-    valid_rows: list[dict[str, Any]] = []
-    errors: list[ValidationErrorItem] = []
-    for idx, row in frame.iterrows():
-        row_number = idx + 2
-        business_key = _as_clean_string(row.get("business_key"))
-        name = _as_clean_string(row.get("name"))
-        amount_value = row.get("amount")
-        record_date_value = row.get("record_date")
-
-        if not business_key:
-            errors.append(ValidationErrorItem(row_number, "business_key", "business_key is required"))
-        if not name:
-            errors.append(ValidationErrorItem(row_number, "name", "name is required"))
-
-        amount: Decimal | None = None
-        try:
-            amount = Decimal(_as_clean_string(amount_value).replace(",", ""))
-        except (InvalidOperation, TypeError, ValueError):
-            errors.append(ValidationErrorItem(row_number, "amount", f"amount is invalid: {amount_value}"))
+    """ตรวจและแปลงทีละคอลัมน์ (vectorized) ผลลัพธ์และ error เหมือนการวนทีละแถวเดิม"""
 
-        parsed_date: date | None = None
-        try:
-            parsed_date = pd.to_datetime(record_date_value).date()
-        except Exception:  # noqa: BLE001
-            errors.append(
-                ValidationErrorItem(row_number, "record_date", f"record_date is invalid: {record_date_value}")
-            )
+    def column(name: str) -> pd.Series:
+        if name in frame.columns:
+            return frame[name]
+        return pd.Series([None] * len(frame), index=frame.index, dtype="object")
 
-        if any(error.row_number == row_number for error in errors):
-            continue
-
-        valid_rows.append(
-            {
-                "business_key": business_key,
-                "name": name,
-                "amount": amount,
-                "record_date": parsed_date,
-                "invoice_date": _parse_optional_date(row.get("invoice_date")),
-                "invoice_no": _as_clean_string(row.get("invoice_no")) or None,
-                "item_description": _as_clean_string(row.get("item_description")) or None,
-                "product_value": _parse_optional_decimal(row.get("product_value")),
-                "tax_value": _parse_optional_decimal(row.get("tax_value")),
-                "total_value": _parse_optional_decimal(row.get("total_value")),
-                "vin_no": _as_clean_string(row.get("vin_no")) or None,
-                "cancel_flag": _as_clean_string(row.get("cancel_flag")) or None,
-                "cancel_product_value": _parse_optional_decimal(row.get("cancel_product_value")),
-                "cancel_tax_value": _parse_optional_decimal(row.get("cancel_tax_value")),
-                "cancel_total_value": _parse_optional_decimal(row.get("cancel_total_value")),
-                "org_type_hq": _as_clean_string(row.get("org_type_hq")) or None,
-                "org_type_branch_no": _parse_optional_int(row.get("org_type_branch_no")),
-                "taxpayer_id": _as_clean_string(row.get("taxpayer_id")).lstrip("'") or None,
-                "sale_price": _parse_optional_decimal(row.get("sale_price")),
-                "com_fn": _parse_optional_decimal(row.get("com_fn")),
-                "com_value": _parse_optional_decimal(row.get("com_value")),
-                "rule_applied": _as_clean_string(row.get("rule_applied")) or None,
-                "is_duplicate_tank": _parse_optional_bool(row.get("is_duplicate_tank")),
-                "group_id": _as_clean_string(row.get("group_id")) or None,
-            }
-        )
+    row_numbers = (np.asarray(frame.index) + 2).tolist()
+    business_keys = _clean_string_series(column("business_key"))
+    names = _clean_string_series(column("name"))
+    amount_raw = column("amount")
+    amounts = parse_fixed_point(_clean_string_series(amount_raw))
+    amount_ok = amounts.ok
+    buddhist_era = get_settings().import_buddhist_era
+    record_date_raw = column("record_date")
+    record_dates = parse_dates(record_date_raw, buddhist_era)
+    record_date_ok = record_dates.ok
+
+    checks = [
+        ((business_keys == "").to_numpy(), "business_key", lambda pos: "business_key is required"),
+        ((names == "").to_numpy(), "name", lambda pos: "name is required"),
+        (~amount_ok, "amount", lambda pos: f"amount is invalid: {amount_raw.iat[pos]}"),
+        (
+            ~record_date_ok,
+            "record_date",
+            lambda pos: f"record_date is invalid: {record_date_raw.iat[pos]}",
+        ),
+    ]
+    failed = np.zeros(len(frame), dtype=bool)
+    flagged: list[tuple[int, int]] = []
+    for check_order, (mask, _, _) in enumerate(checks):
+        failed |= mask
+        flagged.extend((int(pos), check_order) for pos in np.flatnonzero(mask))
+    flagged.sort()
+    errors = [
+        ValidationErrorItem(row_numbers[pos], checks[order][1], checks[order][2](pos))
+        for pos, order in flagged
+    ]
+
+    valid = ~failed
+    if not valid.any():
+        return [], errors
+
+    def optional_decimals(field: str) -> list[Decimal | None]:
+        return parse_fixed_point(_clean_string_series(column(field)[valid])).to_decimals()
+
+    def optional_text(field: str) -> list[str | None]:
+        return _optional_text(_clean_string_series(column(field)[valid]))
+
+    batch: dict[str, list[Any]] = {
+        "business_key": business_keys[valid].tolist(),
+        "name": names[valid].tolist(),
+        "amount": amounts.to_decimals(valid),
+        "record_date": record_dates.to_dates(valid),
+        "invoice_date": parse_dates(column("invoice_date")[valid], buddhist_era).to_dates(),
+        "invoice_no": optional_text("invoice_no"),
+        "item_description": optional_text("item_description"),
+        "product_value": optional_decimals("product_value"),
+        "tax_value": optional_decimals("tax_value"),
+        "total_value": optional_decimals("total_value"),
+        "vin_no": optional_text("vin_no"),
+        "cancel_flag": optional_text("cancel_flag"),
+        "cancel_product_value": optional_decimals("cancel_product_value"),
+        "cancel_tax_value": optional_decimals("cancel_tax_value"),
+        "cancel_total_value": optional_decimals("cancel_total_value"),
+        "org_type_hq": optional_text("org_type_hq"),
+        "org_type_branch_no": _map_unique(column("org_type_branch_no")[valid], _parse_optional_int).tolist(),
+        "taxpayer_id": _optional_text(
+            _clean_string_series(column("taxpayer_id")[valid]).str.lstrip("'")
+        ),
+        "sale_price": optional_decimals("sale_price"),
+        "com_fn": optional_decimals("com_fn"),
+        "com_value": optional_decimals("com_value"),
+        "rule_applied": optional_text("rule_applied"),
+        "is_duplicate_tank": _map_unique(column("is_duplicate_tank")[valid], _parse_optional_bool).tolist(),
+        "group_id": optional_text("group_id"),
+    }
+    keys = list(batch)
+    valid_rows = [dict(zip(keys, values)) for values in zip(*batch.values())]
     return valid_rows, errors
 
 
-def _create_job(db: Session, filename: str, correlation_id: str) -> ImportJob:
-    job = ImportJob(filename=filename, correlation_id=correlation_id, status="running")
+def create_job(
+    db: Session,
+    filename: str,
+    correlation_id: str,
+    status: str = "running",
+    stage: str | None = None,
+) -> ImportJob:
+    job = ImportJob(filename=filename, correlation_id=correlation_id, status=status, stage=stage)
     db.add(job)
     db.commit()
     db.refresh(job)
     return job
 
 
+def create_batch_job(
+    db: Session,
+    filename: str,
+    correlation_id: str,
+    children: list[tuple[str, str | None]],
+    kind: str | None = None,
+    status: str = "running",
+) -> ImportJob:
+    """job แม่ (kind="batch") กับ job ลูกสถานะ queued ใน commit เดียว children คือ (ชื่อไฟล์, sheet) ของแต่ละ job ลูก
+    (หนึ่ง job ต่อ sheet ของไฟล์เดียว หรือหนึ่ง job ต่อไฟล์ของ batch upload)"""
+    parent = ImportJob(
+        filename=filename, correlation_id=correlation_id, status=status, stage=status, kind=BATCH_JOB_KIND
+    )
+    parent.children = [
+        ImportJob(
+            filename=child_filename,
+            correlation_id=correlation_id,
+            status="queued",
+            stage="queued",
+            kind=kind,
+            sheet_name=sheet,
+        )
+        for child_filename, sheet in children
+    ]
+    db.add(parent)
+    db.commit()
+    db.refresh(parent)
+    return parent
+
+
+def refresh_batch_job(db: Session, parent: ImportJob) -> ImportJob:
+    """รวมตัวนับของ job ลูกเข้า job แม่ ระหว่างที่ยังมี job ลูกค้างอยู่สถานะเป็น running
+    เมื่อจบทุก job: success, completed_with_errors (มีแถวผิดหรือบาง job ล้ม) หรือ failed (ล้มทุก job)
+    job ลูกแต่ละตัวเรียกหลัง commit สถานะของตัวเอง ตัวที่จบหลังสุดจึงเห็นผลครบเสมอ"""
+    children = (
+        db.execute(
+            select(ImportJob)
+            .where(ImportJob.parent_job_id == parent.id)
+            .order_by(ImportJob.id)
+            .execution_options(populate_existing=True)
+        )
+        .scalars()
+        .all()
+    )
+    parent.total_rows = sum(child.total_rows or 0 for child in children)
+    parent.imported_rows = sum(child.imported_rows or 0 for child in children)
+    parent.failed_rows = sum(child.failed_rows or 0 for child in children)
+    parent.processed_rows = sum(child.processed_rows or 0 for child in children)
+    pending = [child for child in children if child.status in _PENDING_JOB_STATUSES]
+    failed = [child for child in children if child.status == "failed"]
+    if pending:
+        parent.status = "running"
+        parent.stage = f"{len(children) - len(pending)}/{len(children)} done"
+    else:
+        if children and len(failed) == len(children):
+            parent.status = "failed"
+        elif failed or any(child.status == "completed_with_errors" for child in children):
+            parent.status = "completed_with_errors"
+        else:
+            parent.status = "success"
+        parent.stage = "done"
+        failed_names = ", ".join(child.sheet_name or child.filename for child in failed)
+        parent.message = f"Failed: {failed_names}" if failed else "Import finished"
+    db.commit()
+    db.refresh(parent)
+    return parent
+
+
+def import_batch_to_db(
+    db: Session,
+    parent: ImportJob,
+    run: Callable[[ImportJob], ImportResult],
+) -> BatchImportResult:
+    """import job ลูกทีละ job ด้วย run(child) แล้วรวมผลเข้า job แม่ (job ลูกที่ล้มเพราะข้อมูลไม่ครบไม่หยุด job อื่น)
+    ถ้าฐานข้อมูลใช้ไม่ได้กลางทาง job แม่เป็น failed และ job ลูกที่เหลือ resume ทีละ job ได้"""
+    results: list[ImportResult] = []
+    for child in list(parent.children):
+        try:
+            results.append(run(child))
+        except Exception as exc:
+            stop_batch_job(db, parent, f"Import stopped at job {child.id}: {exc}")
+            raise
+    return batch_result(refresh_batch_job(db, parent), results)
+
+
+def batch_result(parent: ImportJob, results: list[ImportResult]) -> BatchImportResult:
+    return BatchImportResult(
+        job_id=parent.id,
+        status=parent.status,
+        filename=parent.filename,
+        total_rows=parent.total_rows,
+        imported_rows=parent.imported_rows,
+        failed_rows=parent.failed_rows,
+        message=parent.message,
+        results=results,
+    )
+
+
+def stop_batch_job(db: Session, parent: ImportJob, message: str) -> None:
+    """job แม่และ job ลูกที่ยังไม่จบเป็น failed (batch หยุดกลางทาง) ไม่ raise ถ้าฐานข้อมูลยังใช้ไม่ได้"""
+    db.rollback()
+    try:
+        for child in parent.children:
+            if child.status in _PENDING_JOB_STATUSES:
+                child.status = "failed"
+                child.stage = "failed"
+                child.message = message
+        set_job_failed(db, parent, message)
+    except SQLAlchemyError:
+        db.rollback()
+
+
+def set_job_stage(db: Session, job: ImportJob, stage: str) -> ImportJob:
+    job.status = "running"
+    job.stage = stage
+    db.commit()
+    return job
+
+
+def _start_job(db: Session, job: ImportJob | None, filename: str, correlation_id: str | None) -> ImportJob:
+    if job is None:
+        return create_job(db, filename=filename, correlation_id=correlation_id or str(uuid4()))
+    return job
+
+
 def _save_errors(db: Session, job_id: int, errors: list[ValidationErrorItem]) -> None:
+    """bulk insert เป็น batch (executemany) แทนการสร้าง ORM object ทีละรายการ (ผู้เรียก commit เอง)"""
     if not errors:
         return
-    db.add_all(
-        [
-            ImportError(
-                job_id=job_id,
-                row_number=item.row_number,
-                column_name=item.column_name,
-                error_message=item.error_message,
-            )
-            for item in errors
-        ]
+    now = datetime.utcnow()
+    batch_size = get_settings().import_batch_size
+    stmt = insert(ImportError.__table__)
+    for start in range(0, len(errors), batch_size):
+        db.execute(
+            stmt,
+            [
+                {
+                    "job_id": job_id,
+                    "row_number": item.row_number,
+                    "column_name": item.column_name,
+                    "error_message": item.error_message,
+                    "created_at": now,
+                }
+                for item in errors[start : start + batch_size]
+            ],
+        )
+
+
+def _dedupe_by_business_key(rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """แถวที่ business_key ซ้ำในไฟล์เดียวกัน ให้แถวหลังสุดชนะ (เหมือนการ update ทับทีละแถว)"""
+    latest: dict[str, dict[str, Any]] = {}
+    for row in rows:
+        latest[row["business_key"]] = row
+    return list(latest.values())
+
+
+def _batched(rows: list[dict[str, Any]], size: int) -> Iterator[list[dict[str, Any]]]:
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+def _fingerprint_value(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, Decimal):
+        # 1.5 กับ 1.50 ถือว่าเท่ากัน
+        return format(value.normalize(), "f")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _row_fingerprint(row: dict[str, Any]) -> str:
+    """hash ของค่าทุก field ที่ upsert เขียน ใช้เทียบว่าแถวเดิมเปลี่ยนหรือไม่"""
+    payload = "\x1f".join(_fingerprint_value(row.get(name)) for name in SALES_RECORD_FIELDS)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _fetch_existing_fingerprints(db: Session, keys: list[str]) -> dict[str, str | None]:
+    existing: dict[str, str | None] = {}
+    for start in range(0, len(keys), KEY_LOOKUP_CHUNK_SIZE):
+        chunk = keys[start : start + KEY_LOOKUP_CHUNK_SIZE]
+        existing.update(
+            db.execute(
+                select(SalesRecord.business_key, SalesRecord.row_fingerprint).where(
+                    SalesRecord.business_key.in_(chunk)
+                )
+            ).all()
+        )
+    return existing
+
+
+def _build_staging_table() -> Table:
+    source = SalesRecord.__table__
+    return Table(
+        "#sales_records_staging",
+        MetaData(),
+        *[Column(name, source.c[name].type) for name in UPSERT_COLUMNS],
     )
-    db.commit()
 
 
-def _upsert_sales_records(db: Session, rows: list[dict[str, Any]]) -> int:
-    imported = 0
-    fields = [
-        "name",
-        "amount",
-        "record_date",
-        "invoice_date",
-        "invoice_no",
-        "item_description",
-        "product_value",
-        "tax_value",
-        "total_value",
-        "vin_no",
-        "cancel_flag",
-        "cancel_product_value",
-        "cancel_tax_value",
-        "cancel_total_value",
-        "org_type_hq",
-        "org_type_branch_no",
-        "taxpayer_id",
-        "sale_price",
-        "com_fn",
-        "com_value",
-        "rule_applied",
-        "is_duplicate_tank",
-        "group_id",
-    ]
+def _merge_via_staging(db: Session, rows: list[dict[str, Any]], batch_size: int) -> tuple[int, int]:
+    """SQL Server: โหลดเข้า temp table เป็น batch ใหญ่ แล้ว MERGE ครั้งเดียวด้วย business_key
+    แถวที่ fingerprint ตรงกับของเดิมจะไม่ถูก UPDATE"""
+    staging = _build_staging_table()
+    conn = db.connection()
+    staging.create(conn)
+    try:
+        for batch in _batched(rows, batch_size):
+            conn.execute(staging.insert(), batch)
+        update_set = ", ".join(f"target.{name} = source.{name}" for name in UPSERT_COLUMNS[1:])
+        insert_columns = ", ".join([*UPSERT_COLUMNS, "created_at", "updated_at"])
+        insert_values = ", ".join([*(f"source.{name}" for name in UPSERT_COLUMNS), ":now", ":now"])
+        merge_sql = text(
+            f"MERGE sales_records WITH (HOLDLOCK) AS target "
+            f"USING {staging.name} AS source ON target.business_key = source.business_key "
+            f"WHEN MATCHED AND (target.row_fingerprint IS NULL "
+            f"OR target.row_fingerprint <> source.row_fingerprint) "
+            f"THEN UPDATE SET {update_set}, target.updated_at = :now "
+            f"WHEN NOT MATCHED THEN INSERT ({insert_columns}) VALUES ({insert_values}) "
+            f"OUTPUT $action;"
+        )
+        actions = conn.execute(merge_sql, {"now": datetime.utcnow()}).scalars().all()
+    finally:
+        staging.drop(conn)
+    inserted = sum(1 for action in actions if action == "INSERT")
+    return inserted, len(actions) - inserted
+
+
+def _upsert_on_conflict(
+    db: Session,
+    rows: list[dict[str, Any]],
+    batch_size: int,
+    dialect_name: str,
+    existing_keys: set[str],
+) -> tuple[int, int]:
+    """SQLite/PostgreSQL: INSERT ... ON CONFLICT (business_key) DO UPDATE เป็น batch"""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    updated = sum(1 for row in rows if row["business_key"] in existing_keys)
+    now = datetime.utcnow()
+    stmt = dialect_insert(SalesRecord.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["business_key"],
+        set_={**{name: stmt.excluded[name] for name in UPSERT_COLUMNS[1:]}, "updated_at": now},
+    )
+    for batch in _batched(rows, batch_size):
+        db.execute(stmt, [{**row, "created_at": now, "updated_at": now} for row in batch])
+    return len(rows) - updated, updated
+
+
+def _write_sales_rows(db: Session, rows: list[dict[str, Any]], existing_keys: set[str]) -> tuple[int, int]:
+    batch_size = get_settings().import_batch_size
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name == "mssql":
+        return _merge_via_staging(db, rows, batch_size)
+    return _upsert_on_conflict(db, rows, batch_size, dialect_name, existing_keys)
+
+
+def _upsert_sales_records(db: Session, rows: list[dict[str, Any]]) -> tuple[int, int, int]:
+    """upsert แบบ set-based คืนค่า (inserted, updated, unchanged) ผู้เรียก commit เอง
+    เทียบ fingerprint กับของเดิมก่อน แถวที่ไม่เปลี่ยนจะไม่ถูกเขียนเลย (updated_at ไม่ขยับ)"""
+    rows = _dedupe_by_business_key(rows)
+    if not rows:
+        return 0, 0, 0
     for row in rows:
-        existing = db.scalar(select(SalesRecord).where(SalesRecord.business_key == row["business_key"]))
-        if existing is None:
-            db.add(SalesRecord(**row))
-        else:
-            for field_name in fields:
-                setattr(existing, field_name, row.get(field_name))
-        imported += 1
-    db.commit()
-    return imported
+        row["row_fingerprint"] = _row_fingerprint(row)
+    existing = _fetch_existing_fingerprints(db, [row["business_key"] for row in rows])
+    changed = [row for row in rows if existing.get(row["business_key"], "") != row["row_fingerprint"]]
+    unchanged = len(rows) - len(changed)
+    if not changed:
+        return 0, 0, unchanged
+    inserted, updated = _write_sales_rows(db, changed, set(existing))
+    # SQL Server: แถวที่ระหว่างนี้ถูกเขียนเป็นค่าเดียวกันไปแล้ว MERGE จะข้าม นับเป็น unchanged
+    unchanged += len(changed) - inserted - updated
+    return inserted, updated, unchanged
+
+
+def _upsert_sales_groups(db: Session, groups: list[list[dict[str, Any]]]) -> list[tuple[int, int, int]]:
+    """upsert แถวของหลายไฟล์ด้วยคำสั่งชุดเดียว (ค้น key เดิมครั้งเดียว แล้วเขียนแถวสุดท้ายของแต่ละ key)
+    คืน (inserted, updated, unchanged) ต่อกลุ่ม นับเหมือน upsert ทีละกลุ่มตามลำดับ: key ที่กลุ่มก่อนหน้าเขียนแล้ว
+    นับเป็น updated หรือ unchanged ของกลุ่มถัดไป ผู้เรียก commit เอง"""
+    groups = [_dedupe_by_business_key(rows) for rows in groups]
+    keys: dict[str, None] = {}
+    for rows in groups:
+        for row in rows:
+            row["row_fingerprint"] = _row_fingerprint(row)
+            keys[row["business_key"]] = None
+    existing = _fetch_existing_fingerprints(db, list(keys))
+    current: dict[str, str | None] = dict(existing)
+    latest: dict[str, dict[str, Any]] = {}
+    counts = []
+    for rows in groups:
+        inserted = updated = unchanged = 0
+        for row in rows:
+            key = row["business_key"]
+            if key not in current:
+                inserted += 1
+            elif current[key] == row["row_fingerprint"]:
+                unchanged += 1
+                continue
+            else:
+                updated += 1
+            current[key] = row["row_fingerprint"]
+            latest[key] = row
+        counts.append((inserted, updated, unchanged))
+    if latest:
+        _write_sales_rows(db, list(latest.values()), set(existing))
+    return counts
+
+
+def _set_job_done(job: ImportJob, total_rows: int, imported_rows: int, failed_rows: int, message: str | None) -> None:
+    job.total_rows = total_rows
+    job.imported_rows = imported_rows
+    job.failed_rows = failed_rows
+    job.processed_rows = total_rows
+    job.status = "success" if failed_rows == 0 else "completed_with_errors"
+    job.stage = "done"
+    job.message = message
 
 
 def _finalize_job(
@@ -301,11 +732,7 @@ def _finalize_job(
     failed_rows: int,
     message: str | None = None,
 ) -> ImportJob:
-    job.total_rows = total_rows
-    job.imported_rows = imported_rows
-    job.failed_rows = failed_rows
-    job.status = "success" if failed_rows == 0 else "completed_with_errors"
-    job.message = message
+    _set_job_done(job, total_rows, imported_rows, failed_rows, message)
     db.commit()
     db.refresh(job)
     return job
@@ -313,61 +740,332 @@ def _finalize_job(
 
 def set_job_failed(db: Session, job: ImportJob, message: str) -> ImportJob:
     job.status = "failed"
+    job.stage = "failed"
     job.message = message
     db.commit()
     db.refresh(job)
     return job
 
 
+def _save_stage_timings(db: Session, job: ImportJob, timer: StageTimer) -> None:
+    """รวมเวลาของ stage ที่ยังไม่ได้บันทึกเข้าแถวของ job (ผู้เรียก commit เอง)"""
+    pending = timer.drain()
+    if not pending:
+        return
+    existing = {row.stage: row for row in job.stages}
+    for name, timing in pending.items():
+        row = existing.get(name)
+        if row is None:
+            row = ImportJobStage(stage=name, seconds=0.0, rows=0, calls=0)
+            job.stages.append(row)
+        row.seconds += timing.seconds
+        row.rows += timing.rows
+        row.calls += timing.calls
+
+
+def failed_job_result(db: Session, job: ImportJob, message: str) -> ImportResult:
+    failed = set_job_failed(db, job, message)
+    return ImportResult(
+        job_id=failed.id,
+        status=failed.status,
+        filename=failed.filename,
+        sheet_name=failed.sheet_name,
+        total_rows=0,
+        imported_rows=0,
+        failed_rows=0,
+        message=failed.message,
+        errors=[],
+    )
+
+
+def _missing_columns_result(db: Session, job: ImportJob, missing: list[str], timer: StageTimer) -> ImportResult:
+    _save_stage_timings(db, job, timer)
+    return failed_job_result(db, job, f"Missing required columns: {', '.join(missing)}")
+
+
+def _build_result(
+    job: ImportJob,
+    inserted_rows: int,
+    updated_rows: int,
+    unchanged_rows: int,
+    duplicate_rows: int,
+    report: ErrorReport,
+) -> ImportResult:
+    return ImportResult(
+        job_id=job.id,
+        status=job.status,
+        filename=job.filename,
+        sheet_name=job.sheet_name,
+        total_rows=job.total_rows,
+        imported_rows=job.imported_rows,
+        inserted_rows=inserted_rows,
+        updated_rows=updated_rows,
+        unchanged_rows=unchanged_rows,
+        duplicate_rows=duplicate_rows,
+        failed_rows=job.failed_rows,
+        message=job.message,
+        errors=[
+            ImportErrorItem(
+                row_number=item.row_number,
+                column_name=item.column_name,
+                error_message=item.error_message,
+            )
+            for item in report.items
+        ],
+        error_count=report.count,
+        errors_truncated=report.count > len(report.items),
+        error_summary=report.summary(),
+    )
+
+
+@dataclass
+class _ImportTotals:
+    inserted_rows: int = 0
+    updated_rows: int = 0
+    unchanged_rows: int = 0
+    duplicate_rows: int = 0
+
+
+@dataclass
+class _ValidatedChunk:
+    """ช่วงแถวหนึ่ง commit ที่ตรวจแล้ว valid_count คือจำนวนแถวที่ผ่านการตรวจก่อนตัดแถวที่ key ซ้ำกับช่วงหลัง"""
+
+    end_row: int
+    row_count: int
+    rows: list[dict[str, Any]]
+    errors: list[ValidationErrorItem]
+    valid_count: int
+
+
+def _validate_chunk(prepared: pd.DataFrame, end_row: int, timer: StageTimer) -> _ValidatedChunk:
+    with timer.stage("validate", len(prepared)):
+        valid_rows, errors = validate_and_transform_rows(prepared)
+    return _ValidatedChunk(end_row, len(prepared), valid_rows, errors, len(valid_rows))
+
+
+def _drop_superseded_rows(chunks: list[_ValidatedChunk]) -> None:
+    """ตัดแถวที่ business_key ไปซ้ำในช่วงหลังออก แต่ละ key ถูกเขียนครั้งเดียวด้วยแถวหลังสุดของไฟล์
+    (ผลเหมือน import ทั้ง frame ใน commit เดียว ไม่ขึ้นกับ IMPORT_COMMIT_ROWS) ซ้ำภายในช่วงเดียวกัน upsert ตัดเอง"""
+    seen: set[str] = set()
+    for chunk in reversed(chunks):
+        keys = {row["business_key"] for row in chunk.rows}
+        if seen:
+            chunk.rows = [row for row in chunk.rows if row["business_key"] not in seen]
+        seen |= keys
+
+
+def _import_chunk(
+    db: Session,
+    job: ImportJob,
+    chunk: _ValidatedChunk,
+    totals: _ImportTotals,
+    report: ErrorReport,
+    timer: StageTimer,
+) -> None:
+    """upsert หนึ่งช่วงแถว แล้ว commit พร้อม error ตัวนับ และ checkpoint ของ job ใน transaction เดียว
+    ถ้าหลุดกลางทาง ช่วงนี้จะ rollback ทั้งหมด resume จึงเริ่มที่ checkpoint ได้โดยไม่มีแถวซ้ำหรือขาด"""
+    with timer.stage("write_errors", len(chunk.errors)):
+        _save_errors(db, job.id, chunk.errors)
+    with timer.stage("upsert", len(chunk.rows)):
+        inserted, updated, unchanged = _upsert_sales_records(db, chunk.rows)
+    job.total_rows += chunk.row_count
+    # imported_rows นับทุกแถวที่ผ่านการตรวจ รวมแถวที่ business_key ซ้ำแล้วถูกแถวหลังทับ (duplicate_rows)
+    job.imported_rows += chunk.valid_count
+    job.failed_rows += len({item.row_number for item in chunk.errors})
+    job.processed_rows = job.total_rows
+    job.checkpoint_rows = chunk.end_row
+    _save_stage_timings(db, job, timer)
+    db.commit()
+    totals.inserted_rows += inserted
+    totals.updated_rows += updated
+    totals.unchanged_rows += unchanged
+    totals.duplicate_rows += chunk.valid_count - inserted - updated - unchanged
+    report.add(chunk.errors)
+
+
+def _set_job_interrupted(db: Session, job: ImportJob, exc: Exception, timer: StageTimer) -> None:
+    """rollback ช่วงที่ยังไม่ commit แล้วบันทึกว่า job ล้ม (job ไม่ค้างสถานะ running) ต่อได้ด้วย resume"""
+    db.rollback()
+    try:
+        _save_stage_timings(db, job, timer)
+        set_job_failed(db, job, f"Import stopped after {job.checkpoint_rows or 0} committed rows: {exc}")
+    except SQLAlchemyError:
+        # ฐานข้อมูลยังใช้ไม่ได้ สถานะจะถูกแก้ตอน resume
+        db.rollback()
+
+
+def _resume_offset(job: ImportJob) -> int:
+    return job.checkpoint_rows or 0
+
+
 def import_dataframe_to_db(
     db: Session,
     frame: pd.DataFrame,
     filename: str,
     correlation_id: str | None = None,
+    job: ImportJob | None = None,
+    timer: StageTimer | None = None,
 ) -> ImportResult:
-    job = _create_job(db, filename=filename, correlation_id=correlation_id or str(uuid4()))
-    prepared = prepare_import_dataframe(frame)
+    """import ทั้ง frame โดย commit ทีละ IMPORT_COMMIT_ROWS แถว job ที่มี checkpoint (resume) เริ่มต่อจากแถวนั้น
+    ตรวจทุกช่วงก่อนเขียน เพื่อให้ key ที่ซ้ำข้ามช่วงถูกเขียนครั้งเดียวด้วยแถวหลังสุด
+    ตัวนับของ response (inserted/updated/errors) นับเฉพาะรอบนี้ ส่วนตัวนับของ job รวมทุกรอบ
+    timer ที่ส่งมามีเวลาของ stage ก่อนหน้า (read, rules) ซึ่งจะถูกบันทึกลง job ด้วย"""
+    job = _start_job(db, job, filename, correlation_id)
+    timer = timer or StageTimer(job.correlation_id)
+    with timer.stage("prepare", len(frame)):
+        prepared = prepare_import_dataframe(frame)
     missing = [col for col in REQUIRED_COLUMNS if col not in prepared.columns]
     if missing:
-        failed = set_job_failed(db, job, f"Missing required columns: {', '.join(missing)}")
-        return ImportResult(
-            job_id=failed.id,
-            status=failed.status,
-            filename=failed.filename,
-            total_rows=0,
-            imported_rows=0,
-            failed_rows=0,
-            message=failed.message,
-            errors=[],
-        )
+        return _missing_columns_result(db, job, missing, timer)
+
+    set_job_stage(db, job, "writing")
+    commit_rows = get_settings().import_commit_rows
+    totals = _ImportTotals()
+    report = _new_error_report()
+    try:
+        chunks = []
+        for start in range(_resume_offset(job), len(prepared), commit_rows):
+            end = min(start + commit_rows, len(prepared))
+            chunks.append(_validate_chunk(prepared.iloc[start:end], end, timer))
+        _drop_superseded_rows(chunks)
+        # pop จากท้าย (ลำดับกลับแล้ว) คืนหน่วยความจำของแต่ละช่วงทันทีที่ commit
+        chunks.reverse()
+        while chunks:
+            _import_chunk(db, job, chunks.pop(), totals, report, timer)
+    except Exception as exc:
+        _set_job_interrupted(db, job, exc, timer)
+        raise
+
+    _save_stage_timings(db, job, timer)
 
-    valid_rows, validation_errors = validate_and_transform_rows(prepared)
-    _save_errors(db, job.id, validation_errors)
-    imported_rows = _upsert_sales_records(db, valid_rows) if valid_rows else 0
-    total_rows = len(prepared)
-    failed_rows = len({item.row_number for item in validation_errors})
     updated = _finalize_job(
         db,
         job,
-        total_rows=total_rows,
-        imported_rows=imported_rows,
-        failed_rows=failed_rows,
+        total_rows=job.total_rows,
+        imported_rows=job.imported_rows,
+        failed_rows=job.failed_rows,
         message="Import finished",
     )
-    return ImportResult(
-        job_id=updated.id,
-        status=updated.status,
-        filename=updated.filename,
-        total_rows=updated.total_rows,
-        imported_rows=updated.imported_rows,
-        failed_rows=updated.failed_rows,
-        message=updated.message,
-        errors=[
-            ImportErrorItem(
-                row_number=item.row_number,
-                column_name=item.column_name,
-                error_message=item.error_message,
-            )
-            for item in validation_errors
-        ],
+    return _build_result(
+        updated, totals.inserted_rows, totals.updated_rows, totals.unchanged_rows, totals.duplicate_rows, report
+    )
+
+
+@dataclass
+class BatchEntry:
+    """ไฟล์หนึ่งของ batch upload ที่ตรวจแล้ว เก็บเฉพาะแถวที่แปลงแล้วกับ error ไม่ถือ DataFrame ของไฟล์ไว้"""
+
+    job: ImportJob
+    timer: StageTimer
+    total_rows: int
+    rows: list[dict[str, Any]]
+    errors: list[ValidationErrorItem]
+
+
+def check_batch_frame(db: Session, job: ImportJob, frame: pd.DataFrame, timer: StageTimer) -> BatchEntry | ImportResult:
+    """prepare + ตรวจไฟล์หนึ่งของ batch (job ลูก) ไฟล์ที่ขาดคอลัมน์จำเป็นคืน ImportResult ที่ job เป็น failed ทันที"""
+    with timer.stage("prepare", len(frame)):
+        prepared = prepare_import_dataframe(frame)
+    missing = [col for col in REQUIRED_COLUMNS if col not in prepared.columns]
+    if missing:
+        return _missing_columns_result(db, job, missing, timer)
+    with timer.stage("validate", len(prepared)):
+        valid_rows, errors = validate_and_transform_rows(prepared)
+    return BatchEntry(job, timer, len(prepared), valid_rows, errors)
+
+
+def import_batch_entries(db: Session, entries: list[BatchEntry]) -> list[ImportResult]:
+    """import หลายไฟล์ของ batch upload ใน transaction เดียว: error ผูกกับ job ของไฟล์นั้น
+    แล้ว upsert แถวของทุกไฟล์รวมเป็นชุดเดียวด้วย _upsert_sales_groups
+    ตัวนับของแต่ละ job เหมือน import ทีละไฟล์ตามลำดับ คืนผลตามลำดับของ entries"""
+    try:
+        for entry in entries:
+            with entry.timer.stage("write_errors", len(entry.errors)):
+                _save_errors(db, entry.job.id, entry.errors)
+        started = time.perf_counter()
+        counts = _upsert_sales_groups(db, [entry.rows for entry in entries])
+        seconds = time.perf_counter() - started
+        total_valid = sum(len(entry.rows) for entry in entries) or 1
+        for entry, (inserted, updated, unchanged) in zip(entries, counts):
+            job = entry.job
+            # เวลา upsert ที่ใช้ร่วมกันแบ่งให้แต่ละ job ตามสัดส่วนจำนวนแถว
+            entry.timer.record("upsert", seconds * len(entry.rows) / total_valid, len(entry.rows))
+            failed_rows = len({item.row_number for item in entry.errors})
+            _set_job_done(job, entry.total_rows, len(entry.rows), failed_rows, "Import finished")
+            job.checkpoint_rows = entry.total_rows
+            _save_stage_timings(db, job, entry.timer)
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        for entry in entries:
+            try:
+                set_job_failed(db, entry.job, f"Import failed: {exc}")
+            except SQLAlchemyError:
+                db.rollback()
+        raise
+
+    results = []
+    for entry, (inserted, updated, unchanged) in zip(entries, counts):
+        report = _new_error_report()
+        report.add(entry.errors)
+        duplicates = len(entry.rows) - inserted - updated - unchanged
+        results.append(_build_result(entry.job, inserted, updated, unchanged, duplicates, report))
+    return results
+
+
+def import_excel_stream_to_db(
+    db: Session,
+    source: ExcelSource,
+    filename: str,
+    correlation_id: str | None = None,
+    chunk_size: int | None = None,
+    job: ImportJob | None = None,
+    timer: StageTimer | None = None,
+    sheet: SheetRef = 0,
+) -> ImportResult:
+    """import แบบ streaming: อ่าน map ตรวจ และ upsert ทีละ chunk ใช้ memory ตามขนาด chunk ไม่ใช่ขนาดไฟล์
+    แต่ละ chunk commit พร้อม checkpoint ตอน resume chunk ที่ commit แล้วจะอ่านผ่านไปโดยไม่ตรวจหรือเขียนซ้ำ
+    (ยังไม่เห็น chunk ถัดไป business_key ที่ซ้ำข้าม chunk จึงถูกเขียนตาม chunk ที่พบ)"""
+    job = _start_job(db, job, filename, correlation_id)
+    timer = timer or StageTimer(job.correlation_id)
+    set_job_stage(db, job, "streaming")
+    chunk_size = chunk_size or get_settings().import_chunk_rows
+    resume_from = _resume_offset(job)
+    totals = _ImportTotals()
+    report = _new_error_report()
+    try:
+        chunks = iter_excel_chunks(source, filename, chunk_size, import_column_positions, sheet)
+        for chunk in timer.timed_chunks("read", chunks):
+            # index ของ chunk คือตำแหน่งแถวในไฟล์
+            end = int(chunk.index[-1]) + 1
+            if end <= resume_from:
+                continue
+            if int(chunk.index[0]) < resume_from:
+                chunk = chunk.loc[resume_from:]
+            with timer.stage("prepare", len(chunk)):
+                prepared = prepare_import_dataframe(chunk)
+            missing = [col for col in REQUIRED_COLUMNS if col not in prepared.columns]
+            if missing:
+                return _missing_columns_result(db, job, missing, timer)
+            _import_chunk(db, job, _validate_chunk(prepared, end, timer), totals, report, timer)
+    except ExcelReadError as exc:
+        db.rollback()
+        set_job_failed(db, job, str(exc))
+        raise
+    except Exception as exc:
+        _set_job_interrupted(db, job, exc, timer)
+        raise
+
+    _save_stage_timings(db, job, timer)
+
+    updated = _finalize_job(
+        db,
+        job,
+        total_rows=job.total_rows,
+        imported_rows=job.imported_rows,
+        failed_rows=job.failed_rows,
+        message="Import finished",
+    )
+    return _build_result(
+        updated, totals.inserted_rows, totals.updated_rows, totals.unchanged_rows, totals.duplicate_rows, report
     )
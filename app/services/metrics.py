@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections.abc import Iterable, Iterator, Sized
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TypeVar
+
+ChunkT = TypeVar("ChunkT", bound=Sized)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+@dataclass
+class _Exemplar:
+    correlation_id: str
+    value: float
+    timestamp: float
+
+
+@dataclass
+class _HistogramSeries:
+    counts: list[int]
+    total: float = 0.0
+    count: int = 0
+    exemplars: dict[int, _Exemplar] = field(default_factory=dict)
+
+
+class Histogram:
+    """histogram แบบ cumulative bucket ของ Prometheus label ต้องมีค่าจำกัด (endpoint, stage)
+    correlation id จึงแนบเป็น exemplar ของ bucket (OpenMetrics) แทนการเป็น label"""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...], buckets=LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple[str, ...], _HistogramSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple[str, ...], value: float, correlation_id: str | None = None) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = _HistogramSeries([0] * (len(self.buckets) + 1))
+            bucket = next((idx for idx, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            series.counts[bucket] += 1
+            series.total += value
+            series.count += 1
+            if correlation_id:
+                series.exemplars[bucket] = _Exemplar(correlation_id, value, time.time())
+
+    def render(self, openmetrics: bool) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for idx, bound in enumerate((*self.buckets, math.inf)):
+                    cumulative += series.counts[idx]
+                    label_text = _format_labels(self.label_names, labels, f'le="{_format_value(bound)}"')
+                    line = f"{self.name}_bucket{label_text} {cumulative}"
+                    exemplar = series.exemplars.get(idx) if openmetrics else None
+                    if exemplar is not None:
+                        line += (
+                            f' # {{correlation_id="{_escape(exemplar.correlation_id)}"}} '
+                            f"{_format_value(exemplar.value)} {exemplar.timestamp:.3f}"
+                        )
+                    lines.append(line)
+                label_text = _format_labels(self.label_names, labels)
+                lines.append(f"{self.name}_sum{label_text} {_format_value(series.total)}")
+                lines.append(f"{self.name}_count{label_text} {series.count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple[str, ...], amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self, openmetrics: bool) -> list[str]:
+        # OpenMetrics ตั้งชื่อ family ไม่มี _total แต่ sample ต้องมี
+        family = self.name.removesuffix("_total") if openmetrics else self.name
+        lines = [f"# HELP {family} {self.help_text}", f"# TYPE {family} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency until the response headers are sent.",
+    ("method", "path", "status"),
+)
+IMPORT_STAGE_SECONDS = Histogram(
+    "import_stage_duration_seconds",
+    "Time spent in each import/transform stage.",
+    ("stage",),
+)
+IMPORT_STAGE_ROWS = Counter(
+    "import_stage_rows_total",
+    "Rows processed by each import/transform stage.",
+    ("stage",),
+)
+_REGISTRY: list[Histogram | Counter] = [HTTP_REQUEST_SECONDS, IMPORT_STAGE_SECONDS, IMPORT_STAGE_ROWS]
+
+
+def render_metrics(openmetrics: bool = False) -> str:
+    lines = [line for metric in _REGISTRY for line in metric.render(openmetrics)]
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+@dataclass
+class StageTiming:
+    seconds: float = 0.0
+    rows: int = 0
+    calls: int = 0
+
+
+@dataclass
+class _StageRun:
+    rows: int = 0
+
+
+class StageTimer:
+    """จับเวลาแต่ละ stage ของงานหนึ่งงาน (read, rules, prepare, validate, upsert ...)
+    ส่งเข้า histogram ทันที และสะสมค่าที่ยังไม่ได้บันทึกลง job ไว้ให้ import_service ดึงไปเขียน (drain)"""
+
+    def __init__(self, correlation_id: str | None = None) -> None:
+        self.correlation_id = correlation_id
+        self._pending: dict[str, StageTiming] = {}
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0) -> Iterator[_StageRun]:
+        run = _StageRun(rows)
+        started = time.perf_counter()
+        try:
+            yield run
+        finally:
+            self.record(name, time.perf_counter() - started, run.rows)
+
+    def record(self, name: str, seconds: float, rows: int = 0) -> None:
+        IMPORT_STAGE_SECONDS.observe((name,), seconds, self.correlation_id)
+        IMPORT_STAGE_ROWS.inc((name,), rows)
+        timing = self._pending.setdefault(name, StageTiming())
+        timing.seconds += seconds
+        timing.rows += rows
+        timing.calls += 1
+
+    def timed_chunks(self, name: str, chunks: Iterable[ChunkT]) -> Iterator[ChunkT]:
+        """จับเวลาการดึงแต่ละ chunk จาก iterator (เช่นการอ่าน excel แบบ streaming) โดยไม่รวมเวลาที่ผู้ใช้ chunk ทำงาน"""
+        iterator = iter(chunks)
+        while True:
+            with self.stage(name) as run:
+                chunk = next(iterator, None)
+                run.rows = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+    def drain(self) -> dict[str, StageTiming]:
+        pending, self._pending = self._pending, {}
+        return pending
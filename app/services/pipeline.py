@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pandas as pd
+
+from app.schemas import PreviewResponse, TransformOptions
+from app.services.cpu_pool import run_cpu_bound
+from app.services.excel_reader import ExcelSource, SheetRef, read_excel_bytes
+from app.services.import_service import import_column_positions
+from app.services.metrics import StageTimer
+from app.services.rules_engine import RuleEngineResult, apply_business_rules
+from app.services.workbook_cache import content_hash, get_workbook_cache
+
+PREVIEW_ROWS = 200
+
+
+def _sheet_key(digest: str, sheet: SheetRef) -> str:
+    # sheet แรก (ค่าเริ่มต้น) ใช้ key เดิมของไฟล์
+    return digest if sheet == 0 else f"{digest}:{sheet}"
+
+
+def parse_and_transform(
+    source: ExcelSource, filename: str | None, options: TransformOptions, sheet: SheetRef = 0
+) -> tuple[pd.DataFrame, RuleEngineResult, float, float]:
+    """parse + rules ในฟังก์ชันเดียว ส่งเข้า cpu_pool ได้ครั้งเดียวไม่ต้องส่ง DataFrame ข้าม process ไปกลับ
+    คืนเวลาที่ใช้ของแต่ละขั้น (วินาที) มาด้วย เพราะจับเวลาจากฝั่งผู้เรียกแยกสองขั้นไม่ได้"""
+    started = time.perf_counter()
+    frame = read_excel_bytes(source, filename, sheet=sheet)
+    read_seconds = time.perf_counter() - started
+    result = apply_business_rules(frame, options)
+    return frame, result, read_seconds, time.perf_counter() - started - read_seconds
+
+
+async def load_import_workbook(
+    source: ExcelSource,
+    filename: str | None,
+    timer: StageTimer | None = None,
+    digest: str | None = None,
+    sheet: SheetRef = 0,
+) -> pd.DataFrame:
+    """อ่านไฟล์สำหรับ import ตรง: materialize เฉพาะคอลัมน์ที่ import ใช้ (cache แยกจาก frame เต็มของ transform)"""
+    timer = timer or StageTimer()
+    cache = get_workbook_cache()
+    digest = _sheet_key(digest or content_hash(source), sheet)
+    frame = cache.get_frame(digest, "import")
+    if frame is None:
+        with timer.stage("read") as run:
+            frame = await run_cpu_bound(read_excel_bytes, source, filename, import_column_positions, None, sheet)
+            run.rows = len(frame)
+        cache.put_frame(digest, frame, "import")
+    return frame
+
+
+async def transform_upload(
+    source: ExcelSource,
+    filename: str | None,
+    options: TransformOptions,
+    timer: StageTimer | None = None,
+    digest: str | None = None,
+    sheet: SheetRef = 0,
+) -> RuleEngineResult:
+    """ผล rules ของ sheet ใช้ cache ตาม hash ของไฟล์ + sheet + options ส่งไฟล์เดิมซ้ำ (preview -> transform -> import)
+    จะไม่ต้อง parse หรือรัน rules ใหม่ (ขั้นที่ได้จาก cache จะไม่ถูกจับเวลา)
+    source เป็น path ได้ (upload ที่ spool ไว้) process pool จะได้รับแค่ path ไม่ต้อง pickle ทั้งไฟล์"""
+    timer = timer or StageTimer()
+    cache = get_workbook_cache()
+    digest = _sheet_key(digest or content_hash(source), sheet)
+    result = cache.get_rules(digest, options)
+    if result is not None:
+        return result
+    frame = cache.get_frame(digest)
+    if frame is None:
+        frame, result, read_seconds, rules_seconds = await run_cpu_bound(
+            parse_and_transform, source, filename, options, sheet
+        )
+        timer.record("read", read_seconds, len(frame))
+        timer.record("rules", rules_seconds, len(frame))
+        cache.put_frame(digest, frame)
+    else:
+        with timer.stage("rules", len(frame)):
+            result = await run_cpu_bound(apply_business_rules, frame, options)
+    cache.put_rules(digest, options, result)
+    return result
+
+
+async def transform_sheets(
+    source: ExcelSource,
+    filename: str | None,
+    options: TransformOptions,
+    timers: dict[str, StageTimer],
+    digest: str | None = None,
+) -> dict[str, RuleEngineResult]:
+    """transform_upload ของทุก sheet ใน timers (ชื่อ sheet -> timer ของ sheet นั้น) พร้อมกันบน cpu_pool
+    แต่ละ worker เปิดไฟล์เองแล้ว parse เฉพาะ sheet ของตัวเอง คืนผลตามลำดับของ timers"""
+    digest = digest or content_hash(source)
+    results = await asyncio.gather(
+        *(transform_upload(source, filename, options, timer, digest, sheet) for sheet, timer in timers.items())
+    )
+    return dict(zip(timers, results))
+
+
+async def load_import_sheets(
+    source: ExcelSource,
+    filename: str | None,
+    timers: dict[str, StageTimer],
+    digest: str | None = None,
+) -> dict[str, pd.DataFrame]:
+    """load_import_workbook ของทุก sheet ใน timers พร้อมกันบน cpu_pool"""
+    digest = digest or content_hash(source)
+    frames = await asyncio.gather(
+        *(load_import_workbook(source, filename, timer, digest, sheet) for sheet, timer in timers.items())
+    )
+    return dict(zip(timers, frames))
+
+
+class PreviewQueryError(ValueError):
+    pass
+
+
+def _as_plain(column: pd.Series) -> pd.Series:
+    # category เรียงตามลำดับที่พบค่าและ fillna ค่าที่ไม่อยู่ใน categories ไม่ได้ จึงใช้ค่าจริงแบบ object
+    return column.astype(object) if isinstance(column.dtype, pd.CategoricalDtype) else column
+
+
+def _sort_frame(frame: pd.DataFrame, sort_by: str, descending: bool) -> pd.DataFrame:
+    try:
+        if isinstance(frame[sort_by].dtype, pd.CategoricalDtype):
+            return frame.sort_values(
+                sort_by, ascending=not descending, kind="stable", na_position="last", key=_as_plain
+            )
+        return frame.sort_values(sort_by, ascending=not descending, kind="stable", na_position="last")
+    except TypeError:
+        # คอลัมน์ที่มีค่าหลายชนิดปนกัน (เช่น วันที่กับข้อความ) เรียงแบบข้อความแทน
+        return frame.sort_values(
+            sort_by,
+            ascending=not descending,
+            kind="stable",
+            na_position="last",
+            key=lambda column: column.astype(str),
+        )
+
+
+def query_preview_frame(
+    frame: pd.DataFrame,
+    rule_applied: str | None = None,
+    is_duplicate_tank: bool | None = None,
+    sort_by: str | None = None,
+    descending: bool = False,
+) -> pd.DataFrame:
+    """กรอง/เรียงผล transform ที่ cache ไว้สำหรับหน้า preview (ไม่แก้ frame ต้นฉบับ)"""
+    mask = pd.Series(True, index=frame.index)
+    if rule_applied is not None and "rule_applied" in frame.columns:
+        mask &= _as_plain(frame["rule_applied"]).fillna("").astype(str).eq(rule_applied)
+    if is_duplicate_tank is not None and "is_duplicate_tank" in frame.columns:
+        mask &= _as_plain(frame["is_duplicate_tank"]).fillna(False).astype(bool).eq(is_duplicate_tank)
+    view = frame if mask.all() else frame[mask]
+    if sort_by:
+        if sort_by not in view.columns:
+            raise PreviewQueryError(f"Unknown sort column: {sort_by}")
+        view = _sort_frame(view, sort_by, descending)
+    return view
+
+
+def build_preview(
+    result: RuleEngineResult,
+    token: str | None = None,
+    frame: pd.DataFrame | None = None,
+    offset: int = 0,
+    limit: int = PREVIEW_ROWS,
+) -> PreviewResponse:
+    view = result.dataframe if frame is None else frame
+    preview_df = view.iloc[offset : offset + limit]
+    return PreviewResponse(
+        columns=[str(col) for col in preview_df.columns.tolist()],
+        rows=preview_df.where(preview_df.notna(), None).to_dict(orient="records"),
+        stats=result.stats,
+        issues=result.issues,
+        token=token,
+        total_rows=len(view),
+        offset=offset,
+        limit=limit,
+    )
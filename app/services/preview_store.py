@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from app.core.config import get_settings
+from app.services.rules_engine import RuleEngineResult
+
+
+@dataclass
+class _PreviewEntry:
+    result: RuleEngineResult
+    expires_at: float
+
+
+class PreviewStore:
+    """เก็บผล transform ของ preview ไว้ใต้ token เพื่อให้เปิดหน้าถัดไปได้โดยไม่ต้อง upload/parse ใหม่
+    token หมดอายุเมื่อไม่ได้ใช้เกิน ttl วินาที (ต่ออายุทุกครั้งที่อ่าน) และเก็บได้ไม่เกิน max_entries รายการ"""
+
+    def __init__(self, ttl_seconds: int, max_entries: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, _PreviewEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [token for token, entry in self._entries.items() if entry.expires_at <= now]
+        for token in expired:
+            del self._entries[token]
+
+    def put(self, result: RuleEngineResult) -> str:
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            self._entries[token] = _PreviewEntry(result, now + self.ttl_seconds)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return token
+
+    def get(self, token: str) -> RuleEngineResult | None:
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            entry.expires_at = now + self.ttl_seconds
+            self._entries.move_to_end(token)
+            return entry.result
+
+
+_store: PreviewStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_preview_store() -> PreviewStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            settings = get_settings()
+            _store = PreviewStore(
+                ttl_seconds=settings.preview_ttl_seconds,
+                max_entries=settings.preview_max_tokens,
+            )
+        return _store
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import re
+import sys
+import threading
+import weakref
+from collections import Counter
+from collections.abc import AsyncIterator, Callable, Mapping
+from contextvars import ContextVar
+from functools import partial
+from pathlib import Path
+from types import FrameType
+from typing import Any, TypeVar
+
+from fastapi import concurrency
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_TOKEN_HEADER = "X-Profile-Token"
+PROFILE_SUFFIX = ".folded"
+_SAFE_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+# frame บนสุดของ thread ที่ว่าง (รอคิว/รอ event loop) ไม่นับเป็น sample
+# (_worker ของ ThreadPoolExecutor รอ SimpleQueue.get ที่เป็น C จึงไม่มี frame ของ get)
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("connection.py", "wait"),
+}
+# profile ของ request ที่กำลังทำงาน task ลูกและ thread ที่รับงานต่อได้ค่านี้ผ่าน context ที่คัดลอกไป
+_current_profile: ContextVar[RequestProfile | None] = ContextVar("request_profile", default=None)
+# sampler ระบุเจ้าของ stack จาก thread id และ task ที่ event loop กำลังรัน ไม่อ่าน frame ของ thread อื่น
+_thread_profiles: dict[int, RequestProfile] = {}
+_task_profiles: weakref.WeakKeyDictionary[asyncio.Task, RequestProfile] = weakref.WeakKeyDictionary()
+_tracked_loops: weakref.WeakSet[asyncio.AbstractEventLoop] = weakref.WeakSet()
+
+
+def profiling_allowed(headers: Mapping[str, str]) -> bool:
+    """เปิด profile เฉพาะเมื่อ PROFILING_ENABLED และ request ส่ง X-Profile: 1
+    (และ X-Profile-Token ถ้าตั้ง PROFILING_TOKEN)"""
+    settings = get_settings()
+    if not settings.profiling_enabled:
+        return False
+    if headers.get(PROFILE_HEADER, "").lower() not in {"1", "true", "yes"}:
+        return False
+    return not settings.profiling_token or headers.get(PROFILE_TOKEN_HEADER) == settings.profiling_token
+
+
+def admin_allowed(headers: Mapping[str, str]) -> bool:
+    settings = get_settings()
+    if not settings.profiling_enabled:
+        return False
+    return not settings.profiling_token or headers.get(PROFILE_TOKEN_HEADER) == settings.profiling_token
+
+
+def is_safe_profile_id(profile_id: str) -> bool:
+    """correlation id มาจาก header ของ client จึงต้องตรวจก่อนใช้เป็นชื่อไฟล์"""
+    return bool(_SAFE_ID.match(profile_id))
+
+
+def run_for_request(call: Callable[[], T]) -> T:
+    """รัน call ใน thread ปัจจุบัน ถ้าอยู่ใน context ของ request ที่ profile อยู่
+    sample ของ thread นี้ระหว่างนั้นนับเป็นของ request"""
+    profile = _current_profile.get()
+    if profile is None:
+        return call()
+    thread_id = threading.get_ident()
+    previous = _thread_profiles.get(thread_id)
+    _thread_profiles[thread_id] = profile
+    try:
+        return call()
+    finally:
+        if previous is None:
+            _thread_profiles.pop(thread_id, None)
+        else:
+            _thread_profiles[thread_id] = previous
+
+
+async def run_in_threadpool(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """เหมือน fastapi.concurrency.run_in_threadpool แต่ thread ที่รับงานถูกนับใน profile ของ request
+    (endpoint แบบ def ที่ FastAPI ส่งเข้า threadpool เองไม่ถูกนับ)"""
+    return await concurrency.run_in_threadpool(run_for_request, partial(func, *args, **kwargs))
+
+
+def _track_request_tasks(loop: asyncio.AbstractEventLoop) -> None:
+    """ตั้ง task factory ครั้งเดียวต่อ loop: task ที่สร้างใน context ของ request ที่ profile อยู่
+    (เช่น task ของ call_next) นับเป็นของ request นั้น"""
+    if loop in _tracked_loops:
+        return
+    _tracked_loops.add(loop)
+    previous = loop.get_task_factory()
+
+    def factory(loop: asyncio.AbstractEventLoop, coro: Any, **kwargs: Any) -> asyncio.Future:
+        task = previous(loop, coro, **kwargs) if previous is not None else asyncio.Task(coro, loop=loop, **kwargs)
+        context = kwargs.get("context")
+        profile = _current_profile.get() if context is None else context.get(_current_profile)
+        if profile is not None:
+            _task_profiles[task] = profile
+        return task
+
+    loop.set_task_factory(factory)
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def _is_idle(frame: FrameType) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES
+
+
+class StackSampler:
+    """sampling profiler: thread พื้นหลังอ่าน stack ของทุก thread ทุก interval วินาที แล้วนับเป็น collapsed stack
+    (บรรทัดละ "thread;outer;...;inner count" ใช้กับ flamegraph.pl หรือ speedscope ได้ตรง ๆ)
+    นับเฉพาะ thread ที่ owns(thread_id) คืน True (ไม่ให้ค่า = ทุก thread)"""
+
+    def __init__(self, interval: float, owns: Callable[[int], bool] | None = None) -> None:
+        self.interval = interval
+        self.owns = owns
+        self.samples: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> StackSampler:
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                if thread_id == own_id or _is_idle(frame):
+                    continue
+                if self.owns is not None and not self.owns(thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class RequestProfile:
+    """profile ของ request เดียว: นับเฉพาะ stack ของงานใน request นี้ ไม่ปน request อื่นที่ทำพร้อมกัน
+    งานที่ส่งเข้า process pool ไม่อยู่ใน process นี้จึงไม่เห็น"""
+
+    def __init__(self, profile_id: str) -> None:
+        settings = get_settings()
+        self.profile_id = profile_id
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        # ตั้งใน task ของ request ก่อน call_next task ลูกและ thread ที่รับงานต่อจึงเห็นค่านี้
+        _current_profile.set(self)
+        _track_request_tasks(self._loop)
+        task = asyncio.current_task()
+        if task is not None:
+            _task_profiles[task] = self
+        self._sampler = StackSampler(settings.profiling_interval_ms / 1000, self._owns).start()
+        self._done = False
+
+    def _owns(self, thread_id: int) -> bool:
+        """thread ของ event loop นับเมื่อ task ที่กำลังรันเป็นของ request นี้
+        thread อื่นนับเมื่อกำลังรันงานของ request นี้ผ่าน run_for_request"""
+        if thread_id == self._loop_thread:
+            task = asyncio.current_task(self._loop)
+            return task is not None and _task_profiles.get(task) is self
+        return _thread_profiles.get(thread_id) is self
+
+    def finish(self) -> None:
+        """หยุด sampler และเขียนไฟล์ใน thread ของ default executor ไม่บล็อก event loop"""
+        if self._done:
+            return
+        self._done = True
+        asyncio.get_running_loop().run_in_executor(None, self._save)
+
+    def _save(self) -> None:
+        try:
+            self._sampler.stop()
+            save_profile(self.profile_id, self._sampler.folded())
+        except Exception:  # noqa: BLE001
+            logger.exception("Cannot save profile %s", self.profile_id)
+
+    async def wrap_body(self, body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """response แบบ streaming สร้าง body หลัง call_next คืนค่าแล้ว จึงหยุด profile เมื่อส่ง body ครบ"""
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            self.finish()
+
+
+def _profile_dir() -> Path:
+    return Path(get_settings().profiling_dir)
+
+
+def save_profile(profile_id: str, folded: str) -> Path:
+    directory = _profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{profile_id}{PROFILE_SUFFIX}"
+    path.write_text(folded, encoding="utf-8")
+    # เก็บไว้ไม่เกิน PROFILING_MAX_FILES ไฟล์ ลบไฟล์เก่าสุดก่อน
+    files = sorted(directory.glob(f"*{PROFILE_SUFFIX}"), key=lambda item: item.stat().st_mtime, reverse=True)
+    for old in files[get_settings().profiling_max_files :]:
+        try:
+            os.remove(old)
+        except FileNotFoundError:
+            pass
+    return path
+
+
+def list_profiles() -> list[str]:
+    directory = _profile_dir()
+    if not directory.is_dir():
+        return []
+    files = sorted(directory.glob(f"*{PROFILE_SUFFIX}"), key=lambda item: item.stat().st_mtime, reverse=True)
+    return [path.name.removesuffix(PROFILE_SUFFIX) for path in files]
+
+
+def profile_path(profile_id: str) -> Path | None:
+    if not is_safe_profile_id(profile_id):
+        return None
+    path = _profile_dir() / f"{profile_id}{PROFILE_SUFFIX}"
+    return path if path.is_file() else None
@@ -2,10 +2,12 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 
+import numpy as np
 import pandas as pd
 from pandas.api.types import is_numeric_dtype
 
 from app.schemas import TransformOptions, TransformStats
+from app.services.compact_dtypes import compact_enabled, compact_frame, map_categories
 
 
 @dataclass
@@ -15,24 +17,84 @@ class RuleEngineResult:
     issues: list[str]
 
 
-def _normalize_text(value: object) -> str:
-    if value is None:
-        return ""
-    text = str(value).strip()
-    if text.lower() in {"nan", "none"}:
-        return ""
-    return " ".join(text.split())
+def _normalize_series(series: pd.Series) -> pd.Series:
+    """ตัดช่องว่างหัวท้าย รวมช่องว่างซ้อนเป็นช่องเดียว ค่าว่าง/"nan"/"none" เป็น "" (ทั้งคอลัมน์ครั้งเดียว)"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return map_categories(series, _normalize_series)
+    values = series.astype(object).to_numpy(copy=True)
+    na_mask = pd.isna(values)
+    if na_mask.any():
+        # ค่าว่างแต่ละชนิดแปลงเป็น string ต่างกัน (None/NaN -> "nan"/"None" ซึ่งจะกลายเป็น "", NaT -> "NaT")
+        values[na_mask] = [str(value) for value in values[na_mask]]
+    text = pd.Series(values, index=series.index, dtype=object).astype(str).str.strip()
+    text = text.where(~text.str.lower().isin(["nan", "none"]), "")
+    has_inner_space = text.str.contains(r"\s\s|[^\S ]", regex=True)
+    if has_inner_space.any():
+        text.loc[has_inner_space] = text[has_inner_space].str.replace(r"\s+", " ", regex=True)
+    return text
 
 
-def _build_group_id(tank_no: object) -> str:
-    return f"TANK::{_normalize_text(tank_no)}"
+def _non_empty_mask(series: pd.Series) -> np.ndarray:
+    """เทียบเท่า _normalize_series(series) != "" แต่ข้ามการรวมช่องว่าง และไม่แปลงคอลัมน์ตัวเลข/วันที่เป็น string"""
+    kind = series.dtype.kind if isinstance(series.dtype, np.dtype) else None
+    if kind == "f":
+        return series.notna().to_numpy()
+    if kind is not None and kind in "iubM":
+        # ตัวเลข/bool ไม่มีทางว่าง ส่วน NaT แปลงเป็น "NaT" ซึ่งไม่ว่าง
+        return np.ones(len(series), dtype=bool)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return map_categories(series, lambda values: pd.Series(_non_empty_mask(values))).to_numpy()
+    values = series.astype(object).to_numpy(copy=True)
+    na_mask = pd.isna(values)
+    if na_mask.any():
+        values[na_mask] = [str(value) for value in values[na_mask]]
+    text = pd.Series(values, dtype=object).astype(str).str.strip()
+    return (text.ne("") & ~text.str.lower().isin(["nan", "none"])).to_numpy()
 
 
-def _first_non_empty(series: pd.Series):
-    for value in series.tolist():
-        if _normalize_text(value):
-            return value
-    return ""
+def _build_group_ids(tank_values: pd.Series, tank_norm: pd.Series) -> pd.Series:
+    if len(tank_values) == 0:
+        # apply บน Series ว่างคืน dtype เดิมของคอลัมน์
+        return tank_values.copy()
+    return "TANK::" + tank_norm
+
+
+def _first_non_empty_positions(nonempty: np.ndarray, codes: np.ndarray, ngroups: int) -> np.ndarray:
+    """ตำแหน่งแถวแรกของแต่ละกลุ่มที่ค่าไม่ว่าง (-1 ถ้าทั้งกลุ่มว่าง)"""
+    candidates = np.flatnonzero(nonempty)
+    present, first = np.unique(codes[candidates], return_index=True)
+    positions = np.full(ngroups, -1, dtype=np.int64)
+    positions[present] = candidates[first]
+    return positions
+
+
+def _take_first_non_empty(values: pd.Series, positions: np.ndarray) -> np.ndarray:
+    """ค่าแรกที่ไม่ว่างของแต่ละกลุ่ม ถ้าไม่มีให้เป็น "" แบบเดียวกับ agg(_first_non_empty)"""
+    picked = values.astype(object).to_numpy()[np.maximum(positions, 0)]
+    picked[positions < 0] = ""
+    return picked
+
+
+def _as_agg_result(picked: np.ndarray, values: pd.Series, index: pd.Index) -> pd.Series:
+    """แปลงชนิดข้อมูลของผลลัพธ์ให้เหมือน groupby.agg(callable) ซึ่ง pandas cast กลับตาม dtype ของคอลัมน์เดิม"""
+    if len(picked) == 0:
+        return pd.Series([], index=index, dtype=values.dtype)
+    cast = getattr(values.array, "_cast_pointwise_result", None)
+    if cast is not None:
+        return pd.Series(cast(picked), index=index)
+    return pd.Series(picked, index=index, dtype=object).infer_objects()
+
+
+def _first_non_empty_by_key(values: pd.Series, keys: pd.Series) -> pd.Series:
+    """เทียบเท่า values.groupby(keys).agg(_first_non_empty) แบบ vectorized"""
+    codes, uniques = pd.factorize(keys, sort=True)
+    nonempty = _non_empty_mask(values)
+    positions = _first_non_empty_positions(nonempty, codes, len(uniques))
+    return _as_agg_result(
+        _take_first_non_empty(values, positions),
+        values,
+        pd.Index(uniques, name=keys.name),
+    )
 
 
 def _ensure_column(df: pd.DataFrame, name: str):
@@ -76,6 +138,31 @@ def _drop_cancelled_rows(df: pd.DataFrame) -> pd.DataFrame:
     return df.loc[~mask_drop].reset_index(drop=True)
 
 
+def _group_by_tank(working_df: pd.DataFrame, tank_col: str, tank_norm: pd.Series) -> pd.DataFrame:
+    """รวมแถวที่เลขตัวถังซ้ำกัน: is_duplicate_tank ใช้ max คอลัมน์ตัวเลขใช้ sum ที่เหลือใช้ค่าแรกที่ไม่ว่าง"""
+    codes, uniques = pd.factorize(tank_norm, sort=True)
+    ngroups = len(uniques)
+    index = pd.RangeIndex(ngroups)
+    numeric_columns = [
+        column
+        for column in working_df.columns
+        if column not in {"is_duplicate_tank", "rule_applied"} and is_numeric_dtype(working_df[column])
+    ]
+    sums = working_df[numeric_columns].groupby(codes, sort=True).sum()
+    grouped: dict[str, pd.Series] = {}
+    for column in working_df.columns:
+        values = working_df[column]
+        if column == "is_duplicate_tank":
+            grouped[column] = pd.Series(values.groupby(codes, sort=True).max().to_numpy(), index=index)
+        elif column in numeric_columns:
+            grouped[column] = pd.Series(sums[column].to_numpy(), index=index)
+        else:
+            nonempty = (tank_norm != "").to_numpy() if column == tank_col else _non_empty_mask(values)
+            positions = _first_non_empty_positions(nonempty, codes, ngroups)
+            grouped[column] = _as_agg_result(_take_first_non_empty(values, positions), values, index)
+    return pd.DataFrame(grouped, index=index, columns=working_df.columns)
+
+
 def apply_business_rules(df: pd.DataFrame, options: TransformOptions) -> RuleEngineResult:
     working_df = df.copy()
     working_df = _drop_cancelled_rows(working_df)
@@ -101,13 +188,17 @@ def apply_business_rules(df: pd.DataFrame, options: TransformOptions) -> RuleEng
 
     tank_col = mapping.tank_no
     item_col = mapping.item
-    tank_norm = working_df[tank_col].apply(_normalize_text)
-    item_norm = working_df[item_col].apply(_normalize_text)
+    for column in (mapping.total_value, mapping.product_value, mapping.tax):
+        # คอลัมน์ที่ถูกเขียนทับรับค่าที่ไม่อยู่ใน categories ไม่ได้
+        if isinstance(working_df[column].dtype, pd.CategoricalDtype):
+            working_df[column] = working_df[column].astype(object)
+    tank_norm = _normalize_series(working_df[tank_col])
+    item_norm = _normalize_series(working_df[item_col])
 
     duplicate_mask = tank_norm.duplicated(keep=False) & tank_norm.ne("")
     duplicate_groups = tank_norm[duplicate_mask].nunique()
     working_df["is_duplicate_tank"] = duplicate_mask
-    working_df["group_id"] = working_df[tank_col].apply(_build_group_id)
+    working_df["group_id"] = _build_group_ids(working_df[tank_col], tank_norm)
     working_df["rule_applied"] = ""
 
     finance_sent_mask = item_norm.eq(options.finance_sent_item_label)
@@ -125,46 +216,44 @@ def apply_business_rules(df: pd.DataFrame, options: TransformOptions) -> RuleEng
     working_df.loc[finance_broker_mask, mapping.tax] = working_df.loc[finance_broker_mask, mapping.com]
     working_df.loc[finance_broker_mask, "rule_applied"] = "finance_broker"
 
-    sent_price_by_tank = (
-        working_df.loc[finance_sent_mask]
-        .groupby(tank_norm[finance_sent_mask])[mapping.total_value]
-        .agg(_first_non_empty)
+    # คอลัมน์ key ที่ถูกเขียนทับข้างบนต้อง normalize ใหม่ ที่เหลือใช้ผลเดิมได้เลย
+    written_columns = {
+        "is_duplicate_tank",
+        "group_id",
+        "rule_applied",
+        mapping.total_value,
+        mapping.product_value,
+        mapping.tax,
+    }
+    current_tank_norm = _normalize_series(working_df[tank_col]) if tank_col in written_columns else tank_norm
+
+    sent_price_by_tank = _first_non_empty_by_key(
+        working_df.loc[finance_sent_mask, mapping.total_value], tank_norm[finance_sent_mask]
     )
-    cash_price_by_tank = (
-        working_df.loc[cash_sale_mask].groupby(tank_norm[cash_sale_mask])[mapping.total_value].agg(_first_non_empty)
+    cash_price_by_tank = _first_non_empty_by_key(
+        working_df.loc[cash_sale_mask, mapping.total_value], tank_norm[cash_sale_mask]
     )
     final_price_by_tank = sent_price_by_tank.combine_first(cash_price_by_tank)
-    broker_comfn_by_tank = (
-        working_df.loc[finance_broker_mask]
-        .groupby(tank_norm[finance_broker_mask])[mapping.product_value]
-        .agg(_first_non_empty)
+    broker_comfn_by_tank = _first_non_empty_by_key(
+        working_df.loc[finance_broker_mask, mapping.product_value], tank_norm[finance_broker_mask]
     )
-    broker_com_by_tank = (
-        working_df.loc[finance_broker_mask]
-        .groupby(tank_norm[finance_broker_mask])[mapping.tax]
-        .agg(_first_non_empty)
+    broker_com_by_tank = _first_non_empty_by_key(
+        working_df.loc[finance_broker_mask, mapping.tax], tank_norm[finance_broker_mask]
     )
 
     output_df = working_df
+    output_tank_norm = current_tank_norm
     if options.duplicate_mode == "group":
-        agg_map: dict[str, object] = {}
-        for column in working_df.columns:
-            if column == "is_duplicate_tank":
-                agg_map[column] = "max"
-            elif column == "rule_applied":
-                agg_map[column] = _first_non_empty
-            elif is_numeric_dtype(working_df[column]):
-                agg_map[column] = "sum"
-            else:
-                agg_map[column] = _first_non_empty
-        output_df = working_df.groupby(working_df[tank_col].apply(_normalize_text), as_index=False).agg(agg_map)
-        output_df["group_id"] = output_df[tank_col].apply(_build_group_id)
-        output_df["is_duplicate_tank"] = output_df[tank_col].apply(_normalize_text).isin(
-            tank_norm[duplicate_mask].unique()
-        )
+        output_df = _group_by_tank(working_df, tank_col, current_tank_norm)
+        # ค่าที่รวมแล้วอาจถูก cast ชนิดใหม่ (เช่น object -> float) จึง normalize จากผลลัพธ์อีกรอบ (จำนวนแถวเท่าจำนวนกลุ่ม)
+        output_tank_norm = _normalize_series(output_df[tank_col])
+        output_df["group_id"] = _build_group_ids(output_df[tank_col], output_tank_norm)
+        output_df["is_duplicate_tank"] = output_tank_norm.isin(tank_norm[duplicate_mask].unique())
 
-    output_tank_norm = output_df[tank_col].apply(_normalize_text)
-    output_item_norm = output_df[item_col].apply(_normalize_text)
+    if options.duplicate_mode == "keep" and item_col not in written_columns:
+        output_item_norm = item_norm
+    else:
+        output_item_norm = _normalize_series(output_df[item_col])
     output_df["ราคาขาย"] = output_tank_norm.map(final_price_by_tank)
     output_df["COM F/N"] = output_tank_norm.map(broker_comfn_by_tank)
     cash_tanks = set(cash_price_by_tank.index.tolist())
@@ -181,4 +270,7 @@ def apply_business_rules(df: pd.DataFrame, options: TransformOptions) -> RuleEng
         duplicate_tank_groups=int(duplicate_groups),
         duplicate_rows=int(duplicate_mask.sum()),
     )
+    if compact_enabled():
+        # rule_applied และคอลัมน์ข้อความที่สร้างใหม่ได้ dtype แบบเดียวกับคอลัมน์ที่อ่านมา
+        output_df = compact_frame(output_df)
     return RuleEngineResult(dataframe=output_df, stats=stats, issues=[])
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import hashlib
+import tempfile
+import zipfile
+from collections.abc import Collection
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import get_settings
+from app.services.profiling import run_in_threadpool
+
+SPOOL_CHUNK_BYTES = 1024 * 1024
+# multipart boundary และ field อื่นที่มากับไฟล์ (config, format, async_mode)
+FORM_OVERHEAD_BYTES = 64 * 1024
+ZIP_EXTENSION = ".zip"
+
+
+def max_upload_bytes() -> int:
+    return get_settings().max_upload_size_mb * 1024 * 1024
+
+
+def max_batch_upload_bytes() -> int:
+    return get_settings().max_batch_upload_size_mb * 1024 * 1024
+
+
+def _too_large_detail(batch: bool = False) -> str:
+    if batch:
+        return f"Batch is too large. Max size is {get_settings().max_batch_upload_size_mb} MB."
+    return f"File is too large. Max size is {get_settings().max_upload_size_mb} MB."
+
+
+def upload_too_large(batch: bool = False) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=_too_large_detail(batch))
+
+
+@dataclass
+class SpooledUpload:
+    path: Path
+    filename: str
+    size: int
+    digest: str
+
+    def close(self) -> None:
+        # async import ย้ายไฟล์ไปเป็นของ job แล้ว ไฟล์จึงอาจไม่อยู่
+        self.path.unlink(missing_ok=True)
+
+
+def _write_chunk(handle: BinaryIO, digest: hashlib._Hash, chunk: bytes) -> None:
+    digest.update(chunk)
+    handle.write(chunk)
+
+
+async def spool_upload(file: UploadFile, batch: bool = False) -> SpooledUpload:
+    """คัดลอกไฟล์ที่ upload ลง UPLOAD_SPOOL_DIR ทีละ SPOOL_CHUNK_BYTES พร้อม sha256 (key ของ workbook cache)
+    ไม่มีช่วงไหนถือทั้งไฟล์เป็น bytes และหยุดตอบ 413 ทันทีที่ขนาดเกิน MAX_UPLOAD_SIZE_MB
+    (batch=True เช่น .zip ของ batch ใช้ MAX_BATCH_UPLOAD_SIZE_MB)"""
+    limit = max_batch_upload_bytes() if batch else max_upload_bytes()
+    directory = Path(get_settings().upload_spool_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    suffix = Path(file.filename or "").suffix.lower()
+    handle = tempfile.NamedTemporaryFile(dir=directory, prefix="upload-", suffix=suffix, delete=False)
+    path = Path(handle.name)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with handle:
+            while chunk := await file.read(SPOOL_CHUNK_BYTES):
+                size += len(chunk)
+                if size > limit:
+                    raise upload_too_large(batch)
+                await run_in_threadpool(_write_chunk, handle, digest, chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    return SpooledUpload(path=path, filename=file.filename or f"upload{suffix}", size=size, digest=digest.hexdigest())
+
+
+def close_uploads(uploads: list[SpooledUpload]) -> None:
+    for upload in uploads:
+        upload.close()
+
+
+def _is_skipped_member(info: zipfile.ZipInfo) -> bool:
+    # โฟลเดอร์ ไฟล์ซ่อน และ resource fork ที่ macOS ใส่มาใน zip
+    parts = PurePosixPath(info.filename).parts
+    return info.is_dir() or not parts or parts[0] == "__MACOSX" or parts[-1].startswith((".", "~$"))
+
+
+def extract_zip_upload(upload: SpooledUpload, extensions: Collection[str], max_total: int) -> list[SpooledUpload]:
+    """แตกไฟล์ที่นามสกุลอยู่ใน extensions จาก zip ที่ spool ไว้ลง UPLOAD_SPOOL_DIR ทีละ SPOOL_CHUNK_BYTES
+    นับขนาดจาก byte ที่แตกได้จริง (ไม่เชื่อขนาดใน header ของ zip): ต่อไฟล์ไม่เกิน MAX_UPLOAD_SIZE_MB
+    และรวมไม่เกิน max_total ตอบ 413 ทันทีที่เกิน เรียกใน threadpool"""
+    directory = Path(get_settings().upload_spool_dir)
+    limit = max_upload_bytes()
+    extracted: list[SpooledUpload] = []
+    total = 0
+    try:
+        with zipfile.ZipFile(upload.path) as archive:
+            for info in archive.infolist():
+                name = PurePosixPath(info.filename).name
+                suffix = Path(name).suffix.lower()
+                if _is_skipped_member(info) or suffix not in extensions:
+                    continue
+                handle = tempfile.NamedTemporaryFile(dir=directory, prefix="upload-", suffix=suffix, delete=False)
+                spooled = SpooledUpload(path=Path(handle.name), filename=name, size=0, digest="")
+                extracted.append(spooled)
+                digest = hashlib.sha256()
+                with handle, archive.open(info) as member:
+                    while chunk := member.read(SPOOL_CHUNK_BYTES):
+                        spooled.size += len(chunk)
+                        total += len(chunk)
+                        if spooled.size > limit:
+                            raise upload_too_large()
+                        if total > max_total:
+                            raise upload_too_large(batch=True)
+                        _write_chunk(handle, digest, chunk)
+                spooled.digest = digest.hexdigest()
+    except zipfile.BadZipFile as exc:
+        close_uploads(extracted)
+        raise HTTPException(status_code=400, detail=f"Invalid zip archive {upload.filename}: {exc}") from exc
+    except BaseException:
+        close_uploads(extracted)
+        raise
+    return extracted
+
+
+class UploadSizeLimitMiddleware:
+    """จำกัดขนาด body ของทุก request ไว้ที่ MAX_UPLOAD_SIZE_MB (+ FORM_OVERHEAD_BYTES)
+    ส่วน path ใน batch_paths (upload หลายไฟล์ใน request เดียว) ใช้ MAX_BATCH_UPLOAD_SIZE_MB
+    ตอบ 413 จาก Content-Length ก่อนรับ body และนับ byte ระหว่างรับ (กรณีไม่มีหรือแจ้ง Content-Length ไม่ตรง)
+    ตัดตั้งแต่ตอน parse multipart ก่อน handler ทำงาน ไม่ต้องรอรับไฟล์ครบ"""
+
+    def __init__(self, app: ASGIApp, batch_paths: Collection[str] = ()) -> None:
+        self.app = app
+        self.batch_paths = frozenset(batch_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        batch = scope["path"] in self.batch_paths
+        limit = (max_batch_upload_bytes() if batch else max_upload_bytes()) + FORM_OVERHEAD_BYTES
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > limit:
+            response = JSONResponse(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                content={"detail": _too_large_detail(batch)},
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI ส่ง HTTPException ที่เกิดระหว่างอ่าน body ต่อเป็น response ตรง ๆ
+                    raise upload_too_large(batch)
+            return message
+
+        await self.app(scope, limited_receive, send)
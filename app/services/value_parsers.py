@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import datetime as dt
+import re
+import warnings
+from dataclasses import dataclass
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype, is_datetime64_any_dtype
+from pandas.tseries.api import guess_datetime_format
+
+# Numeric(18, 2): เก็บเป็นจำนวนเต็มหน่วยสตางค์ (x100) ได้ไม่เกิน 18 หลัก
+AMOUNT_SCALE = 2
+AMOUNT_MAX_UNITS = 10**18 - 1
+_QUANTUM = Decimal(1).scaleb(-AMOUNT_SCALE)
+
+EXCEL_EPOCH = np.datetime64("1899-12-30", "D")
+EXCEL_MAX_SERIAL = 2958465  # 9999-12-31
+BUDDHIST_ERA_OFFSET = 543
+BUDDHIST_ERA_MIN_YEAR = 2400
+_BUDDHIST_YEAR = re.compile(r"(?<!\d)(2[4-9]\d\d)(?!\d)")
+_NAT = np.datetime64("NaT", "D")
+
+
+@dataclass
+class FixedPointColumn:
+    """ค่าเงินของทั้งคอลัมน์เป็น int64 หน่วยสตางค์ ok = แปลงได้และอยู่ในช่วงของ Numeric(18, 2)"""
+
+    units: np.ndarray
+    ok: np.ndarray
+
+    def to_decimals(self, mask: np.ndarray | None = None) -> list[Decimal | None]:
+        """แปลงเป็น Decimal ตอนเขียนลง DB เท่านั้น (ค่าที่ไม่ ok เป็น None)"""
+        units, ok = (self.units, self.ok) if mask is None else (self.units[mask], self.ok[mask])
+        return [
+            Decimal(value).scaleb(-AMOUNT_SCALE) if valid else None
+            for value, valid in zip(units.tolist(), ok.tolist())
+        ]
+
+
+@dataclass
+class DateColumn:
+    """วันที่ของทั้งคอลัมน์เป็น datetime64[D] empty = ช่องว่าง ok = แปลงเป็นวันที่ได้"""
+
+    days: np.ndarray
+    ok: np.ndarray
+    empty: np.ndarray
+
+    def to_dates(self, mask: np.ndarray | None = None) -> list[dt.date | None]:
+        days, ok = (self.days, self.ok) if mask is None else (self.days[mask], self.ok[mask])
+        values = days.astype(object)
+        return [value if valid else None for value, valid in zip(values.tolist(), ok.tolist())]
+
+
+def factorize_values(series: pd.Series) -> tuple[np.ndarray, list[Any]]:
+    """codes + ค่าไม่ซ้ำ สำหรับแปลงครั้งเดียวต่อค่า คอลัมน์ที่มีหลายชนิดปนกันแยกตามชนิดด้วย
+    เพราะ factorize มองว่า True == 1 == 1.0"""
+    if series.dtype == object and infer_dtype(series, skipna=True).startswith("mixed"):
+        positions: dict[tuple[type, Any], int] = {}
+        uniques: list[Any] = []
+        codes = np.empty(len(series), dtype=np.intp)
+        for pos, value in enumerate(series.tolist()):
+            key = (type(value), value)
+            code = positions.get(key)
+            if code is None:
+                code = positions[key] = len(uniques)
+                uniques.append(value)
+            codes[pos] = code
+        return codes, uniques
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    return codes, list(uniques)
+
+
+def _text_to_units(text: str) -> int | None:
+    """ข้อความตัวเลขเป็นหน่วยสตางค์ ปัดเศษแบบ half-up เหมือน SQL Server None = แปลงไม่ได้หรือเกินช่วง
+    (Decimal ของ CPython เป็น C จึงเร็วกว่าแยกหลักเองด้วย regex)"""
+    if not text:
+        return None
+    try:
+        value = Decimal(text)
+        if not value.is_finite():
+            return None
+        units = int(value.quantize(_QUANTUM, rounding=ROUND_HALF_UP).scaleb(AMOUNT_SCALE))
+    except (InvalidOperation, ValueError):
+        return None
+    return units if abs(units) <= AMOUNT_MAX_UNITS else None
+
+
+def parse_fixed_point(text: pd.Series) -> FixedPointColumn:
+    """แปลงข้อความตัวเลข (clean แล้ว อาจมี , คั่นหลักพัน) เป็นหน่วยสตางค์ ครั้งเดียวต่อค่าไม่ซ้ำ
+    ค่าที่เกินช่วงของ Numeric(18, 2) ถือว่า overflow (ok = False)"""
+    codes, uniques = pd.factorize(text.str.replace(",", "", regex=False), use_na_sentinel=False)
+    parsed = [_text_to_units(value) for value in uniques.tolist()]
+    unique_ok = np.array([value is not None for value in parsed], dtype=bool)
+    unique_units = np.array([value or 0 for value in parsed], dtype=np.int64)
+    return FixedPointColumn(unique_units[codes], unique_ok[codes])
+
+
+@lru_cache(maxsize=512)
+def _guess_format(sample: str) -> str | None:
+    # dayfirst=False เหมือน pd.to_datetime ทีละค่าแบบเดิม (ค่าที่กำกวมอ่านเป็นเดือน/วัน)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        return guess_datetime_format(sample, dayfirst=False)
+
+
+def _month_first_format(fmt: str) -> str | None:
+    """format ที่สลับ %d กับ %m เมื่อ fmt วางวันก่อนเดือน (None = ไม่ต้องสลับ)"""
+    day, month = fmt.find("%d"), fmt.find("%m")
+    if day < 0 or month < 0 or day > month:
+        return None
+    return fmt.replace("%d", "\0").replace("%m", "%d").replace("\0", "%m")
+
+
+def _to_gregorian_text(text: str) -> str:
+    return _BUDDHIST_YEAR.sub(lambda match: str(int(match.group(1)) - BUDDHIST_ERA_OFFSET), text)
+
+
+def _to_gregorian_date(value: dt.date) -> dt.date | None:
+    try:
+        return value.replace(year=value.year - BUDDHIST_ERA_OFFSET)
+    except ValueError:
+        return None
+
+
+def _timestamps_to_days(values: pd.Series) -> np.ndarray:
+    if getattr(values.dt, "tz", None) is not None:
+        values = values.dt.tz_localize(None)
+    return values.to_numpy(dtype="datetime64[D]")
+
+
+def _parse_date_texts(texts: list[str], buddhist_era: bool) -> np.ndarray:
+    """แปลงข้อความวันที่ทั้งชุด: เดา format จากค่าแรก (cache ตามข้อความ) แล้ว parse ทั้งชุดด้วย format นั้น
+    ค่าที่ไม่เข้า format ค่อย parse ทีละค่าแบบเดิม ผลของแต่ละค่าจึงไม่ขึ้นกับลำดับแถว"""
+    result = np.full(len(texts), _NAT)
+    if not texts:
+        return result
+    if buddhist_era:
+        texts = [_to_gregorian_text(text) for text in texts]
+    series = pd.Series(texts, dtype=object)
+    fmt = _guess_format(texts[0])
+    if fmt is not None:
+        parsed = pd.to_datetime(series, format=fmt, errors="coerce")
+        swapped = _month_first_format(fmt)
+        if swapped is not None:
+            # ค่าแรกอ่านได้แค่วันก่อนเดือน แต่ค่าที่อ่านได้ทั้งสองแบบต้องเป็นเดือนก่อนวันเหมือน parse ทีละค่า
+            parsed = pd.to_datetime(series, format=swapped, errors="coerce").fillna(parsed)
+        result = _timestamps_to_days(parsed)
+    for pos in np.flatnonzero(np.isnat(result)):
+        try:
+            parsed_value = pd.to_datetime(texts[pos])
+            if parsed_value is not pd.NaT:
+                result[pos] = np.datetime64(parsed_value.date(), "D")
+        except (ValueError, TypeError, OverflowError):
+            continue
+    return result
+
+
+def _parse_date_uniques(uniques: list[Any], buddhist_era: bool) -> tuple[np.ndarray, np.ndarray]:
+    days = np.full(len(uniques), _NAT)
+    empty = np.zeros(len(uniques), dtype=bool)
+    text_positions: list[int] = []
+    texts: list[str] = []
+    for pos, value in enumerate(uniques):
+        if value is None or value is pd.NaT or value is pd.NA or (isinstance(value, float) and np.isnan(value)):
+            empty[pos] = True
+        elif isinstance(value, (bool, np.bool_)):
+            continue
+        elif isinstance(value, (dt.date, np.datetime64)):
+            stamp = pd.Timestamp(value)
+            if stamp is pd.NaT:
+                empty[pos] = True
+                continue
+            day = stamp.date()
+            if buddhist_era and day.year >= BUDDHIST_ERA_MIN_YEAR:
+                day = _to_gregorian_date(day)
+            if day is not None:
+                days[pos] = np.datetime64(day, "D")
+        elif isinstance(value, (int, float, np.integer, np.floating)):
+            # Excel serial (จำนวนวันนับจาก 1899-12-30)
+            if 0 < value <= EXCEL_MAX_SERIAL:
+                days[pos] = EXCEL_EPOCH + np.timedelta64(int(value), "D")
+        else:
+            text = str(value).strip()
+            if text == "" or text.lower() in {"nan", "none", "nat"}:
+                empty[pos] = True
+            else:
+                text_positions.append(pos)
+                texts.append(text)
+    if texts:
+        days[text_positions] = _parse_date_texts(texts, buddhist_era)
+    return days, empty
+
+
+def parse_dates(values: pd.Series, buddhist_era: bool = True) -> DateColumn:
+    """แปลงคอลัมน์วันที่ (datetime, Excel serial หรือข้อความ) เป็น datetime64[D] ครั้งเดียวต่อค่าไม่ซ้ำ
+    buddhist_era: ปีตั้งแต่ 2400 ถือเป็น พ.ศ. แปลงเป็น ค.ศ."""
+    if is_datetime64_any_dtype(values.dtype):
+        empty = values.isna().to_numpy()
+        days = _timestamps_to_days(values)
+        if buddhist_era:
+            years = days.astype("datetime64[Y]").astype(np.int64) + 1970
+            for pos in np.flatnonzero(~empty & (years >= BUDDHIST_ERA_MIN_YEAR)):
+                converted = _to_gregorian_date(days[pos].astype(object))
+                days[pos] = _NAT if converted is None else np.datetime64(converted, "D")
+        return DateColumn(days, ~np.isnat(days), empty)
+    codes, uniques = factorize_values(values)
+    unique_days, unique_empty = _parse_date_uniques(uniques, buddhist_era)
+    days = unique_days[codes] if len(codes) else np.array([], dtype="datetime64[D]")
+    return DateColumn(days, ~np.isnat(days), unique_empty[codes] if len(codes) else np.array([], dtype=bool))
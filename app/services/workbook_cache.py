@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from dataclasses import dataclass
+from typing import Any
+
+import pandas as pd
+
+from app.core.config import get_settings
+from app.schemas import CacheStats, TransformOptions
+from app.services.excel_reader import ExcelSource
+from app.services.rules_engine import RuleEngineResult
+
+
+def content_hash(source: ExcelSource) -> str:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    with open(source, "rb") as handle:
+        return hashlib.file_digest(handle, "sha256").hexdigest()
+
+
+def _estimate_size(value: Any) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, RuleEngineResult):
+        return _estimate_size(value.dataframe)
+    return 0
+
+
+@dataclass
+class _Entry:
+    value: Any
+    size: int
+
+
+class WorkbookCache:
+    """LRU cache ของ DataFrame ที่ parse แล้ว (key = hash ของไฟล์) และผลของ rules (key = hash + TransformOptions)
+    ตัดรายการเก่าออกเมื่อจำนวนหรือขนาดรวมเกินที่ตั้งไว้ ค่าที่เก็บห้ามแก้ไข (in-place) หลังใส่ cache"""
+
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._hits = {"frame": 0, "rules": 0}
+        self._misses = {"frame": 0, "rules": 0}
+        self._evictions = 0
+
+    def _get(self, kind: str, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses[kind] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits[kind] += 1
+            return entry.value
+
+    def _put(self, key: Hashable, value: Any) -> None:
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old.size
+            self._entries[key] = _Entry(value, size)
+            self._total_bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.size
+                self._evictions += 1
+
+    def get_frame(self, digest: str, variant: str = "full") -> pd.DataFrame | None:
+        return self._get("frame", ("frame", digest, variant))
+
+    def put_frame(self, digest: str, frame: pd.DataFrame, variant: str = "full") -> None:
+        """variant แยก frame ที่อ่านทุกคอลัมน์ ("full") ออกจาก frame ที่อ่านบางคอลัมน์ (เช่น "import")"""
+        self._put(("frame", digest, variant), frame)
+
+    def get_rules(self, digest: str, options: TransformOptions) -> RuleEngineResult | None:
+        return self._get("rules", ("rules", digest, options.model_dump_json()))
+
+    def put_rules(self, digest: str, options: TransformOptions, result: RuleEngineResult) -> None:
+        self._put(("rules", digest, options.model_dump_json()), result)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                entries=len(self._entries),
+                total_bytes=self._total_bytes,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+                frame_hits=self._hits["frame"],
+                frame_misses=self._misses["frame"],
+                rules_hits=self._hits["rules"],
+                rules_misses=self._misses["rules"],
+                evictions=self._evictions,
+            )
+
+
+_cache: WorkbookCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_workbook_cache() -> WorkbookCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            settings = get_settings()
+            _cache = WorkbookCache(
+                max_entries=settings.workbook_cache_max_entries,
+                max_bytes=settings.workbook_cache_max_mb * 1024 * 1024,
+            )
+        return _cache
@@ -0,0 +1,92 @@
+"""รัน benchmark ราย stage: python -m benchmarks --sizes 1k,10k --output benchmark-results.json
+
+เทียบกับผลครั้งก่อนด้วย --baseline ไฟล์.json (exit code 1 ถ้ามี stage ช้าลงเกิน --threshold)"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import sys
+from pathlib import Path
+from typing import Any
+
+from benchmarks.stages import as_records, environment, run_size
+from benchmarks.workbook import SIZES, WorkbookSpec
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Stage-level import/transform benchmarks")
+    parser.add_argument("--sizes", default="1k,10k", help=f"comma separated, from {','.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=Path("benchmark-results.json"))
+    parser.add_argument("--baseline", type=Path, help="previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    parser.add_argument("--duplicate-tank-ratio", type=float, default=0.3)
+    parser.add_argument("--finance-sent-ratio", type=float, default=0.35)
+    parser.add_argument("--finance-broker-ratio", type=float, default=0.25)
+    parser.add_argument("--cancelled-ratio", type=float, default=0.03)
+    parser.add_argument("--invalid-ratio", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def _compare(results: list[dict[str, Any]], baseline_path: Path, threshold: float) -> list[str]:
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    previous = {(item["size"], item["stage"]): item for item in baseline.get("results", [])}
+    regressions = []
+    for item in results:
+        before = previous.get((item["size"], item["stage"]))
+        if before is None or not before["seconds_min"]:
+            continue
+        change = item["seconds_min"] / before["seconds_min"] - 1
+        item["change_vs_baseline"] = round(change, 4)
+        if change > threshold:
+            regressions.append(f"{item['size']} {item['stage']}: {change:+.0%}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        print(f"Unknown sizes: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    spec_args = {
+        "duplicate_tank_ratio": args.duplicate_tank_ratio,
+        "finance_sent_ratio": args.finance_sent_ratio,
+        "finance_broker_ratio": args.finance_broker_ratio,
+        "cancelled_ratio": args.cancelled_ratio,
+        "invalid_ratio": args.invalid_ratio,
+        "seed": args.seed,
+    }
+    results: list[dict[str, Any]] = []
+    for size in sizes:
+        for record in as_records(run_size(size, WorkbookSpec(rows=SIZES[size], **spec_args), args.repeat)):
+            results.append(record)
+            print(
+                f"{record['size']:>5} {record['stage']:<34} {record['seconds_min']:>10.4f}s "
+                f"{record['rows_per_second']:>12.0f} rows/s {record['peak_memory_mb']:>9.1f} MB",
+                flush=True,
+            )
+
+    regressions = _compare(results, args.baseline, args.threshold) if args.baseline else []
+    report = {
+        "generated_at": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "spec": spec_args,
+        "repeat": args.repeat,
+        "results": results,
+        "regressions": regressions,
+    }
+    args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Results written to {args.output}")
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
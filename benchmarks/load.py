@@ -0,0 +1,369 @@
+"""load test ทาง HTTP: python -m benchmarks.load --rows 1000 --requests 40 --concurrency 4 --workers 1
+
+เปิด uvicorn รัน app.main:app กับ SQLite ชั่วคราว (หรือ --database-url) แล้วยิง request พร้อมกันทีละ endpoint
+รายงาน p50/p95/p99, throughput, error rate, RSS ของ process server และ latency ของ /api/health ที่ยิงคั่นไว้
+(health ช้าลงระหว่างโหลดแปลว่ามีงานบล็อก event loop)"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import math
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import httpx
+from sqlalchemy import create_engine
+
+from app.db.models import Base
+from benchmarks.stages import environment
+from benchmarks.workbook import WorkbookSpec, make_workbook
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+HEALTH_PATH = "/api/health"
+# ชื่อที่ใช้กับ --endpoints
+ENDPOINTS = {
+    "preview": "/api/preview",
+    "transform": "/api/transform",
+    "transform-import": "/api/transform-import",
+    "imports-upload": "/api/imports/upload",
+}
+ASYNC_ENDPOINTS = {"transform-import", "imports-upload"}
+
+
+@dataclass
+class EndpointResult:
+    endpoint: str
+    path: str
+    requests: int
+    concurrency: int
+    errors: int
+    error_rate: float
+    seconds: float
+    throughput_rps: float
+    latency_p50: float
+    latency_p95: float
+    latency_p99: float
+    latency_max: float
+    health_p50: float
+    health_p99: float
+    rss_start_mb: float
+    rss_peak_mb: float
+    status_codes: dict[str, int]
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    """nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return round(ordered[rank - 1], 4)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _children() -> dict[int, list[int]]:
+    tree: dict[int, list[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8") as handle:
+                # ชื่อ process อยู่ในวงเล็บและอาจมีช่องว่าง จึงตัดหลังวงเล็บปิดตัวสุดท้าย
+                parent = int(handle.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        tree.setdefault(parent, []).append(int(entry))
+    return tree
+
+
+def _rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss_mb(root_pid: int) -> float:
+    """RSS รวมของ server กับ process ลูก (uvicorn --workers และ process pool ของ cpu_pool) อ่านจาก /proc จึงได้เฉพาะ Linux"""
+    if not os.path.isdir("/proc"):
+        return 0.0
+    tree = _children()
+    pids, total = [root_pid], 0
+    while pids:
+        pid = pids.pop()
+        total += _rss_bytes(pid)
+        pids.extend(tree.get(pid, []))
+    return round(total / 1024 / 1024, 1)
+
+
+class _RssSampler:
+    def __init__(self, pid: int, interval: float = 0.2) -> None:
+        self.pid = pid
+        self.interval = interval
+        self.start_mb = tree_rss_mb(pid)
+        self.peak_mb = self.start_mb
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> _RssSampler:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, tree_rss_mb(self.pid))
+
+
+class Server:
+    """uvicorn ใน subprocess ใช้ฐานข้อมูลและโฟลเดอร์เก็บไฟล์ชั่วคราวของตัวเอง"""
+
+    def __init__(self, workers: int, database_url: str | None, extra_env: dict[str, str]) -> None:
+        self._dir = tempfile.TemporaryDirectory(prefix="load-test-")
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        if database_url is None:
+            database_url = f"sqlite:///{Path(self._dir.name) / 'load.db'}"
+            # สร้างตารางก่อน ไม่ให้ uvicorn หลาย worker แข่งกัน create_all ตอน startup
+            engine = create_engine(database_url)
+            Base.metadata.create_all(engine)
+            engine.dispose()
+        env = dict(os.environ)
+        env.update(
+            {
+                "SQLSERVER_CONNECTION_STRING": database_url,
+                "UPLOAD_STORAGE_DIR": str(Path(self._dir.name) / "uploads"),
+                "PROFILING_ENABLED": "false",
+            }
+        )
+        env.update(extra_env)
+        command = [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(self.port),
+            "--workers", str(workers), "--log-level", "warning",
+        ]  # fmt: skip
+        # process group แยก เพื่อเก็บ worker ที่ค้างได้ครบตอน stop
+        self.process = subprocess.Popen(command, cwd=PROJECT_ROOT, env=env, start_new_session=True)
+
+    def wait_ready(self, timeout: float = 60.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.process.returncode}")
+            try:
+                if httpx.get(self.base_url + HEALTH_PATH, timeout=1.0).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Server did not become ready within {timeout:.0f}s")
+
+    def stop(self) -> None:
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            print("Server did not shut down within 30s, killing it", file=sys.stderr)
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+        self._dir.cleanup()
+
+
+async def _send(
+    client: httpx.AsyncClient,
+    path: str,
+    fields: dict[str, str],
+    content: bytes,
+    filename: str,
+) -> tuple[float, int | None]:
+    started = time.perf_counter()
+    try:
+        files = {"file": (filename, content, XLSX_MEDIA_TYPE)}
+        async with client.stream("POST", path, data=fields, files=files) as response:
+            # นับเวลาจนได้ body ครบ (/transform ส่งไฟล์แบบ streaming)
+            async for _ in response.aiter_raw():
+                pass
+        return time.perf_counter() - started, response.status_code
+    except httpx.HTTPError:
+        return time.perf_counter() - started, None
+
+
+async def _probe_health(client: httpx.AsyncClient, interval: float, stop: asyncio.Event, latencies: list[float]) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get(HEALTH_PATH)
+            latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_endpoint(
+    server: Server,
+    name: str,
+    content: bytes,
+    total: int,
+    concurrency: int,
+    fields: dict[str, str],
+    timeout: float,
+    warmup: int = 0,
+) -> EndpointResult:
+    path = ENDPOINTS[name]
+    latencies: list[float] = []
+    health: list[float] = []
+    status_codes: dict[str, int] = {}
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for index in range(total):
+        queue.put_nowait(index)
+
+    limits = httpx.Limits(max_connections=concurrency + 1)
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=timeout, limits=limits) as client:
+        # รอบแรกของแต่ละ worker ต้องเปิด process pool และ import pandas ใน process ลูก ไม่นับรวมในผล
+        for index in range(warmup):
+            await _send(client, path, fields, content, f"warmup-{index}.xlsx")
+
+        async def worker() -> None:
+            while True:
+                try:
+                    index = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                seconds, code = await _send(client, path, fields, content, f"load-{index}.xlsx")
+                latencies.append(seconds)
+                key = str(code) if code is not None else "connection_error"
+                status_codes[key] = status_codes.get(key, 0) + 1
+
+        stop = asyncio.Event()
+        with _RssSampler(server.process.pid) as rss:
+            probe = asyncio.create_task(_probe_health(client, 0.1, stop, health))
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await probe
+
+    errors = sum(count for code, count in status_codes.items() if not code.isdigit() or int(code) >= 400)
+    return EndpointResult(
+        endpoint=name,
+        path=path,
+        requests=total,
+        concurrency=concurrency,
+        errors=errors,
+        error_rate=round(errors / total, 4) if total else 0.0,
+        seconds=round(elapsed, 3),
+        throughput_rps=round(total / elapsed, 3) if elapsed > 0 else 0.0,
+        latency_p50=_percentile(latencies, 50),
+        latency_p95=_percentile(latencies, 95),
+        latency_p99=_percentile(latencies, 99),
+        latency_max=round(max(latencies, default=0.0), 4),
+        health_p50=_percentile(health, 50),
+        health_p99=_percentile(health, 99),
+        rss_start_mb=rss.start_mb,
+        rss_peak_mb=rss.peak_mb,
+        status_codes=status_codes,
+    )
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description="HTTP load test against a local server")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"comma separated, from {','.join(ENDPOINTS)}")
+    parser.add_argument("--rows", type=int, default=1000, help="rows per generated workbook")
+    parser.add_argument("--requests", type=int, default=40, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured requests per endpoint before each run")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-request timeout in seconds")
+    parser.add_argument("--async-imports", action="store_true", help="send async_mode=true to the import endpoints")
+    parser.add_argument("--database-url", help="SQLAlchemy URL instead of a temporary SQLite file")
+    parser.add_argument(
+        "--env", action="append", default=[], metavar="NAME=VALUE", help="extra settings for the server, repeatable"
+    )
+    parser.add_argument("--output", type=Path, default=Path("load-results.json"))
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+    names = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in names if name not in ENDPOINTS]
+    if unknown:
+        print(f"Unknown endpoints: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    content = make_workbook(WorkbookSpec(rows=args.rows, seed=args.seed))
+
+    server = Server(args.workers, args.database_url, extra_env)
+    results: list[EndpointResult] = []
+    try:
+        server.wait_ready()
+        for name in names:
+            fields = {"async_mode": "true"} if args.async_imports and name in ASYNC_ENDPOINTS else {}
+            result = asyncio.run(
+                run_endpoint(server, name, content, args.requests, args.concurrency, fields, args.timeout, args.warmup)
+            )
+            results.append(result)
+            print(
+                f"{name:<17} p50 {result.latency_p50:>8.3f}s p95 {result.latency_p95:>8.3f}s "
+                f"p99 {result.latency_p99:>8.3f}s {result.throughput_rps:>7.2f} req/s "
+                f"errors {result.error_rate:>6.1%} health p99 {result.health_p99:>7.3f}s "
+                f"rss peak {result.rss_peak_mb:>8.1f} MB",
+                flush=True,
+            )
+    finally:
+        server.stop()
+
+    report = {
+        "generated_at": dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "config": {
+            "rows": args.rows,
+            "workbook_bytes": len(content),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "workers": args.workers,
+            "async_imports": args.async_imports,
+            "database": "custom" if args.database_url else "sqlite",
+            "env": sorted(extra_env),
+        },
+        "results": [asdict(result) for result in results],
+    }
+    args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import gc
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import Session
+
+from app.db.models import Base, SalesRecord
+from app.schemas import TransformOptions
+from app.services.excel_reader import READER_BACKENDS, read_excel_bytes
+from app.services.excel_writer import dataframe_to_excel_bytes, iter_xlsx_bytes
+from app.services.import_service import _upsert_sales_records, prepare_import_dataframe, validate_and_transform_rows
+from app.services.rules_engine import apply_business_rules
+from benchmarks.workbook import WorkbookSpec, make_workbook
+
+FILENAME = "benchmark.xlsx"
+
+
+@dataclass
+class StageResult:
+    size: str
+    rows: int
+    stage: str
+    repeat: int
+    seconds_min: float
+    seconds_median: float
+    rows_per_second: float
+    peak_memory_mb: float
+
+
+def _measure(
+    size: str,
+    rows: int,
+    stage: str,
+    func: Callable[[], Any],
+    repeat: int,
+    setup: Callable[[], Any] | None = None,
+) -> StageResult:
+    """จับเวลา repeat รอบ (ไม่เปิด tracemalloc เพราะทำให้ช้าลงหลายเท่า) แล้ววัด peak memory แยกอีกหนึ่งรอบ"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    if setup is not None:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best = min(timings)
+    return StageResult(
+        size=size,
+        rows=rows,
+        stage=stage,
+        repeat=repeat,
+        seconds_min=round(best, 6),
+        seconds_median=round(statistics.median(timings), 6),
+        rows_per_second=round(rows / best, 1) if best > 0 else 0.0,
+        peak_memory_mb=round(peak / 1024 / 1024, 2),
+    )
+
+
+class _SqliteStandIn:
+    """ฐานข้อมูล SQLite ชั่วคราวแทน SQL Server ใช้ทาง ON CONFLICT ของ _upsert_sales_records"""
+
+    def __init__(self) -> None:
+        self._dir = tempfile.TemporaryDirectory(prefix="bench-db-")
+        self.engine = create_engine(f"sqlite:///{Path(self._dir.name) / 'bench.db'}")
+        Base.metadata.create_all(self.engine)
+
+    def truncate(self) -> None:
+        with Session(self.engine) as db:
+            db.execute(delete(SalesRecord))
+            db.commit()
+
+    def upsert(self, rows: list[dict[str, Any]]) -> None:
+        # _upsert_sales_records เติม row_fingerprint ลงใน dict จึงส่งสำเนาไปทุกรอบ
+        with Session(self.engine) as db:
+            _upsert_sales_records(db, [dict(row) for row in rows])
+            db.commit()
+
+    def close(self) -> None:
+        self.engine.dispose()
+        self._dir.cleanup()
+
+
+def run_size(size: str, spec: WorkbookSpec, repeat: int) -> list[StageResult]:
+    content = make_workbook(spec)
+    rows = spec.rows
+    results = []
+    for engine, backend in READER_BACKENDS.items():
+        if ".xlsx" in backend.extensions and backend.available():
+            read = lambda: read_excel_bytes(content, FILENAME, None, engine)  # noqa: E731
+            results.append(_measure(size, rows, f"read_excel_bytes[{engine}]", read, repeat))
+    frame = read_excel_bytes(content, FILENAME)
+
+    transformed: dict[str, pd.DataFrame] = {}
+    for mode in ("keep", "group"):
+        options = TransformOptions(duplicate_mode=mode)
+        results.append(
+            _measure(size, rows, f"apply_business_rules[{mode}]", lambda: apply_business_rules(frame, options), repeat)
+        )
+        transformed[mode] = apply_business_rules(frame, options).dataframe
+
+    output = transformed["keep"]
+    results.append(
+        _measure(size, len(output), "dataframe_to_excel_bytes", lambda: dataframe_to_excel_bytes(output), repeat)
+    )
+    # writer แบบ streaming ที่ /transform ใช้จริง วัดคู่กันเพื่อเทียบ
+    results.append(
+        _measure(size, len(output), "iter_xlsx_bytes", lambda: b"".join(iter_xlsx_bytes(output)), repeat)
+    )
+    results.append(
+        _measure(size, len(output), "prepare_import_dataframe", lambda: prepare_import_dataframe(output), repeat)
+    )
+    prepared = prepare_import_dataframe(output)
+    results.append(
+        _measure(size, len(prepared), "validate_and_transform_rows", lambda: validate_and_transform_rows(prepared), repeat)
+    )
+    valid_rows, _ = validate_and_transform_rows(prepared)
+
+    database = _SqliteStandIn()
+    try:
+        results.append(
+            _measure(
+                size,
+                len(valid_rows),
+                "_upsert_sales_records[insert]",
+                lambda: database.upsert(valid_rows),
+                repeat,
+                setup=database.truncate,
+            )
+        )
+        # ตารางมีข้อมูลชุดเดิมอยู่แล้ว: วัดทาง fingerprint ที่ข้ามแถวที่ไม่เปลี่ยน
+        results.append(
+            _measure(size, len(valid_rows), "_upsert_sales_records[unchanged]", lambda: database.upsert(valid_rows), repeat)
+        )
+    finally:
+        database.close()
+    return results
+
+
+def environment() -> dict[str, str]:
+    import numpy
+    import openpyxl
+    import sqlalchemy
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "numpy": numpy.__version__,
+        "openpyxl": openpyxl.__version__,
+        "sqlalchemy": sqlalchemy.__version__,
+    }
+
+
+def as_records(results: list[StageResult]) -> list[dict[str, Any]]:
+    return [asdict(result) for result in results]
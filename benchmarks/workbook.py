@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import datetime as dt
+import random
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any
+
+from app.schemas import ColumnMapping
+from app.services.excel_writer import iter_xlsx_records
+from app.services.rules_engine import CANCEL_VALUE_DROP
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "500k": 500_000}
+BLOCK_ROWS = 5_000
+
+_MAPPING = ColumnMapping()
+# header ตามไฟล์จริง ชื่อตรงกับค่าเริ่มต้นของ ColumnMapping และ ALIASES ใน import_service
+HEADERS = [
+    "วันที่ใบกำกับ",
+    "เลขที่ใบกำกับ",
+    "ชื่อ-นามสกุล",
+    "เลขประจำตัวผู้เสียภาษี",
+    _MAPPING.product_value,
+    _MAPPING.tax,
+    _MAPPING.total_value,
+    _MAPPING.tank_no,
+    _MAPPING.item,
+    "(ยกเลิก)",
+    "ประเภทองค์กร สนญ.",
+    "ประเภทองค์กร สาขาที่",
+]
+FINANCE_SENT = "ส่งไฟแนนซ์"
+FINANCE_BROKER = "นายหน้าไฟแนนซ์"
+CASH_SALE = "ขายสด"
+OTHER_ITEM = "อื่นๆ"
+_NAMES = ["สมชาย ใจดี", "สมหญิง รักดี", "บริษัท ไทยยนต์ จำกัด", "John Smith", "วิชัย มั่นคง"]
+
+
+@dataclass(frozen=True)
+class WorkbookSpec:
+    """สัดส่วนของข้อมูลสังเคราะห์ (0-1) ratio ของรายการที่เหลือจาก sent/broker เป็นขายสดและอื่นๆ"""
+
+    rows: int
+    duplicate_tank_ratio: float = 0.3
+    finance_sent_ratio: float = 0.35
+    finance_broker_ratio: float = 0.25
+    cancelled_ratio: float = 0.03
+    invalid_ratio: float = 0.02
+    seed: int = 1
+
+
+def _tank_numbers(spec: WorkbookSpec, rng: random.Random) -> list[str | None]:
+    """แถวในกลุ่มเลขตัวถังซ้ำ = duplicate_tank_ratio ของทั้งหมด (กลุ่มละ 2-3 แถว) ที่เหลือไม่ซ้ำกัน"""
+    duplicate_rows = int(spec.rows * spec.duplicate_tank_ratio)
+    tanks: list[str | None] = []
+    serial = 0
+    while len(tanks) < duplicate_rows:
+        serial += 1
+        size = min(rng.choice((2, 2, 3)), duplicate_rows - len(tanks))
+        tanks.extend([f"MR0{serial:08d}"] * max(size, 1))
+    while len(tanks) < spec.rows:
+        serial += 1
+        tanks.append(f"MR0{serial:08d}")
+    rng.shuffle(tanks)
+    return tanks
+
+
+def _item(spec: WorkbookSpec, rng: random.Random) -> str:
+    roll = rng.random()
+    if roll < spec.finance_sent_ratio:
+        return FINANCE_SENT
+    if roll < spec.finance_sent_ratio + spec.finance_broker_ratio:
+        return FINANCE_BROKER
+    return CASH_SALE if rng.random() < 0.8 else OTHER_ITEM
+
+
+def _invalidate(row: list[Any], rng: random.Random) -> None:
+    """ทำให้แถวไม่ผ่าน validate ของ import หนึ่งแบบ (วันที่ผิด ยอดเงินผิด หรือไม่มีชื่อ)"""
+    choice = rng.randrange(3)
+    if choice == 0:
+        row[0] = "bad-date"
+    elif choice == 1:
+        row[6] = "x12"
+    else:
+        row[2] = None
+
+
+def iter_rows(spec: WorkbookSpec) -> Iterator[list[Any]]:
+    rng = random.Random(spec.seed)
+    tanks = _tank_numbers(spec, rng)
+    start = dt.date(2024, 1, 1)
+    for idx in range(spec.rows):
+        product_value = round(rng.uniform(1_000, 900_000), 2)
+        row = [
+            start + dt.timedelta(days=rng.randrange(365)),
+            f"INV{idx:07d}",
+            rng.choice(_NAMES),
+            "'0105%09d" % idx,
+            product_value,
+            round(product_value * 0.07, 2),
+            round(product_value * 1.07, 2),
+            tanks[idx],
+            _item(spec, rng),
+            CANCEL_VALUE_DROP if rng.random() < spec.cancelled_ratio else None,
+            "Y",
+            rng.choice((0, 1, 2, None)),
+        ]
+        if rng.random() < spec.invalid_ratio:
+            _invalidate(row, rng)
+        yield row
+
+
+def _blocks(spec: WorkbookSpec) -> Iterator[list[list[Any]]]:
+    block: list[list[Any]] = []
+    for row in iter_rows(spec):
+        block.append(row)
+        if len(block) >= BLOCK_ROWS:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def make_workbook(spec: WorkbookSpec) -> bytes:
+    """สร้าง .xlsx ทั้งไฟล์ในหน่วยความจำ (ใช้ writer แบบ streaming ของแอป จึงสร้าง 500k แถวได้ในเวลาไม่นาน)"""
+    return b"".join(iter_xlsx_records(HEADERS, _blocks(spec)))
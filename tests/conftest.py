@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.core.config import get_settings
+from app.db.models import Base
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    """ตั้งค่า Settings ผ่าน environment (เช่น configure(import_commit_rows=4)) แล้วล้าง cache ของ get_settings"""
+
+    def apply(**values):
+        for name, value in values.items():
+            monkeypatch.setenv(name.upper(), str(value))
+        get_settings.cache_clear()
+        return get_settings()
+
+    yield apply
+    get_settings.cache_clear()
+
+
+@pytest.fixture
+def db():
+    # connection เดียวร่วมกันทุก thread เพราะ route และ service เรียก session ผ่าน threadpool
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
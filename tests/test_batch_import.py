@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import io
+import zipfile
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db.session import get_db
+from app.main import app
+
+
+def _workbook(rows: list[tuple[str, str, str]]) -> bytes:
+    buffer = io.BytesIO()
+    frame = pd.DataFrame(rows, columns=["business_key", "name", "amount"]).assign(record_date="2024-01-15")
+    frame.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def _zip(members: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(db, configure, tmp_path):
+    configure(upload_spool_dir=tmp_path / "spool", max_batch_upload_size_mb=1)
+    app.dependency_overrides[get_db] = lambda: db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+def test_bad_zip_member_fails_only_its_job(client):
+    archive = _zip(
+        {
+            "a.xlsx": _workbook([("A1", "a", "1"), ("A2", "b", "2")]),
+            "broken.xlsx": b"not a workbook",
+            "b.xlsx": _workbook([("B1", "c", "3")]),
+        }
+    )
+    response = client.post("/api/imports/batch", files=[("files", ("sales.zip", archive, "application/zip"))])
+
+    assert response.status_code == 201
+    body = response.json()
+    results = {item["filename"]: item for item in body["results"]}
+    assert [item["filename"] for item in body["results"]] == ["a.xlsx", "broken.xlsx", "b.xlsx"]
+    assert results["broken.xlsx"]["status"] == "failed"
+    assert (results["a.xlsx"]["status"], results["a.xlsx"]["inserted_rows"]) == ("success", 2)
+    assert (results["b.xlsx"]["status"], results["b.xlsx"]["inserted_rows"]) == ("success", 1)
+    assert (body["total_rows"], body["imported_rows"]) == (3, 3)
+
+
+def test_oversized_zip_gets_the_batch_limit(client):
+    # เกิน MAX_BATCH_UPLOAD_SIZE_MB แต่ยังไม่เกินเผื่อ multipart ของ middleware จึงไปถึง spool_upload
+    archive = _zip({"a.xlsx": _workbook([("A1", "a", "1")]), "padding.bin": b"\0" * (1024 * 1024)})
+    archive += b"\0" * (1024 * 1024 + 1024 - len(archive))
+    response = client.post("/api/imports/batch", files=[("files", ("sales.zip", archive, "application/zip"))])
+
+    assert response.status_code == 413
+    assert response.json()["detail"] == "Batch is too large. Max size is 1 MB."
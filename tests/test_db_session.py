@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from sqlalchemy import create_engine, inspect
+
+from app.db.models import Base
+from app.db.session import add_missing_columns
+
+
+def test_add_missing_columns_upgrades_an_existing_table():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        # import_jobs ก่อนมีคอลัมน์ของ async job และ batch
+        conn.exec_driver_sql(
+            "CREATE TABLE import_jobs (id INTEGER PRIMARY KEY, correlation_id VARCHAR(64) NOT NULL, "
+            "filename VARCHAR(255) NOT NULL, status VARCHAR(20) NOT NULL, total_rows INTEGER, "
+            "imported_rows INTEGER, failed_rows INTEGER, created_at DATETIME, updated_at DATETIME)"
+        )
+    Base.metadata.create_all(engine)
+    add_missing_columns(engine, Base.metadata)
+    add_missing_columns(engine, Base.metadata)
+
+    inspector = inspect(engine)
+    columns = {column["name"] for column in inspector.get_columns("import_jobs")}
+    assert columns == set(Base.metadata.tables["import_jobs"].columns.keys())
+    indexes = {tuple(index["column_names"]) for index in inspector.get_indexes("import_jobs")}
+    assert ("parent_job_id",) in indexes
+    foreign_keys = inspector.get_foreign_keys("import_jobs")
+    assert [(fk["constrained_columns"], fk["referred_table"]) for fk in foreign_keys] == [
+        (["parent_job_id"], "import_jobs")
+    ]
+    engine.dispose()
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from datetime import date, datetime
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from app.services.excel_reader import READER_BACKENDS, SOURCE_COLUMNS_ATTR, read_excel_bytes
+from app.services.import_service import import_column_positions
+
+HEADER = [
+    "วันที่ใบกำกับ",
+    "เลขที่ใบกำกับ",
+    "ชื่อ-นามสกุล",
+    "รายการ",
+    "มูลค่าสินค้า",
+    "ภาษี",
+    "มูลค่ารวม",
+    "เลขตัวถัง",
+    "รายการ",
+]
+ROWS = [
+    [datetime(2024, 1, 15), "INV-001", "สมชาย ใจดี", "ส่งไฟแนนซ์", 1000, 70.0, 1070.5, "MR0001", "x"],
+    [date(2024, 2, 29), "00123", None, "นายหน้าไฟแนนซ์", 2500.25, None, 2675.27, "MR0002", None],
+    [None, None, None, None, None, None, None, None, None],
+    ["15/03/2567", 12345, "  มีช่องว่าง  ", True, 0, -1.5, 3, None, ""],
+    [45000, "INV-004", "ข้อมูลท้าย", "รายการ", 1e9, 0.1, 123456789012, "MR0004", None],
+]
+
+
+def _workbook(rows: list[list]) -> bytes:
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER)
+    for row in rows:
+        sheet.append(row)
+    second = workbook.create_sheet("สาขา 2")
+    second.append(["a", "b"])
+    second.append([1, date(2024, 5, 1)])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def _xlsx_backends() -> list:
+    params = []
+    for name, backend in READER_BACKENDS.items():
+        if ".xlsx" not in backend.extensions or name == "openpyxl":
+            continue
+        marks = [] if backend.available() else [pytest.mark.skip(reason=f"{name} is not installed")]
+        params.append(pytest.param(name, marks=marks))
+    return params
+
+
+@pytest.mark.parametrize("engine", _xlsx_backends())
+@pytest.mark.parametrize("select_columns", [None, import_column_positions], ids=["all-columns", "import-columns"])
+@pytest.mark.parametrize("sheet", [0, "สาขา 2"])
+def test_backends_match_openpyxl(engine, select_columns, sheet):
+    content = _workbook(ROWS)
+    expected = read_excel_bytes(content, "sales.xlsx", select_columns, engine="openpyxl", sheet=sheet)
+    actual = read_excel_bytes(content, "sales.xlsx", select_columns, engine=engine, sheet=sheet)
+
+    pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+    assert actual.attrs.get(SOURCE_COLUMNS_ATTR) == expected.attrs.get(SOURCE_COLUMNS_ATTR)
+
+
+def test_reference_frame_keeps_dates_ints_and_blanks():
+    # กันไม่ให้ทุก backend เปลี่ยนไปพร้อมกันจน parity ยังผ่าน: header ซ้ำได้ .1, วันที่เป็น Timestamp, blank เป็น NaN
+    frame = read_excel_bytes(_workbook(ROWS), "sales.xlsx", engine="openpyxl")
+
+    assert list(frame.columns) == [*HEADER[:-1], "รายการ.1"]
+    assert len(frame) == len(ROWS)
+    assert frame["วันที่ใบกำกับ"].iloc[0] == pd.Timestamp(2024, 1, 15)
+    assert frame["เลขที่ใบกำกับ"].iloc[1] == "00123"
+    assert frame["เลขที่ใบกำกับ"].iloc[3] == 12345
+    assert frame.iloc[2].isna().all()
+    assert pd.isna(frame["ชื่อ-นามสกุล"].iloc[1])
+    assert frame["มูลค่ารวม"].iloc[4] == 123456789012
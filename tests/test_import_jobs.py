@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.services import import_jobs
+from app.services.import_jobs import ImportQueueFullError, enqueue_import, shutdown_import_workers
+
+
+@pytest.fixture
+def workers(db, configure, tmp_path, monkeypatch):
+    """worker เดียว คิวหนึ่งช่อง ใช้ฐานข้อมูลเดียวกับ db และเก็บไฟล์ใน tmp_path"""
+    configure(import_worker_count=1, import_queue_limit=1, upload_storage_dir=tmp_path / "uploads")
+    monkeypatch.setattr(import_jobs, "get_session_factory", lambda: sessionmaker(bind=db.get_bind()))
+    yield tmp_path
+    shutdown_import_workers()
+
+
+def _spool(directory, name: str, content: bytes):
+    path = directory / name
+    path.write_bytes(content)
+    return path
+
+
+def test_failed_job_releases_its_queue_slot(db, workers, monkeypatch):
+    # ให้ job แรกค้างไว้จนตรวจว่าคิวเต็มแล้ว
+    release = threading.Event()
+    process_job = import_jobs._process_job
+
+    def held_process_job(session, job):
+        release.wait(timeout=10)
+        process_job(session, job)
+
+    monkeypatch.setattr(import_jobs, "_process_job", held_process_job)
+    job = enqueue_import(db, _spool(workers, "broken.xlsx", b"not a workbook"), "broken.xlsx", "test", kind="upload")
+    with pytest.raises(ImportQueueFullError):
+        enqueue_import(db, _spool(workers, "other.xlsx", b"x"), "other.xlsx", "test", kind="upload")
+    release.set()
+    shutdown_import_workers()
+
+    db.refresh(job)
+    assert job.status == "failed"
+    # job ที่ล้มเก็บไฟล์ไว้ให้ resume
+    assert job.upload_path is not None
+    assert import_jobs._pending == 0
+    assert not import_jobs._active_jobs
+
+    again = enqueue_import(db, _spool(workers, "again.xlsx", b"not a workbook"), "again.xlsx", "test", kind="upload")
+    shutdown_import_workers()
+    db.refresh(again)
+    assert again.status == "failed"
+    assert import_jobs._pending == 0
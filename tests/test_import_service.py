@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from decimal import Decimal
+
+import pandas as pd
+from sqlalchemy import select
+
+from app.db.models import SalesRecord
+from app.services.import_service import import_dataframe_to_db
+
+
+def _frame(rows: list[tuple[str, str, str]]) -> pd.DataFrame:
+    return pd.DataFrame(
+        [
+            {"business_key": key, "name": name, "amount": amount, "record_date": "2024-01-15"}
+            for key, name, amount in rows
+        ]
+    )
+
+
+# commit ทีละ 4 แถว: K1 อยู่ช่วงแรกและช่วงที่สอง, K2 คร่อมรอยต่อแถว 3/4, K3 ซ้ำในช่วงเดียวกัน
+ROWS = [
+    ("K1", "first", "100"),
+    ("K4", "d", "4"),
+    ("K3", "c", "3"),
+    ("K2", "before", "200"),
+    ("K2", "after", "201"),
+    ("K1", "last", "101"),
+    ("K3", "c", "3.00"),
+    ("K5", "e", "5"),
+    ("K6", "", "6"),
+    ("K1", "final", "102"),
+]
+
+
+def test_repeated_keys_across_commit_chunks_are_written_once(db, configure):
+    configure(import_commit_rows=4)
+    frame = _frame(ROWS)
+
+    first = import_dataframe_to_db(db, frame, "sales.xlsx", "test")
+    assert (first.inserted_rows, first.updated_rows, first.unchanged_rows) == (5, 0, 0)
+    assert first.duplicate_rows == 4
+    assert (first.total_rows, first.imported_rows, first.failed_rows) == (10, 9, 1)
+
+    stored = dict(db.execute(select(SalesRecord.business_key, SalesRecord.name)).all())
+    assert stored == {"K1": "final", "K2": "after", "K3": "c", "K4": "d", "K5": "e"}
+
+    again = import_dataframe_to_db(db, frame, "sales.xlsx", "test")
+    assert (again.inserted_rows, again.updated_rows, again.unchanged_rows) == (0, 0, 5)
+    assert again.duplicate_rows == 4
+    assert again.imported_rows == first.imported_rows
+
+
+def test_counts_do_not_depend_on_commit_size(db, configure):
+    frame = _frame(ROWS)
+    configure(import_commit_rows=10000)
+    whole = import_dataframe_to_db(db, frame, "sales.xlsx", "test")
+    configure(import_commit_rows=3)
+    frame.loc[5, "amount"] = "150"
+    chunked = import_dataframe_to_db(db, frame, "sales.xlsx", "test")
+
+    # K1 เปลี่ยนเฉพาะแถวที่ถูกแถวหลังทับ ค่าที่เขียนจริง (แถวหลังสุด) ไม่เปลี่ยน
+    assert (chunked.inserted_rows, chunked.updated_rows, chunked.unchanged_rows) == (0, 0, 5)
+    assert (chunked.imported_rows, chunked.duplicate_rows) == (whole.imported_rows, whole.duplicate_rows)
+    amount = db.execute(select(SalesRecord.amount).where(SalesRecord.business_key == "K1")).scalar_one()
+    assert amount == Decimal("102")
+
+
+def test_reimport_skips_unchanged_rows_and_updates_edited_ones(db):
+    frame = _frame([("K1", "a", "1"), ("K2", "b", "2.50"), ("K3", "c", "3")])
+    first = import_dataframe_to_db(db, frame, "sales.xlsx", "test")
+    assert (first.inserted_rows, first.updated_rows, first.unchanged_rows) == (3, 0, 0)
+
+    again = import_dataframe_to_db(db, frame, "sales.xlsx", "test")
+    assert (again.inserted_rows, again.updated_rows, again.unchanged_rows) == (0, 0, 3)
+
+    frame.loc[1, "amount"] = "2.75"
+    edited = import_dataframe_to_db(db, frame, "sales.xlsx", "test")
+    assert (edited.inserted_rows, edited.updated_rows, edited.unchanged_rows) == (0, 1, 2)
+    amount = db.execute(select(SalesRecord.amount).where(SalesRecord.business_key == "K2")).scalar_one()
+    assert amount == Decimal("2.75")
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import datetime as dt
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from app.services.value_parsers import parse_dates, parse_fixed_point
+
+
+def _dates(values: list) -> list[dt.date | None]:
+    return parse_dates(pd.Series(values, dtype=object)).to_dates()
+
+
+def test_fixed_point_rounds_half_up_to_satang():
+    column = parse_fixed_point(pd.Series(["1.005", "-1.005", "1,234.565", "0.004", "abc", "1e30"]))
+    assert column.to_decimals() == [
+        Decimal("1.01"),
+        Decimal("-1.01"),
+        Decimal("1234.57"),
+        Decimal("0.00"),
+        None,
+        None,
+    ]
+
+
+def test_buddhist_era_and_excel_serials():
+    values = ["15/01/2567", "2567-01-15", 45306, 45306.0, pd.Timestamp("2567-01-15"), dt.date(2567, 1, 15)]
+    assert _dates(values) == [dt.date(2024, 1, 15)] * len(values)
+    assert parse_dates(pd.Series(["2567-01-15"]), buddhist_era=False).to_dates() == [dt.date(2567, 1, 15)]
+
+
+@pytest.mark.filterwarnings("ignore:Parsing dates:UserWarning")
+@pytest.mark.parametrize(
+    "values",
+    [
+        ["05/02/2024", "13/01/2024", "2024-03-04"],
+        ["02-05-2024 10:00", "13-01-2024 09:00", "04/03/2024"],
+    ],
+)
+def test_dates_do_not_depend_on_row_order(values):
+    # ค่าที่อ่านได้ทั้งสองแบบต้องได้วันเดียวกับ pd.to_datetime ทีละค่า ไม่ว่าค่าแรกจะเป็นแบบไหน
+    expected = {value: pd.to_datetime(value).date() for value in values}
+    for ordered in (values, values[::-1], values[1:] + values[:1]):
+        assert _dates(ordered) == [expected[value] for value in ordered]